@@ -1,6 +1,5 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, Response, request, jsonify, make_response
 from flask_cors import CORS
-import ccxt
 import pandas as pd
 import numpy as np
 
@@ -10,42 +9,45 @@ if not hasattr(np, 'float_'):
 if not hasattr(np, 'int_'):
     np.int_ = np.int64
 
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, ExtraTreesRegressor
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import GridSearchCV, KFold
-from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
+# Dipendenze pesanti (sklearn, ccxt, textblob, requests, joblib) importate al primo
+# utilizzo nelle funzioni del relativo sottosistema: l'import di App resta veloce
 from datetime import datetime
-from textblob import TextBlob
-import requests
 import re
 import time
 import os
-import joblib
+import sys
 import multiprocessing
 import warnings
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
 import json
-import multiprocessing
-
-if __name__ == '__main__':
-    try:
-        multiprocessing.set_start_method('fork')
-        print("Using 'fork' method for multiprocessing")
-    except RuntimeError:
-        print("Multiprocessing method already set or not supported")
+import threading
+import hashlib
+import zlib
+import gc
+import copy
+import functools
+import abc
+import itertools
+import pickle
+import queue
+import socket
+import ipaddress
+import uuid
+import atexit
+from multiprocessing.managers import BaseManager
 
 # Ottimizzazioni per M2
 NUM_CORES = multiprocessing.cpu_count()
-print(f"System has {NUM_CORES} CPU cores, optimizing for parallelism")
 
 warnings.filterwarnings('ignore')
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend communication
+# Le route sono registrate sull'app creata da create_app()
+api = Blueprint('api', __name__)
 
 # Configuration from environment variables
 API_KEY = os.getenv('BINANCE_API_KEY')
@@ -61,23 +63,565 @@ DEFAULT_TAKE_PROFIT = float(os.getenv('DEFAULT_TAKE_PROFIT', 0.05))
 DEFAULT_FORECAST_DAYS = int(os.getenv('DEFAULT_FORECAST_DAYS', 14))
 DEFAULT_NEWS_LIMIT = int(os.getenv('DEFAULT_NEWS_LIMIT', 140))
 
-# Cartella per la cache dei modelli
-os.makedirs('model_cache', exist_ok=True)
+# Exchange: 'binance' oppure 'replay' (candele registrate o sintetiche, per i test di carico)
+EXCHANGE_ADAPTER = os.getenv('EXCHANGE_ADAPTER', 'binance')
+REPLAY_DATA_DIR = os.getenv('REPLAY_DATA_DIR', 'replay_data')
+REPLAY_LATENCY = float(os.getenv('REPLAY_LATENCY', 0.05))  # Secondi per richiesta simulata
+REPLAY_RATE_LIMIT = float(os.getenv('REPLAY_RATE_LIMIT', 20))  # Richieste al secondo (0 = nessun limite)
+REPLAY_SYMBOLS = int(os.getenv('REPLAY_SYMBOLS', 200))  # Mercati sintetici se non ci sono registrazioni
+
+# Più exchange insieme (es. 'binance,okx,kraken'): ogni simbolo viene servito dalla venue migliore
+EXCHANGES = [venue.strip() for venue in os.getenv('EXCHANGES', EXCHANGE_ADAPTER).split(',') if venue.strip()]
+EXCHANGE_POOL_SIZE = int(os.getenv('EXCHANGE_POOL_SIZE', 16))  # Connessioni HTTP per venue
+ROUTING_STRATEGY = os.getenv('ROUTING_STRATEGY', 'liquidity')  # 'liquidity' o 'latency'
+ROUTING_REFRESH = int(os.getenv('ROUTING_REFRESH', 300))  # Secondi tra gli aggiornamenti della liquidità
+ROUTING_MAX_QUEUE = float(os.getenv('ROUTING_MAX_QUEUE', 2.0))  # Coda del rate limit oltre cui si cambia venue
+
+# Warmup del processo prima di accettare traffico (modalità produzione)
+PRELOAD_TOP_ASSETS = int(os.getenv('PRELOAD_TOP_ASSETS', DEFAULT_TOP_ASSETS))  # Modelli caricati in memoria
+PRELOAD_CANDLE_ASSETS = int(os.getenv('PRELOAD_CANDLE_ASSETS', 20))  # Simboli con candele precaricate
+CANDLE_STORE_MAX_AGE = int(os.getenv('CANDLE_STORE_MAX_AGE', 60))  # Secondi massimi di validità delle candele
+CANDLE_STORE_MAX_ENTRIES = int(os.getenv('CANDLE_STORE_MAX_ENTRIES', 1024))  # Voci (simbolo, timeframe, limit) in memoria (LRU)
+
+# Ottimizzatore di portafoglio per /api/trading-analysis
+DEFAULT_ALLOCATION_METHOD = os.getenv('DEFAULT_ALLOCATION_METHOD', 'heuristic')  # 'heuristic', 'mean_variance', 'risk_parity', 'max_sharpe'
+DEFAULT_MAX_ASSET_WEIGHT = float(os.getenv('DEFAULT_MAX_ASSET_WEIGHT', 0.4))
+DEFAULT_RISK_AVERSION = float(os.getenv('DEFAULT_RISK_AVERSION', 3.0))
+COVARIANCE_SHRINKAGE = float(os.getenv('COVARIANCE_SHRINKAGE', 0.1))
+
+# Profili di rischio per utente (/api/risk/evaluate)
+RISK_HISTORY_LIMIT = int(os.getenv('RISK_HISTORY_LIMIT', 365))  # Candele per la simulazione storica
+RISK_VAR_CONFIDENCE = float(os.getenv('RISK_VAR_CONFIDENCE', 0.95))
+RISK_HORIZON_DAYS = int(os.getenv('RISK_HORIZON_DAYS', 1))  # Orizzonte di VaR/CVaR in candele
+RISK_MAX_USERS = int(os.getenv('RISK_MAX_USERS', 500))  # Profili massimi per richiesta
+RISK_MAX_HISTORY = int(os.getenv('RISK_MAX_HISTORY', 2000))  # Candele massime richiedibili con 'history'
+
+# Simulatore di trade
+DEFAULT_TRADING_FEE = float(os.getenv('DEFAULT_TRADING_FEE', 0.001))  # Commissione per lato (0.1%)
+DEFAULT_SLIPPAGE = float(os.getenv('DEFAULT_SLIPPAGE', 0.0005))
+DEFAULT_MAX_HOLDING = int(os.getenv('DEFAULT_MAX_HOLDING', 48))  # Candele massime per trade
+DEFAULT_RISK_REWARD_RATIO = 2.0
+DEFAULT_ATR_MULTIPLIER = 2.0
+SIMULATION_MAX_COMBINATIONS = int(os.getenv('SIMULATION_MAX_COMBINATIONS', 500))  # Combinazioni massime della griglia
+SIMULATION_MAX_LIMIT = int(os.getenv('SIMULATION_MAX_LIMIT', 2000))  # Candele massime per simbolo
+SIMULATION_MAX_HOLDING = int(os.getenv('SIMULATION_MAX_HOLDING', 500))
+SIMULATION_MAX_CELLS = int(os.getenv('SIMULATION_MAX_CELLS', 20_000_000))  # combinazioni x candele x max_holding per simbolo
+
+# Sweep dei parametri decisionali
+SWEEP_CACHE_DIR = os.getenv('SWEEP_CACHE_DIR', 'sweep_cache')  # Previsioni walk-forward per (simbolo, periodo)
+SWEEP_RESULTS_DIR = os.getenv('SWEEP_RESULTS_DIR', 'sweep_results')
+SWEEP_MAX_WORKERS = int(os.getenv('SWEEP_MAX_WORKERS', max(1, NUM_CORES // 2)))
+SWEEP_FORECAST_FOLDS = int(os.getenv('SWEEP_FORECAST_FOLDS', 5))
+
+# Archivio dei risultati: previsioni di scanner e trading analysis con il loro esito
+RESULTS_WAREHOUSE_DIR = os.getenv('RESULTS_WAREHOUSE_DIR', 'results_warehouse')
+RESULTS_FLUSH_SIZE = int(os.getenv('RESULTS_FLUSH_SIZE', 200))  # Previsioni in memoria prima della scrittura
+RESULTS_FLUSH_INTERVAL = int(os.getenv('RESULTS_FLUSH_INTERVAL', 60))  # Secondi massimi tra due scritture
+RESULTS_COMPACT_PARTS = int(os.getenv('RESULTS_COMPACT_PARTS', 20))  # File parziali prima della compattazione
+RESULTS_NEUTRAL_BAND = float(os.getenv('RESULTS_NEUTRAL_BAND', 0.001))  # Variazioni realizzate sotto la soglia: esito neutro
+RESULTS_MAX_CANDLES = int(os.getenv('RESULTS_MAX_CANDLES', 1000))  # Storico massimo per risolvere gli esiti
+BOT1_FORECAST_HORIZON = int(os.getenv('BOT1_FORECAST_HORIZON', 5))  # Candele dopo cui si misura l'esito dello scanner
+
+# Scansione distribuita: broker (scan_cluster.py broker) e worker su uno o più nodi
+SCAN_MODE = os.getenv('SCAN_MODE', 'local')  # 'local' o 'cluster'
+SCAN_CLUSTER_ADDRESS = os.getenv('SCAN_CLUSTER_ADDRESS', '127.0.0.1:50000')
+SCAN_CLUSTER_AUTHKEY = os.getenv('SCAN_CLUSTER_AUTHKEY')  # Obbligatoria se il broker non è in loopback
+SCAN_SHARD_SIZE = int(os.getenv('SCAN_SHARD_SIZE', 10))  # Simboli per shard
+SCAN_SHARD_TIMEOUT = int(os.getenv('SCAN_SHARD_TIMEOUT', 300))  # Secondi prima di riassegnare uno shard (limitato dal budget della richiesta)
+SCAN_SHARD_RETRIES = int(os.getenv('SCAN_SHARD_RETRIES', 2))
+
+# Budget di tempo delle richieste lunghe (scanner, backtest), 0 = nessun limite
+REQUEST_TIME_BUDGET = float(os.getenv('REQUEST_TIME_BUDGET', 180))
+
+# Cache delle risposte degli endpoint POST
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')  # 'memory', 'disk' o 'none'
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+RESPONSE_CACHE_MAX_AGE = int(os.getenv('RESPONSE_CACHE_MAX_AGE', 3600))  # Limite anche per timeframe lunghi
+RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', 'response_cache')
+
+# Budget di memoria per processo (MB, 0 = nessun limite)
+MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', 0))
+LOADED_MODELS_MAX = int(os.getenv('LOADED_MODELS_MAX', 256))  # Modelli deserializzati tenuti in memoria (LRU)
+
+# Configurazione cross-validation
+CV_SPLITTER = os.getenv('CV_SPLITTER', 'timeseries')  # 'timeseries' o 'purged'
+CV_PURGE = int(os.getenv('CV_PURGE', 1))  # Righe rimosse prima del fold di test (target a 1 passo)
+CV_EMBARGO = int(os.getenv('CV_EMBARGO', 1))  # Righe rimosse dopo il fold di test (solo 'purged')
+CV_N_JOBS = int(os.getenv('CV_N_JOBS', min(NUM_CORES, 5)))
+CV_CACHE_SIZE = int(os.getenv('CV_CACHE_SIZE', 256))
+
+# Configurazione ottimizzazione iperparametri (job notturno)
+TUNING_MAX_WORKERS = int(os.getenv('TUNING_MAX_WORKERS', max(1, NUM_CORES // 2)))  # Limite CPU
+TUNING_TIME_BUDGET = int(os.getenv('TUNING_TIME_BUDGET', 4 * 3600))  # Limite wall-clock in secondi
+TUNING_NICE = int(os.getenv('TUNING_NICE', 10))  # Priorità ridotta per non rallentare lo scanner
+TUNING_CV_FOLDS = int(os.getenv('TUNING_CV_FOLDS', 4))
+TUNING_MIN_ESTIMATORS = int(os.getenv('TUNING_MIN_ESTIMATORS', 25))
+TUNING_MAX_ESTIMATORS = int(os.getenv('TUNING_MAX_ESTIMATORS', 225))
+
+# Diagnostica dei modelli (calcolata offline, una volta per versione del modello)
+DIAGNOSTICS_HOLDOUT = float(os.getenv('DIAGNOSTICS_HOLDOUT', 0.2))  # Quota finale dei dati per la permutation importance
+DIAGNOSTICS_REPEATS = int(os.getenv('DIAGNOSTICS_REPEATS', 5))  # Permutazioni per feature
+
+# Artefatti impacchettati dei modelli (un file mappabile in memoria per famiglia)
+MODEL_PACK_FAMILIES = [t.strip() for t in os.getenv('MODEL_PACK_FAMILIES', 'bot1,bot2,bot2_horizon').split(',') if t.strip()]
+
+# Selezione automatica delle feature (job offline, risultato nei metadati del modello)
+FEATURE_SELECTION_CORRELATION = float(os.getenv('FEATURE_SELECTION_CORRELATION', 0.9))  # |corr| oltre cui le feature formano un cluster
+FEATURE_SELECTION_COVERAGE = float(os.getenv('FEATURE_SELECTION_COVERAGE', 0.95))  # Quota di importanza cumulata da mantenere
+FEATURE_SELECTION_TOLERANCE = float(os.getenv('FEATURE_SELECTION_TOLERANCE', 0.02))  # Peggioramento massimo dell'RMSE in CV
+FEATURE_SELECTION_MIN_FEATURES = int(os.getenv('FEATURE_SELECTION_MIN_FEATURES', 5))
+FEATURE_SELECTION_DEFAULT_KEY = 'default'  # Selezione condivisa per i simboli senza una propria
+
+# Motore di previsione Bot 2: 'horizon' (multi-step diretto con quantili) o 'legacy'
+FORECAST_ENGINE = os.getenv('FORECAST_ENGINE', 'horizon')
+HORIZON_QUANTILES = (0.1, 0.5, 0.9)
+HORIZON_MODEL_MAX_AGE = float(os.getenv('HORIZON_MODEL_MAX_AGE', 24))  # Ore prima di riaddestrare i modelli multi-step (0 = mai)
+
+# Kernel degli indicatori a finestra e ricorsivi: 'pandas', 'numpy' (SciPy lfilter e
+# finestre scorrevoli) o 'numba' (compilati, con ripiego su 'numpy' se Numba manca)
+INDICATOR_BACKEND = os.getenv('INDICATOR_BACKEND', 'pandas')
+
+# Modalità modello: 'per_symbol' (un modello per simbolo) o 'global' (un modello per tutti gli asset)
+MODEL_MODE = os.getenv('MODEL_MODE', 'per_symbol')
+GLOBAL_MODEL_MAX_ITER = int(os.getenv('GLOBAL_MODEL_MAX_ITER', 300))
+GLOBAL_MODEL_INCREMENT = int(os.getenv('GLOBAL_MODEL_INCREMENT', 50))  # Alberi aggiunti ad ogni riaddestramento incrementale
+GLOBAL_MODEL_ITER_CAP = int(os.getenv('GLOBAL_MODEL_ITER_CAP', 2 * GLOBAL_MODEL_MAX_ITER))  # Oltre questa soglia si riaddestra da zero
+GLOBAL_ZSCORE_WINDOW = int(os.getenv('GLOBAL_ZSCORE_WINDOW', 200))  # Candele precedenti per lo z-score delle feature
+GLOBAL_ZSCORE_MIN_PERIODS = int(os.getenv('GLOBAL_ZSCORE_MIN_PERIODS', 30))
+GLOBAL_SYMBOL_BUCKETS = 255  # Limite di categorie di HistGradientBoostingRegressor
+
+# Feature utilizzate dai modelli
+BOT1_FEATURES = [
+    'RSI', 'MACD', 'MACD_hist', 'Signal_Line', 'ATR', 'Volatility', 'NATR',
+    'MOM', 'ROC', 'ADX', 'PLUS_DI', 'MINUS_DI', 'OBV',
+    'BB_upper', 'BB_lower', 'Price_to_EMA50', 'EMA_ratio'
+]
+BOT2_FEATURES = [
+    'RSI', 'MACD', 'MACD_hist', 'Signal_Line', 'ATR', 'Volatility', 'NATR',
+    'MOM', 'ROC', 'ADX', 'PLUS_DI', 'MINUS_DI', 'OBV', 'EMA_9', 'EMA_21',
+    'EMA_50', 'EMA_200', 'Bollinger_Upper', 'Bollinger_Lower', 'Bollinger_Middle',
+    'BB_Width', 'RSI_change', 'Price_to_EMA50', 'EMA_ratio', 'Trend_Change',
+    'Stochastic_K', 'Stochastic_D', 'CMF'
+]
+# Colonne usate fuori dai modelli (filtri di qualità, regole di decisione, stop ATR, pesi)
+BOT1_BASE_COLUMNS = ['RSI', 'MACD', 'Signal_Line', 'ADX', 'ATR', 'NATR']
+BOT2_BASE_COLUMNS = ['RSI', 'MACD', 'Signal_Line', 'ADX', 'ATR', 'EMA_9', 'EMA_21']
+# Tutte le colonne calcolate quando non viene indicato un insieme di feature
+BOT1_INDICATOR_COLUMNS = [
+    'RSI', 'MACD', 'Signal_Line', 'MACD_hist', 'ATR', 'Volatility', 'NATR', 'MOM', 'ROC',
+    'ADX', 'PLUS_DI', 'MINUS_DI', 'EMA_9', 'EMA_21', 'EMA_50', 'EMA_200', 'OBV',
+    'BB_upper', 'BB_lower', 'BB_middle', 'Trend_Change', 'RSI_change', 'Price_to_EMA50', 'EMA_ratio'
+]
+BOT2_INDICATOR_COLUMNS = [
+    'RSI', 'MACD', 'Signal_Line', 'MACD_hist', 'ATR', 'Volatility', 'NATR', 'MOM', 'ROC',
+    'ADX', 'PLUS_DI', 'MINUS_DI', 'EMA_9', 'EMA_21', 'EMA_50', 'EMA_200', 'OBV',
+    'Bollinger_Upper', 'Bollinger_Lower', 'Bollinger_Middle', 'BB_Width', 'Trend_Change',
+    'RSI_change', 'Price_to_EMA50', 'EMA_ratio', 'Stochastic_K', 'Stochastic_D', 'CMF'
+]
+
+# Adapter exchange: interfaccia comune per Binance (ccxt) e per il replay locale
+class RateLimiter:
+    """Limite di richieste al secondo condiviso tra thread: chi eccede attende il proprio turno."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pending(self):
+        """Attesa (secondi) che avrebbe ora una nuova richiesta."""
+        with self._lock:
+            return max(0.0, self._next_slot - time.monotonic())
+
+class ExchangeAdapter(abc.ABC):
+    """
+    Interfaccia usata dal backend per i dati di mercato. Le implementazioni
+    restituiscono le stesse strutture di ccxt (mercati, OHLCV, ticker).
+    """
+    name = 'base'
+    rate_limiter = None
+
+    @abc.abstractmethod
+    def load_markets(self):
+        """Mercati disponibili, nel formato di ccxt load_markets()."""
+
+    @abc.abstractmethod
+    def fetch_ohlcv(self, symbol, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT):
+        """Ultime `limit` candele come liste [timestamp, open, high, low, close, volume]."""
+
+    def fetch_ohlcv_with_venue(self, symbol, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT):
+        """Come fetch_ohlcv, restituendo anche la venue che ha servito i dati."""
+        return self.name, self.fetch_ohlcv(symbol, timeframe, limit=limit)
+
+    @abc.abstractmethod
+    def fetch_tickers(self, symbols=None):
+        """Ticker per simbolo, nel formato di ccxt fetch_tickers()."""
+
+    def queue_delay(self):
+        return self.rate_limiter.pending() if self.rate_limiter is not None else 0.0
+
+    def stats(self):
+        return {'name': self.name, 'queue_delay': self.queue_delay()}
+
+    def stream_ohlcv(self, symbol, timeframe=DEFAULT_TIMEFRAME, poll_interval=None, token=None):
+        """
+        Stream di kline: restituisce ogni candela nuova o aggiornata come lista
+        [timestamp, open, high, low, close, volume]. Si ferma quando il token viene annullato.
+        """
+        poll_interval = poll_interval or min(timeframe_to_seconds(timeframe), 10)
+        last = None
+        while token is None or not token.cancelled:
+            for candle in self.fetch_ohlcv(symbol, timeframe, limit=2):
+                if last is None or candle[0] > last[0] or (candle[0] == last[0] and candle != last):
+                    last = list(candle)
+                    yield last
+            time.sleep(poll_interval)
+
+class CcxtAdapter(ExchangeAdapter):
+    """
+    Exchange ccxt (binance, kraken, okx, ...) con pool di connessioni e rate
+    limit propri: il throttle è gestito qui, in modo thread-safe, invece che da ccxt.
+    """
+    def __init__(self, exchange_id='binance', api_key=None, secret=None, pool_size=None):
+        import ccxt
+        from requests.adapters import HTTPAdapter
+        self.name = exchange_id
+        self.client = getattr(ccxt, exchange_id)({
+            'apiKey': api_key,
+            'secret': secret,
+            'enableRateLimit': False
+        })
+        pool_size = pool_size or EXCHANGE_POOL_SIZE
+        self.client.session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        self.rate_limiter = RateLimiter(1000.0 / self.client.rateLimit if self.client.rateLimit else 0)
+
+    def load_markets(self):
+        self.rate_limiter.acquire()
+        return self.client.load_markets()
+
+    def fetch_ohlcv(self, symbol, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT):
+        self.rate_limiter.acquire()
+        return self.client.fetch_ohlcv(symbol, timeframe, limit=limit)
+
+    def fetch_tickers(self, symbols=None):
+        self.rate_limiter.acquire()
+        return self.client.fetch_tickers(symbols)
+
+class ReplayAdapter(ExchangeAdapter):
+    """
+    Exchange locale per test di carico deterministici: serve le candele
+    registrate in `data_dir` (CSV per simbolo e timeframe) oppure candele
+    sintetiche riproducibili, con latenza e limite di richieste configurabili.
+    """
+    name = 'replay'
+
+    def __init__(self, data_dir=None, latency=0.0, rate_limit=0.0, synthetic_symbols=200, quote=DEFAULT_MARKET_SYMBOL,
+                 name='replay'):
+        self.name = name
+        self.data_dir = data_dir
+        self.latency = latency
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.synthetic_symbols = synthetic_symbols
+        self.quote = quote
+        self._recorded = {}
+        self._stats = {'requests': 0, 'throttled_seconds': 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _request(self):
+        """Simula il costo di una chiamata remota: coda del rate limit e latenza di rete."""
+        waited = self.rate_limiter.acquire()
+        if self.latency:
+            time.sleep(self.latency)
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._stats['throttled_seconds'] += waited
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, name=self.name, queue_delay=self.queue_delay())
+
+    def _recorded_path(self, symbol, timeframe):
+        return os.path.join(self.data_dir, f"{symbol.replace('/', '_')}_{timeframe}.csv")
+
+    def _recorded_symbols(self):
+        if not self.data_dir or not os.path.isdir(self.data_dir):
+            return []
+        symbols = set()
+        for name in os.listdir(self.data_dir):
+            match = re.match(r'^([A-Z0-9]+)_([A-Z0-9]+)_\w+\.csv$', name)
+            if match:
+                symbols.add(f"{match.group(1)}/{match.group(2)}")
+        return sorted(symbols)
+
+    def load_markets(self):
+        self._request()
+        symbols = self._recorded_symbols() or [f"SYN{i:04d}/{self.quote}" for i in range(self.synthetic_symbols)]
+        return {
+            symbol: {'symbol': symbol, 'base': symbol.split('/')[0], 'quote': symbol.split('/')[1], 'active': True}
+            for symbol in symbols
+        }
+
+    def _synthetic_ohlcv(self, symbol, timeframe, limit):
+        # Stesso simbolo e stessa candela corrente -> stessi dati (test ripetibili)
+        step = timeframe_to_seconds(timeframe) * 1000
+        last_open = int(time.time() * 1000) // step * step
+        seed = int.from_bytes(hashlib.blake2b(f"{symbol}|{timeframe}|{last_open}".encode(), digest_size=8).digest(), 'little')
+        rng = np.random.default_rng(seed)
+        base_price = 1 + (seed % 10000) / 100
+        close = base_price * np.exp(np.cumsum(rng.normal(0, 0.01, limit)))
+        open_ = np.r_[close[0], close[:-1]]
+        high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.005, limit))
+        low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.005, limit))
+        volume = rng.uniform(100, 10000, limit)
+        timestamps = last_open - step * np.arange(limit - 1, -1, -1, dtype=np.int64)
+        return [list(row) for row in zip(timestamps.tolist(), open_, high, low, close, volume)]
+
+    def fetch_ohlcv(self, symbol, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT):
+        self._request()
+        if self.data_dir and os.path.exists(self._recorded_path(symbol, timeframe)):
+            key = (symbol, timeframe)
+            if key not in self._recorded:
+                self._recorded[key] = pd.read_csv(self._recorded_path(symbol, timeframe))[OHLCV_COLUMNS].values.tolist()
+            return [list(row) for row in self._recorded[key][-limit:]]
+        return self._synthetic_ohlcv(symbol, timeframe, limit)
+
+    def fetch_tickers(self, symbols=None):
+        self._request()
+        symbols = symbols or list(self.load_markets())
+        tickers = {}
+        for symbol in symbols:
+            candle = self._synthetic_ohlcv(symbol, '1h', 1)[-1] if not self.data_dir else self.fetch_ohlcv(symbol, '1h', 1)[-1]
+            tickers[symbol] = {
+                'symbol': symbol,
+                'timestamp': candle[0],
+                'last': candle[4],
+                'bid': candle[4] * 0.9995,
+                'ask': candle[4] * 1.0005,
+                'quoteVolume': candle[4] * candle[5]
+            }
+        return tickers
+
+class ExchangeRouter(ExchangeAdapter):
+    """
+    Più exchange configurati insieme. I mercati vengono uniti e ogni simbolo
+    viene scaricato dalla venue con più liquidità (volume in quote) o con
+    latenza minore; le venue con la coda del rate limit oltre `max_queue`
+    secondi passano in fondo, così il carico si distribuisce sui vari budget.
+    In caso di errore si prova la venue successiva.
+    """
+    name = 'router'
+
+    def __init__(self, venues, strategy=None, refresh=None, max_queue=None):
+        self.venues = {venue.name: venue for venue in venues}
+        self.strategy = strategy or ROUTING_STRATEGY
+        self.refresh = refresh if refresh is not None else ROUTING_REFRESH
+        self.max_queue = max_queue if max_queue is not None else ROUTING_MAX_QUEUE
+        self._listing = {}  # simbolo -> venue che lo quotano
+        self._liquidity = {}  # (venue, simbolo) -> volume in quote
+        self._liquidity_at = 0.0
+        self._latency = {}  # venue -> media esponenziale dei tempi di risposta
+        self._routed = {name: 0 for name in self.venues}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
 
-exchange = ccxt.binance({
-    'apiKey': API_KEY,
-    'secret': API_SECRET,
-    'enableRateLimit': True
-})
+    def _each_venue(self, call):
+        """Esegue `call(venue)` su tutte le venue in parallelo, ignorando quelle in errore."""
+        def safe_call(venue):
+            try:
+                return venue.name, call(venue)
+            except Exception as e:
+                print(f"Exchange {venue.name} unavailable: {e}")
+                return venue.name, None
+        with ThreadPoolExecutor(max_workers=len(self.venues)) as executor:
+            return [(name, result) for name, result in executor.map(safe_call, self.venues.values()) if result is not None]
+
+    def load_markets(self):
+        merged = {}
+        listing = {}
+        for name, markets in self._each_venue(lambda venue: venue.load_markets()):
+            for symbol, details in markets.items():
+                listing.setdefault(symbol, []).append(name)
+                merged.setdefault(symbol, dict(details))
+        for symbol, details in merged.items():
+            details['venues'] = listing[symbol]
+        with self._lock:
+            self._listing = listing
+        return merged
+
+    def refresh_liquidity(self, force=False):
+        with self._refresh_lock:
+            if not force and time.time() - self._liquidity_at < self.refresh:
+                return
+            liquidity = {}
+            for name, tickers in self._each_venue(lambda venue: venue.fetch_tickers()):
+                for symbol, ticker in tickers.items():
+                    liquidity[(name, symbol)] = ticker.get('quoteVolume') or 0.0
+            with self._lock:
+                self._liquidity = liquidity
+                self._liquidity_at = time.time()
+
+    def _record_latency(self, name, elapsed):
+        with self._lock:
+            previous = self._latency.get(name)
+            self._latency[name] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+            self._routed[name] += 1
+
+    def rank_venues(self, symbol):
+        if not self._listing:
+            self.load_markets()
+        candidates = self._listing.get(symbol) or list(self.venues)
+        if self.strategy == 'liquidity':
+            self.refresh_liquidity()
+            ranked = sorted(candidates, key=lambda name: -self._liquidity.get((name, symbol), 0.0))
+        else:
+            # Le venue mai misurate vengono provate per prime
+            ranked = sorted(candidates, key=lambda name: self._latency.get(name) or 0.0)
+        return sorted(ranked, key=lambda name: self.venues[name].queue_delay() > self.max_queue)
+
+    def fetch_ohlcv_with_venue(self, symbol, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT):
+        last_error = None
+        for name in self.rank_venues(symbol):
+            start = time.monotonic()
+            try:
+                ohlcv = self.venues[name].fetch_ohlcv(symbol, timeframe, limit=limit)
+            except Exception as e:
+                print(f"Fetch of {symbol} from {name} failed: {e}")
+                last_error = e
+                continue
+            self._record_latency(name, time.monotonic() - start)
+            if ohlcv:
+                return name, ohlcv
+        if last_error is not None:
+            raise last_error
+        return None, []
+
+    def fetch_ohlcv(self, symbol, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT):
+        return self.fetch_ohlcv_with_venue(symbol, timeframe, limit)[1]
+
+    def fetch_tickers(self, symbols=None):
+        """Per ogni simbolo il ticker della venue più liquida (campo 'venue')."""
+        best = {}
+        for name, tickers in self._each_venue(lambda venue: venue.fetch_tickers(symbols)):
+            for symbol, ticker in tickers.items():
+                if symbol not in best or (ticker.get('quoteVolume') or 0) > (best[symbol].get('quoteVolume') or 0):
+                    best[symbol] = dict(ticker, venue=name)
+        return best
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'strategy': self.strategy,
+                'symbols': len(self._listing),
+                'venues': {
+                    name: {
+                        'symbols': sum(1 for venues in self._listing.values() if name in venues),
+                        'latency': self._latency.get(name),
+                        'routed_requests': self._routed[name],
+                        'queue_delay': venue.queue_delay()
+                    }
+                    for name, venue in self.venues.items()
+                }
+            }
+
+def create_exchange_adapter(venue):
+    """Adapter per una venue di EXCHANGES: 'replay*' oppure un id ccxt (credenziali <ID>_API_KEY/SECRET)."""
+    if venue.startswith('replay'):
+        return ReplayAdapter(REPLAY_DATA_DIR, REPLAY_LATENCY, REPLAY_RATE_LIMIT, REPLAY_SYMBOLS, name=venue)
+    return CcxtAdapter(venue, os.getenv(f'{venue.upper()}_API_KEY'), os.getenv(f'{venue.upper()}_API_SECRET'))
+
+def record_replay_data(symbols, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT, data_dir=None):
+    """Registra le candele dell'exchange attivo in CSV leggibili da ReplayAdapter."""
+    data_dir = data_dir or REPLAY_DATA_DIR
+    os.makedirs(data_dir, exist_ok=True)
+    recorded = 0
+    for symbol in symbols:
+        ohlcv = get_exchange().fetch_ohlcv(symbol, timeframe, limit=limit)
+        if ohlcv:
+            path = os.path.join(data_dir, f"{symbol.replace('/', '_')}_{timeframe}.csv")
+            pd.DataFrame(ohlcv, columns=OHLCV_COLUMNS).to_csv(path, index=False)
+            recorded += 1
+    return recorded
+
+# Adapter exchange creato al primo utilizzo (uno per processo)
+_exchange = None
+_exchange_lock = threading.Lock()
+
+def get_exchange():
+    global _exchange
+    with _exchange_lock:
+        if _exchange is None:
+            venues = [create_exchange_adapter(venue) for venue in EXCHANGES]
+            _exchange = venues[0] if len(venues) == 1 else ExchangeRouter(venues)
+        return _exchange
+
+# Candle store: ultime candele scaricate per (simbolo, timeframe, limit), LRU limitato
+_candle_store = OrderedDict()
+_candle_store_lock = threading.Lock()
+
+TIMEFRAME_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'M': 2592000, 'y': 31536000}
+
+def timeframe_to_seconds(timeframe):
+    """
+    Durata di un timeframe ccxt ('1h', '15m', '1d', ...) in secondi.
+    ValueError se il formato, l'unità o il numero (intero > 0) non sono validi.
+    """
+    if not isinstance(timeframe, str) or len(timeframe) < 2 or timeframe[-1] not in TIMEFRAME_UNITS:
+        raise ValueError(f"Timeframe non valido: {timeframe}")
+    count = timeframe[:-1]
+    if not count.isdigit() or int(count) <= 0:
+        raise ValueError(f"Timeframe non valido: {timeframe}")
+    return int(count) * TIMEFRAME_UNITS[timeframe[-1]]
+
+def get_candle_expiry(data, timeframe):
+    """Le candele restano valide fino alla chiusura della candela corrente (max CANDLE_STORE_MAX_AGE)."""
+    now = time.time()
+    try:
+        candle_close = (data['timestamp'].iloc[-1] / 1000) + timeframe_to_seconds(timeframe)
+    except Exception:
+        candle_close = now
+    return min(max(candle_close, now), now + CANDLE_STORE_MAX_AGE)
+
+def store_candles(key, data, timeframe):
+    """
+    Inserisce le candele nello store: le voci scadute vengono eliminate e,
+    oltre CANDLE_STORE_MAX_ENTRIES, le meno usate di recente (il limit è
+    scelto dal client, quindi le chiavi non sono limitate a priori).
+    """
+    now = time.time()
+    with _candle_store_lock:
+        for stale in [k for k, (expires_at, _) in _candle_store.items() if expires_at <= now]:
+            del _candle_store[stale]
+        _candle_store[key] = (get_candle_expiry(data, timeframe), data)
+        _candle_store.move_to_end(key)
+        while len(_candle_store) > CANDLE_STORE_MAX_ENTRIES:
+            _candle_store.popitem(last=False)
+
+def clear_candle_store():
+    with _candle_store_lock:
+        _candle_store.clear()
 
 # Common Functions
 def fetch_market_assets(market_symbol=DEFAULT_MARKET_SYMBOL):
+    # Più valute di quotazione separate da virgola (es. 'USDT,USDC')
+    quotes = [quote.strip() for quote in market_symbol.split(',')]
     try:
-        markets = exchange.load_markets()
+        markets = get_exchange().load_markets()
         pairs = [
             symbol for symbol, details in markets.items()
-            if market_symbol in symbol and '/' in symbol 
-            and details.get('quote') == market_symbol  
+            if '/' in symbol
+            and details.get('quote') in quotes
             and details.get('active', True)
         ]
         return pairs
@@ -86,14 +630,27 @@ def fetch_market_assets(market_symbol=DEFAULT_MARKET_SYMBOL):
         return []
 
 def fetch_market_data(symbol, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT):
+    key = (symbol, timeframe, limit)
+    with _candle_store_lock:
+        cached = _candle_store.get(key)
+        if cached:
+            _candle_store.move_to_end(key)
+    if cached and cached[0] > time.time():
+        # I chiamanti aggiungono colonne: restituiamo sempre una copia
+        return cached[1].copy()
+
     try:
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+        venue, ohlcv = get_exchange().fetch_ohlcv_with_venue(symbol, timeframe, limit=limit)
         if not ohlcv:
             return None
         
+        # Timestamp mantenuti come epoch in millisecondi (int64), una candela per timestamp
         data = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        data['timestamp'] = pd.to_datetime(data['timestamp'], unit='ms')
-        return data
+        data['timestamp'] = data['timestamp'].astype(np.int64)
+        data = data.drop_duplicates('timestamp', keep='last').sort_values('timestamp', ignore_index=True)
+        data.attrs['venue'] = venue
+        store_candles(key, data, timeframe)
+        return data.copy()
     except Exception as e:
         print(f"Error fetching data for {symbol}: {e}")
         return None
@@ -122,22 +679,26 @@ def calculate_volatility(data, period=14):
     log_returns = np.log(data['close'] / data['close'].shift(1))
     return log_returns.rolling(window=period).std()
 
-def calculate_adx(data, period=14):
-    df = data.copy()
-    df['TR'] = np.maximum(df['high'] - df['low'], 
-                          np.maximum(abs(df['high'] - df['close'].shift(1)), 
-                                     abs(df['low'] - df['close'].shift(1))))
-    df['DM+'] = np.where((df['high'] - df['high'].shift(1)) > (df['low'].shift(1) - df['low']), 
-                         df['high'] - df['high'].shift(1), 0)
-    df['DM-'] = np.where((df['low'].shift(1) - df['low']) > (df['high'] - df['high'].shift(1)), 
-                         df['low'].shift(1) - df['low'], 0)
-    tr_rolling = df['TR'].rolling(window=period).sum()
-    dm_plus_rolling = df['DM+'].rolling(window=period).sum()
-    dm_minus_rolling = df['DM-'].rolling(window=period).sum()
-    di_plus = 100 * (dm_plus_rolling / tr_rolling)
-    di_minus = 100 * (dm_minus_rolling / tr_rolling)
+def calculate_directional_indicators(data, period=14):
+    """
+    Calcola ADX, DI+ e DI- in un solo passaggio lavorando su Series
+    temporanee, senza copiare il DataFrame.
+    """
+    prev_close = data['close'].shift(1)
+    up_move = data['high'] - data['high'].shift(1)
+    down_move = data['low'].shift(1) - data['low']
+    tr = np.maximum(data['high'] - data['low'],
+                    np.maximum(abs(data['high'] - prev_close), abs(data['low'] - prev_close)))
+    dm_plus = pd.Series(np.where(up_move > down_move, up_move, 0), index=data.index)
+    dm_minus = pd.Series(np.where(down_move > up_move, down_move, 0), index=data.index)
+    tr_rolling = tr.rolling(window=period).sum()
+    di_plus = 100 * (dm_plus.rolling(window=period).sum() / tr_rolling)
+    di_minus = 100 * (dm_minus.rolling(window=period).sum() / tr_rolling)
     dx = 100 * abs(di_plus - di_minus) / (di_plus + di_minus)
-    return dx.rolling(window=period).mean()
+    return dx.rolling(window=period).mean(), di_plus, di_minus
+
+def calculate_adx(data, period=14):
+    return calculate_directional_indicators(data, period)[0]
 
 def calculate_bollinger_bands(data, window=20):
     sma = data['close'].rolling(window).mean()
@@ -146,9 +707,432 @@ def calculate_bollinger_bands(data, window=20):
     lower_band = sma - (2 * std)
     return upper_band, lower_band
 
-def backtest_model(symbol, lookback_days=30, prediction_days=5):
+# Kernel degli indicatori: EWM con adjust=True, finestre scorrevoli e OBV.
+# Lavorano sull'ultimo asse, quindi accettano anche matrici (simboli x candele).
+INDICATOR_BACKENDS = ('pandas', 'numpy', 'numba')
+_indicator_backend = {'name': None, 'kernels': None}  # Configurato al primo calcolo (Numba è pesante da importare)
+_indicator_backend_lock = threading.Lock()
+
+def _rolling_output(values, window, reduced):
+    out = np.full(values.shape, np.nan)
+    out[..., window - 1:] = reduced
+    return out
+
+def _numpy_ewm_mean(values, span):
+    from scipy.signal import lfilter
+    decay = 1 - 2 / (span + 1)
+    # Media pesata adjust=True: numeratore ricorsivo, denominatore in forma chiusa
+    numerator = lfilter([1.0], [1.0, -decay], values, axis=-1)
+    denominator = (1 - decay ** np.arange(1, values.shape[-1] + 1)) / (1 - decay)
+    return numerator / denominator
+
+def _numpy_rolling(values, window, how):
+    if values.shape[-1] < window:
+        return np.full(values.shape, np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=-1)
+    if how == 'std':
+        return _rolling_output(values, window, windows.std(axis=-1, ddof=1))
+    return _rolling_output(values, window, getattr(windows, how)(axis=-1))
+
+def _numpy_obv(close_diff, volume):
+    return np.cumsum(np.nan_to_num(np.sign(close_diff) * volume), axis=-1)
+
+def _build_numba_kernels():
+    """Compila i kernel Numba (una volta per processo, con cache su disco)."""
+    import numba
+
+    @numba.njit(cache=True)
+    def ewm_mean(values, span):
+        decay = 1 - 2 / (span + 1)
+        out = np.empty_like(values)
+        for row in range(values.shape[0]):
+            numerator = 0.0
+            denominator = 0.0
+            for i in range(values.shape[1]):
+                numerator = values[row, i] + decay * numerator
+                denominator = 1.0 + decay * denominator
+                out[row, i] = numerator / denominator
+        return out
+
+    @numba.njit(cache=True)
+    def rolling(values, window, how):
+        # how: 0 somma, 1 media, 2 deviazione standard, 3 minimo, 4 massimo
+        out = np.full(values.shape, np.nan)
+        for row in range(values.shape[0]):
+            for i in range(window - 1, values.shape[1]):
+                total = 0.0
+                low = np.inf
+                high = -np.inf
+                for j in range(i - window + 1, i + 1):
+                    x = values[row, j]
+                    total += x
+                    low = min(low, x)
+                    high = max(high, x)
+                if how == 0:
+                    out[row, i] = total
+                elif how == 1:
+                    out[row, i] = total / window
+                elif how == 2:
+                    mean = total / window
+                    squares = 0.0
+                    for j in range(i - window + 1, i + 1):
+                        squares += (values[row, j] - mean) ** 2
+                    out[row, i] = np.sqrt(squares / (window - 1))
+                elif how == 3:
+                    out[row, i] = low if not np.isnan(total) else np.nan
+                else:
+                    out[row, i] = high if not np.isnan(total) else np.nan
+        return out
+
+    @numba.njit(cache=True)
+    def obv(close_diff, volume):
+        out = np.empty_like(close_diff)
+        for row in range(close_diff.shape[0]):
+            total = 0.0
+            for i in range(close_diff.shape[1]):
+                step = np.sign(close_diff[row, i]) * volume[row, i]
+                if not np.isnan(step):
+                    total += step
+                out[row, i] = total
+        return out
+
+    codes = {'sum': 0, 'mean': 1, 'std': 2, 'min': 3, 'max': 4}
+
+    # I kernel compilati lavorano su matrici: una serie singola diventa una riga
+    def ewm_wrapper(values, span):
+        result = ewm_mean(np.atleast_2d(values), span)
+        return result[0] if values.ndim == 1 else result
+
+    def rolling_wrapper(values, window, how):
+        result = rolling(np.atleast_2d(values), window, codes[how])
+        return result[0] if values.ndim == 1 else result
+
+    def obv_wrapper(close_diff, volume):
+        result = obv(np.atleast_2d(close_diff), np.atleast_2d(volume))
+        return result[0] if close_diff.ndim == 1 else result
+
+    return {'ewm_mean': ewm_wrapper, 'rolling': rolling_wrapper, 'obv': obv_wrapper}
+
+def get_indicator_kernels(name=None):
+    """Kernel del backend indicato (o di quello attivo); None per il backend pandas."""
+    name = name or _indicator_backend['name']
+    if name == 'pandas':
+        return None
+    if name == 'numba':
+        with _indicator_backend_lock:
+            if _indicator_backend.get('numba') is None:
+                _indicator_backend['numba'] = _build_numba_kernels()
+            return _indicator_backend['numba']
+    return {'ewm_mean': _numpy_ewm_mean, 'rolling': _numpy_rolling, 'obv': _numpy_obv}
+
+def set_indicator_backend(name):
+    """Seleziona a runtime il backend dei kernel; senza Numba si ripiega su 'numpy'."""
+    if name not in INDICATOR_BACKENDS:
+        raise ValueError(f"Backend indicatori non supportato: {name}")
+    try:
+        kernels = get_indicator_kernels(name)
+    except ImportError:
+        print("Numba non disponibile, uso il backend numpy per gli indicatori")
+        name, kernels = 'numpy', get_indicator_kernels('numpy')
+    with _indicator_backend_lock:
+        _indicator_backend.update({'name': name, 'kernels': kernels})
+    return name
+
+def _ewm(series, span):
+    kernels = _indicator_backend['kernels']
+    values = series.to_numpy(dtype=np.float64)
+    # I kernel non gestiscono i NaN come pandas (ignore_na): in quel caso resta pandas
+    if kernels is None or np.isnan(values).any():
+        return series.ewm(span=span).mean()
+    return pd.Series(kernels['ewm_mean'](values, span), index=series.index)
+
+def _rolling(series, window, how):
+    kernels = _indicator_backend['kernels']
+    if kernels is None:
+        return getattr(series.rolling(window=window), how)()
+    return pd.Series(kernels['rolling'](series.to_numpy(dtype=np.float64), window, how), index=series.index)
+
+def _obv(v):
+    kernels = _indicator_backend['kernels']
+    if kernels is None:
+        return (np.sign(v['close_diff']) * v['volume']).fillna(0).cumsum()
+    return pd.Series(kernels['obv'](v['close_diff'].to_numpy(dtype=np.float64), v['volume'].to_numpy(dtype=np.float64)),
+                     index=v['close_diff'].index)
+
+# Grafo degli indicatori: nodo -> (input, lookback, funzione sui valori già calcolati).
+# Il lookback è il numero di righe NaN aggiunte dal nodo rispetto ai suoi input
+# (None se il nodo non produce NaN, es. cumulate con fillna o confronti booleani).
+# I nodi in minuscolo sono intermedi condivisi e non diventano colonne.
+def _true_range(v):
+    prev_close = v['close'].shift(1)
+    return np.maximum(v['high'] - v['low'], np.maximum(abs(v['high'] - prev_close), abs(v['low'] - prev_close)))
+
+def _directional_movement(v, sign):
+    up_move = v['high'] - v['high'].shift(1)
+    down_move = v['low'].shift(1) - v['low']
+    move, other = (up_move, down_move) if sign > 0 else (down_move, up_move)
+    return pd.Series(np.where(move > other, move, 0), index=v['close'].index)
+
+def _safe_ratio(ratio, denominator, fill):
+    """Valore fisso sulle candele degeneri (denominatore nullo) invece di NaN; il warmup resta NaN."""
+    return ratio.mask(denominator == 0, fill)
+
+def _rsi(v):
+    gain = _rolling(v['close_diff'].clip(lower=0), 14, 'mean')
+    loss = _rolling((-v['close_diff'].clip(upper=0)), 14, 'mean')
+    # Prezzo fermo per 14 candele: RSI neutro
+    return _safe_ratio(100 - (100 / (1 + gain / loss)), gain + loss, 50.0)
+
+def _stochastic_k(v):
+    price_range = v['high_14'] - v['low_14']
+    return _safe_ratio(100 * ((v['close'] - v['low_14']) / price_range), price_range, 50.0)
+
+def _cmf(v):
+    candle_range = v['high'] - v['low']
+    # Candela senza escursione: nessuna pressione di acquisto o vendita
+    multiplier = _safe_ratio(((v['close'] - v['low']) - (v['high'] - v['close'])) / candle_range, candle_range, 0.0)
+    volume_sum = _rolling(v['volume'], 20, 'sum')
+    return _safe_ratio(_rolling(multiplier * v['volume'], 20, 'sum') / volume_sum, volume_sum, 0.0)
+
+def _adx(v):
+    di_sum = v['PLUS_DI'] + v['MINUS_DI']
+    dx = _safe_ratio(100 * abs(v['PLUS_DI'] - v['MINUS_DI']) / di_sum, di_sum, 0.0)
+    return _rolling(dx, 14, 'mean')
+
+def _trend_change(v):
+    close, ema, prev_close, prev_ema = v['close'], v['EMA_50'], v['close'].shift(1), v['EMA_50'].shift(1)
+    return ((close > ema) & (prev_close <= prev_ema)).astype(int) - ((close < ema) & (prev_close >= prev_ema)).astype(int)
+
+INDICATOR_GRAPH = {
+    # Intermedi condivisi
+    'close_diff': (['close'], 1, lambda v: v['close'].diff()),
+    'log_return': (['close'], 1, lambda v: np.log(v['close'] / v['close'].shift(1))),
+    'true_range': (['close', 'high', 'low'], 1, _true_range),
+    'tr_sum': (['true_range'], 13, lambda v: _rolling(v['true_range'], 14, 'sum')),
+    'dm_plus': (['high', 'low'], 0, lambda v: _directional_movement(v, 1)),
+    'dm_minus': (['high', 'low'], 0, lambda v: _directional_movement(v, -1)),
+    'dm_plus_sum': (['dm_plus'], 13, lambda v: _rolling(v['dm_plus'], 14, 'sum')),
+    'dm_minus_sum': (['dm_minus'], 13, lambda v: _rolling(v['dm_minus'], 14, 'sum')),
+    'ema_12': (['close'], 0, lambda v: _ewm(v['close'], 12)),
+    'ema_26': (['close'], 0, lambda v: _ewm(v['close'], 26)),
+    'sma_20': (['close'], 19, lambda v: _rolling(v['close'], 20, 'mean')),
+    'std_20': (['close'], 19, lambda v: _rolling(v['close'], 20, 'std')),
+    'low_14': (['low'], 13, lambda v: _rolling(v['low'], 14, 'min')),
+    'high_14': (['high'], 13, lambda v: _rolling(v['high'], 14, 'max')),
+    # Oscillatori e momentum
+    'RSI': (['close_diff'], 13, _rsi),
+    'RSI_change': (['RSI'], 1, lambda v: v['RSI'] - v['RSI'].shift(1)),
+    'MACD': (['ema_12', 'ema_26'], 0, lambda v: v['ema_12'] - v['ema_26']),
+    'Signal_Line': (['MACD'], 0, lambda v: _ewm(v['MACD'], 9)),
+    'MACD_hist': (['MACD', 'Signal_Line'], 0, lambda v: v['MACD'] - v['Signal_Line']),
+    'MOM': (['close'], 10, lambda v: v['close'].diff(10)),
+    'ROC': (['close'], 10, lambda v: v['close'].pct_change(10) * 100),
+    'Stochastic_K': (['close', 'low_14', 'high_14'], 0, _stochastic_k),
+    'Stochastic_D': (['Stochastic_K'], 2, lambda v: _rolling(v['Stochastic_K'], 3, 'mean')),
+    # Volatilità
+    'ATR': (['true_range'], 13, lambda v: _rolling(v['true_range'], 14, 'mean')),
+    'NATR': (['ATR', 'close'], 0, lambda v: v['ATR'] / v['close'] * 100),
+    'Volatility': (['log_return'], 13, lambda v: _rolling(v['log_return'], 14, 'std')),
+    # Trend
+    'PLUS_DI': (['dm_plus_sum', 'tr_sum'], 0, lambda v: _safe_ratio(100 * (v['dm_plus_sum'] / v['tr_sum']), v['tr_sum'], 0.0)),
+    'MINUS_DI': (['dm_minus_sum', 'tr_sum'], 0, lambda v: _safe_ratio(100 * (v['dm_minus_sum'] / v['tr_sum']), v['tr_sum'], 0.0)),
+    'ADX': (['PLUS_DI', 'MINUS_DI'], 13, _adx),
+    'EMA_9': (['close'], 0, lambda v: _ewm(v['close'], 9)),
+    'EMA_21': (['close'], 0, lambda v: _ewm(v['close'], 21)),
+    'EMA_50': (['close'], 0, lambda v: _ewm(v['close'], 50)),
+    'EMA_200': (['close'], 0, lambda v: _ewm(v['close'], 200)),
+    'Trend_Change': (['close', 'EMA_50'], None, _trend_change),
+    'Price_to_EMA50': (['close', 'EMA_50'], 0, lambda v: v['close'] / v['EMA_50']),
+    'EMA_ratio': (['EMA_9', 'EMA_21'], 0, lambda v: v['EMA_9'] / v['EMA_21']),
+    # Volume
+    'OBV': (['close_diff', 'volume'], None, _obv),
+    'CMF': (['close', 'high', 'low', 'volume'], 19, _cmf),
+    # Bande di Bollinger (nomi di Bot 1 e di Bot 2)
+    'BB_middle': (['sma_20'], 0, lambda v: v['sma_20']),
+    'BB_upper': (['sma_20', 'std_20'], 0, lambda v: v['sma_20'] + 2 * v['std_20']),
+    'BB_lower': (['sma_20', 'std_20'], 0, lambda v: v['sma_20'] - 2 * v['std_20']),
+    'Bollinger_Middle': (['sma_20'], 0, lambda v: v['sma_20']),
+    'Bollinger_Upper': (['BB_upper'], 0, lambda v: v['BB_upper']),
+    'Bollinger_Lower': (['BB_lower'], 0, lambda v: v['BB_lower']),
+    'BB_Width': (['BB_upper', 'BB_lower', 'close'], 0, lambda v: (v['BB_upper'] - v['BB_lower']) / v['close']),
+}
+
+@functools.lru_cache(maxsize=128)
+def _plan_indicators(columns):
+    order, warmup = [], {c: 0 for c in OHLCV_COLUMNS}
+
+    def visit(node):
+        if node in warmup:
+            return warmup[node]
+        if node not in INDICATOR_GRAPH:
+            raise KeyError(f"Indicatore sconosciuto: {node}")
+        inputs, lookback, _ = INDICATOR_GRAPH[node]
+        inherited = max(visit(i) for i in inputs)
+        warmup[node] = 0 if lookback is None else inherited + lookback
+        order.append(node)
+        return warmup[node]
+
+    for column in columns:
+        visit(column)
+    return tuple(order), max((warmup[c] for c in columns), default=0)
+
+def plan_indicators(columns):
+    """
+    Piano di calcolo per le colonne richieste: nodi necessari in ordine
+    topologico (intermedi condivisi calcolati una volta) e storico minimo,
+    cioè le candele iniziali perse nel dropna.
+    """
+    order, warmup = _plan_indicators(tuple(columns))
+    return {'nodes': list(order), 'warmup': warmup, 'min_history': warmup + 1}
+
+def compute_indicators(data, columns):
+    """Calcola solo i nodi del grafo necessari e aggiunge a `data` le colonne richieste."""
+    if _indicator_backend['name'] is None:
+        set_indicator_backend(INDICATOR_BACKEND)
+    values = {c: data[c] for c in OHLCV_COLUMNS if c in data.columns}
+    for node in plan_indicators(columns)['nodes']:
+        values[node] = INDICATOR_GRAPH[node][2](values)
+    for column in columns:
+        data[column] = values[column]
+    return data
+
+def fill_source_gaps(data):
+    """
+    Riempie con il valore precedente i buchi isolati delle candele di origine,
+    prima del calcolo degli indicatori: gli indicatori vengono poi calcolati
+    sulle candele riempite invece di restare fermi per tutta la finestra.
+    """
+    sources = [c for c in OHLCV_COLUMNS[1:] if c in data.columns]
+    if data[sources].isna().to_numpy().any():
+        data[sources] = data[sources].ffill()
+    return data
+
+def trim_warmup(data, columns):
+    """
+    Sostituisce il dropna: scarta solo il warmup iniziale (offset dal piano,
+    spostato in avanti se i dati di origine hanno buchi all'inizio non
+    riempibili) e restituisce la regione contigua come slice. I buchi isolati
+    vanno riempiti prima degli indicatori con fill_source_gaps.
+    """
+    start = plan_indicators(columns)['warmup']
+    missing_source = data[OHLCV_COLUMNS[1:]].isna().to_numpy().any(axis=1)
+    if missing_source.all():
+        return data.iloc[len(data):]
+    # Il warmup parte dalla prima candela completa
+    start += int(missing_source.argmin())
+    valid = ~data[list(columns)].isna().to_numpy().any(axis=1)
+    if not valid[start:].all():
+        start = start + int(valid[start:].argmax()) if valid[start:].any() else len(data)
+    return data.iloc[start:]
+
+# Rappresentazione compatta dei dati di mercato
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+_memory_stats = {}
+_memory_stats_lock = threading.Lock()
+
+def compact_market_data(data):
+    """
+    Converte le colonne derivate (indicatori) in float32; OHLCV e timestamp
+    restano a piena precisione. I modelli ad albero lavorano comunque in float32.
+    """
+    feature_columns = [c for c in data.columns if c not in OHLCV_COLUMNS and data[c].dtype == np.float64]
+    if not feature_columns:
+        return data
+    return data.astype({c: np.float32 for c in feature_columns})
+
+def get_process_rss():
+    """Memoria residente del processo in byte (0 se non disponibile)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            # ru_maxrss è in KB su Linux e in byte su macOS (valore di picco)
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if sys.platform == 'darwin' else rss * 1024
+        except Exception:
+            return 0
+
+def record_symbol_memory(symbol, data):
+    """Registra i byte occupati dai dati di un simbolo e applica il budget di memoria."""
+    with _memory_stats_lock:
+        _memory_stats[symbol] = int(data.memory_usage(index=True, deep=True).sum())
+    enforce_memory_budget()
+
+def enforce_memory_budget():
+    """
+    Se il processo supera MEMORY_BUDGET_MB libera le cache in memoria: CV,
+    candele, modelli deserializzati e risposte (solo il backend in memoria).
+    """
+    if MEMORY_BUDGET_MB <= 0:
+        return False
+    if get_process_rss() <= MEMORY_BUDGET_MB * 1024 * 1024:
+        return False
+    print(f"Memory budget exceeded ({MEMORY_BUDGET_MB} MB), clearing in-memory caches")
+    with _cv_cache_lock:
+        _cv_cache.clear()
+    clear_candle_store()
+    with _loaded_models_lock:
+        _loaded_models.clear()
+    if isinstance(_response_cache, MemoryResponseCache):
+        _response_cache.clear()
+    gc.collect()
+    return True
+
+def get_memory_stats():
+    with _memory_stats_lock:
+        per_symbol = dict(_memory_stats)
+    total = sum(per_symbol.values())
+    return {
+        'rss_bytes': get_process_rss(),
+        'budget_bytes': MEMORY_BUDGET_MB * 1024 * 1024,
+        'symbols': len(per_symbol),
+        'loaded_models': len(_loaded_models),
+        'total_symbol_bytes': total,
+        'avg_bytes_per_symbol': total / len(per_symbol) if per_symbol else 0,
+        'bytes_per_symbol': per_symbol
+    }
+
+# Cancellazione cooperativa e deadline delle richieste
+class OperationCancelled(Exception):
+    """Sollevata quando una richiesta viene annullata o supera il suo budget di tempo."""
+
+class CancellationToken:
+    """
+    Token condiviso tra una richiesta e i suoi worker: risulta annullato se
+    viene chiamato cancel() (es. client disconnesso) o alla scadenza della deadline.
+    """
+    def __init__(self, time_budget=None):
+        self.deadline = time.time() + time_budget if time_budget else None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set() or (self.deadline is not None and time.time() >= self.deadline)
+
+    def remaining(self):
+        """Secondi rimanenti (None se non c'è deadline)."""
+        if self._cancelled.is_set():
+            return 0.0
+        return None if self.deadline is None else max(0.0, self.deadline - time.time())
+
+    def check(self):
+        if self.cancelled:
+            raise OperationCancelled()
+
+def get_request_token(params):
+    """Token con il budget della richiesta (`time_budget` in secondi, 0 = nessun limite)."""
+    return CancellationToken(float(params.get('time_budget', REQUEST_TIME_BUDGET)))
+
+def backtest_model(symbol, lookback_days=30, prediction_days=5, token=None):
     """
     Esegue un backtest del modello su dati storici.
+    Se il token viene annullato restituisce i periodi già completati (partial).
     """
     print(f"Esecuzione backtest per {symbol}...")
     
@@ -162,9 +1146,15 @@ def backtest_model(symbol, lookback_days=30, prediction_days=5):
         
         # Dividiamo i dati in periodi di training, testing e verifica
         results = []
+        partial = False
         
         # Creiamo diversi periodi di backtest
         for i in range(lookback_days):
+            if token is not None and token.cancelled:
+                print(f"Backtest per {symbol} interrotto dopo {i} periodi")
+                partial = True
+                break
+            
             # Dati di training: una finestra che termina lookback_days - i giorni fa
             train_end_idx = len(all_data) - prediction_days - i
             train_data = all_data.iloc[:train_end_idx].copy()
@@ -209,7 +1199,7 @@ def backtest_model(symbol, lookback_days=30, prediction_days=5):
         
         # Calcola le metriche di precisione
         if not results:
-            return {"symbol": symbol, "success": False, "error": "Nessun risultato valido nel backtest"}
+            return {"symbol": symbol, "success": False, "partial": partial, "error": "Nessun risultato valido nel backtest"}
         
         direction_accuracy = sum(1 for r in results if r["correct_direction"]) / len(results) * 100
         avg_error = sum(r["error_margin_pct"] for r in results) / len(results)
@@ -217,6 +1207,7 @@ def backtest_model(symbol, lookback_days=30, prediction_days=5):
         return {
             "symbol": symbol,
             "success": True,
+            "partial": partial,
             "direction_accuracy": direction_accuracy,
             "avg_error_pct": avg_error,
             "periods_tested": len(results),
@@ -227,82 +1218,134 @@ def backtest_model(symbol, lookback_days=30, prediction_days=5):
         print(f"Errore eseguendo backtest per {symbol}: {e}")
         return {"symbol": symbol, "success": False, "error": str(e)}
 
-def cross_validate_model(data, features, target, k=5):
+# Cross-validation engine
+_cv_cache = OrderedDict()
+_cv_cache_lock = threading.Lock()
+
+def purged_kfold_split(n_samples, k=5, purge=CV_PURGE, embargo=CV_EMBARGO):
+    """
+    Genera fold contigui (senza shuffle) rimuovendo dal training le righe
+    adiacenti al fold di test: `purge` prima e `embargo` dopo.
+    """
+    indices = np.arange(n_samples)
+    for test_idx in np.array_split(indices, k):
+        if len(test_idx) == 0:
+            continue
+        start, stop = test_idx[0], test_idx[-1] + 1
+        train_mask = np.ones(n_samples, dtype=bool)
+        train_mask[max(0, start - purge):min(n_samples, stop + embargo)] = False
+        train_idx = indices[train_mask]
+        if len(train_idx) == 0:
+            continue
+        yield train_idx, test_idx
+
+def get_cv_splits(n_samples, k=5, splitter=CV_SPLITTER, purge=CV_PURGE, embargo=CV_EMBARGO):
+    """Restituisce la lista di (train_idx, test_idx) per lo splitter richiesto."""
+    from sklearn.model_selection import TimeSeriesSplit
+    if splitter == 'purged':
+        return list(purged_kfold_split(n_samples, k, purge, embargo))
+    # Walk-forward: il training precede sempre il test, con `purge` righe di gap
+    tscv = TimeSeriesSplit(n_splits=k, gap=purge)
+    return list(tscv.split(np.arange(n_samples)))
+
+def _fit_cv_fold(X_train, y_train, X_test, y_test, model_params):
+    """Addestra e valuta un singolo fold (eseguito in un processo separato)."""
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
+    model = GradientBoostingRegressor(**model_params)
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+
+    mse = mean_squared_error(y_test, y_pred)
+    # Direction accuracy (importante per trading)
+    direction_acc = np.mean(np.sign(y_test) == np.sign(y_pred)) * 100
+    return {
+        'mse': mse,
+        'rmse': np.sqrt(mse),
+        'mae': mean_absolute_error(y_test, y_pred),
+        'r2': r2_score(y_test, y_pred),
+        'direction_accuracy': direction_acc
+    }
+
+def _cv_cache_key(X, y, params):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    digest.update(str(X.shape).encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def cross_validate_model(data, features, target, k=5, splitter=CV_SPLITTER,
+                         purge=CV_PURGE, embargo=CV_EMBARGO, n_jobs=CV_N_JOBS, model_params=None):
     """
-    Esegue k-fold cross-validation sul modello di previsione.
+    Esegue cross-validation su serie temporali (walk-forward o purged k-fold).
+    I fold vengono addestrati in parallelo e i risultati memorizzati per
+    (hash della matrice delle feature, parametri).
     """
+    import joblib
     try:
         if len(data) < k * 2:
             print("Dati insufficienti per cross-validation significativa")
             return None
             
         # Prepara i dati per validation
-        X = data[features].values
-        y = target.values
-        
-        # Inizializza KFold
-        kf = KFold(n_splits=k, shuffle=True, random_state=42)
-        
-        # Inizializza metriche
-        scores = {
-            'mse': [],
-            'rmse': [],
-            'mae': [],
-            'r2': [],
-            'direction_accuracy': []
+        X = np.asarray(data[features].values, dtype=np.float64)
+        y = np.asarray(target.values, dtype=np.float64)
+
+        if model_params is None:
+            model_params = {
+                'n_estimators': 100,
+                'learning_rate': 0.05,
+                'max_depth': 4,
+                'random_state': 42
+            }
+
+        params = {
+            'k': k,
+            'splitter': splitter,
+            'purge': purge,
+            'embargo': embargo,
+            'model_params': model_params
         }
-        
-        # Esegui validation
-        for train_idx, test_idx in kf.split(X):
-            X_train, X_test = X[train_idx], X[test_idx]
-            y_train, y_test = y[train_idx], y[test_idx]
-            
-            # Standardizza i dati
-            scaler = StandardScaler()
-            X_train_scaled = scaler.fit_transform(X_train)
-            X_test_scaled = scaler.transform(X_test)
-            
-            # Addestra modello
-            model = GradientBoostingRegressor(
-                n_estimators=100, 
-                learning_rate=0.05, 
-                max_depth=4, 
-                random_state=42
-            )
-            
-            model.fit(X_train_scaled, y_train)
-            
-            # Fai previsioni
-            y_pred = model.predict(X_test_scaled)
-            
-            # Calcola metriche
-            mse = mean_squared_error(y_test, y_pred)
-            rmse = np.sqrt(mse)
-            mae = mean_absolute_error(y_test, y_pred)
-            r2 = r2_score(y_test, y_pred)
-            
-            # Direction accuracy (importante per trading)
-            actual_direction = np.sign(y_test)
-            predicted_direction = np.sign(y_pred)
-            direction_acc = np.mean(actual_direction == predicted_direction) * 100
-            
-            # Aggiungi metriche
-            scores['mse'].append(mse)
-            scores['rmse'].append(rmse)
-            scores['mae'].append(mae)
-            scores['r2'].append(r2)
-            scores['direction_accuracy'].append(direction_acc)
+        cache_key = _cv_cache_key(X, y, params)
+        with _cv_cache_lock:
+            if cache_key in _cv_cache:
+                _cv_cache.move_to_end(cache_key)
+                return copy.deepcopy(_cv_cache[cache_key])
+
+        splits = get_cv_splits(len(X), k, splitter, purge, embargo)
+        if not splits:
+            print("Nessun fold valido per cross-validation")
+            return None
+
+        # Nessuna standardizzazione per fold: i modelli ad alberi sono invarianti
+        # a trasformazioni affini delle feature, quindi lo scaler non cambia i risultati
+        fold_results = joblib.Parallel(n_jobs=min(n_jobs, len(splits)))(
+            joblib.delayed(_fit_cv_fold)(X[train_idx], y[train_idx], X[test_idx], y[test_idx], model_params)
+            for train_idx, test_idx in splits
+        )
+
+        scores = {metric: [fold[metric] for fold in fold_results] for metric in fold_results[0]}
         
         # Calcola medie
         avg_scores = {metric: np.mean(values) for metric, values in scores.items()}
         std_scores = {metric: np.std(values) for metric, values in scores.items()}
         
-        return {
+        cv_results = {
             'avg_scores': avg_scores,
             'std_scores': std_scores,
             'raw_scores': scores,
-            'k_folds': k
+            'k_folds': len(splits),
+            'splitter': splitter
         }
+
+        with _cv_cache_lock:
+            _cv_cache[cache_key] = cv_results
+            _cv_cache.move_to_end(cache_key)
+            while len(_cv_cache) > CV_CACHE_SIZE:
+                _cv_cache.popitem(last=False)
+
+        return copy.deepcopy(cv_results)
     
     except Exception as e:
         print(f"Errore durante cross-validation: {e}")
@@ -325,103 +1368,406 @@ def ensure_python_types(obj):
         return ensure_python_types(obj.tolist())
     return obj
 
-def cache_model(model, symbol, type="bot1", features=None):
+# Registro dei modelli: ogni modello in cache ha un file di metadati JSON
+_model_meta_lock = threading.Lock()
+
+def get_model_meta_path(symbol, type="bot1"):
+    return f'model_cache/{symbol.replace("/", "_")}_{type}_meta.json'
+
+def load_model_meta(symbol, type="bot1"):
+    """Legge i metadati del modello (features, risultati CV, parametri ottimizzati)."""
+    meta_path = get_model_meta_path(symbol, type)
+    try:
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"Error reading model metadata for {symbol}: {e}")
+    return {}
+
+def update_model_meta(symbol, type="bot1", **updates):
+    """
+    Aggiorna i metadati del modello preservando le chiavi esistenti
+    (es. i parametri ottimizzati sopravvivono al riaddestramento).
+    """
+    meta_path = get_model_meta_path(symbol, type)
+    with _model_meta_lock:
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        meta_data = load_model_meta(symbol, type)
+        meta_data.update(ensure_python_types(updates))
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta_data, f)
+        os.replace(tmp_path, meta_path)
+    return meta_data
+
+def cache_model(model, symbol, type="bot1", features=None, scaler=None):
+    import joblib
     try:
+        os.makedirs('model_cache', exist_ok=True)
         joblib.dump(model, f'model_cache/{symbol.replace("/", "_")}_{type}.joblib')
         
-        # Salva anche le features utilizzate
+        # Salva anche le features utilizzate e la normalizzazione applicata in addestramento
+        meta = {}
         if features:
-            import json
-            with open(f'model_cache/{symbol.replace("/", "_")}_{type}_meta.json', 'w') as f:
-                json.dump({'features': features}, f)
+            meta['features'] = features
+        if scaler is not None:
+            meta['scaler'] = {'mean': scaler.mean_.tolist(), 'scale': scaler.scale_.tolist()}
+        if meta:
+            update_model_meta(symbol, type, **meta)
         
         return True
     except Exception as e:
         print(f"Error caching model for {symbol}: {e}")
         return False
 
-def load_cached_model(symbol, type="bot1"):
+def scale_model_inputs(symbol, type, X, history=None):
+    """
+    Applica agli input la normalizzazione usata in addestramento (salvata nei
+    metadati). Per i modelli salvati senza scaler la ristima su `history`
+    come faceva l'addestramento, o su X stesso se history è None.
+    """
+    from sklearn.preprocessing import StandardScaler
+    params = load_model_meta(symbol, type).get('scaler') or {}
+    mean, scale = np.asarray(params.get('mean', [])), np.asarray(params.get('scale', []))
+    if len(mean) == X.shape[1] and len(scale) == X.shape[1]:
+        return (X - mean) / scale
+    return StandardScaler().fit(X if history is None else history).transform(X)
+
+def get_model_version(symbol, type="bot1"):
+    """Versione del modello in cache (mtime e dimensione del file), None se assente."""
+    model_path = f'model_cache/{symbol.replace("/", "_")}_{type}.joblib'
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+def get_model_features(symbol, type="bot2"):
+    """
+    Feature del modello: la selezione salvata per il simbolo, altrimenti quella
+    condivisa (FEATURE_SELECTION_DEFAULT_KEY), altrimenti l'elenco completo.
+    """
+    if symbol:
+        selected = load_model_meta(symbol, type).get('selected_features')
+        if selected:
+            return selected
+    selected = load_model_meta(FEATURE_SELECTION_DEFAULT_KEY, type).get('selected_features')
+    if selected:
+        return selected
+    return BOT1_FEATURES if type == "bot1" else BOT2_FEATURES
+
+def gbr_params(symbol, type="bot1", **defaults):
+    """
+    Parametri del GradientBoostingRegressor: i valori di default vengono
+    sovrascritti da quelli ottimizzati salvati nel registro (se presenti).
+    """
+    params = dict(defaults)
+    if symbol:
+        tuned = load_model_meta(symbol, type).get('tuned_params') or {}
+        params.update({k: v for k, v in tuned.items() if k != 'random_state'})
+    return params
+
+# Modelli già deserializzati (LRU, LOADED_MODELS_MAX), invalidati quando il file su disco cambia
+_loaded_models = OrderedDict()
+_loaded_models_lock = threading.Lock()
+
+def load_cached_model(symbol, type="bot1", packed=False):
+    """
+    Modello in cache e relative feature. Con packed=True (solo chiamanti che
+    fanno predict) usa il file impacchettato se allineato; altrimenti
+    restituisce sempre l'oggetto scikit-learn originale.
+    """
+    import joblib
     try:
+        if packed and type in MODEL_PACK_FAMILIES:
+            packed_model, packed_features = load_packed_model(symbol, type)
+            if packed_model is not None:
+                return packed_model, packed_features
         model_path = f'model_cache/{symbol.replace("/", "_")}_{type}.joblib'
         if os.path.exists(model_path):
-            model = joblib.load(model_path)
+            mtime = os.path.getmtime(model_path)
+            with _loaded_models_lock:
+                loaded = _loaded_models.get(model_path)
+                if loaded:
+                    _loaded_models.move_to_end(model_path)
+            if loaded and loaded[0] == mtime:
+                model = loaded[1]
+            else:
+                model = joblib.load(model_path)
+                with _loaded_models_lock:
+                    _loaded_models[model_path] = (mtime, model)
+                    _loaded_models.move_to_end(model_path)
+                    while len(_loaded_models) > LOADED_MODELS_MAX:
+                        _loaded_models.popitem(last=False)
             
-            # Verifica se esiste anche il file di metadati
-            metadata_path = f'model_cache/{symbol.replace("/", "_")}_{type}_meta.json'
-            if os.path.exists(metadata_path):
-                with open(metadata_path, 'r') as f:
-                    metadata = json.load(f)
-                return model, metadata.get('features', [])
-            return model, []  # Ritorna il modello ma senza informazioni sulle features
+            # Le features sono nel file di metadati (lista vuota se assente)
+            return model, load_model_meta(symbol, type).get('features', [])
         return None, []
     except Exception as e:
         print(f"Error loading cached model for {symbol}: {e}")
         return None, []
 
+# Formato impacchettato: tutti gli alberi di una famiglia di modelli (es. bot1) in
+# un unico file con blocchi NumPy non compressi, aperto con np.memmap. I processi
+# worker condividono le stesse pagine fisiche e il caricamento non deserializza nulla.
+# Layout: magic (8 byte), lunghezza header, offset dei dati, header JSON, blocchi allineati.
+MODEL_PACK_MAGIC = b'MDLPACK1'
+MODEL_PACK_ALIGN = 64
+MODEL_PACK_ARRAYS = {
+    'feature': np.int32,
+    'threshold': np.float64,
+    'left': np.int32,
+    'right': np.int32,
+    'value': np.float64,
+    'missing_left': np.uint8,
+    'roots': np.int64
+}
 
-# Bot 1 (Market Analysis) Functions - Migliorate
-def calculate_indicators_bot1(data):
-    # Aggiungiamo indicatori più sofisticati
-    try:
-        # RSI e MACD di base
-        data['RSI'] = calculate_rsi(data)
-        data['MACD'], data['Signal_Line'] = calculate_macd(data)
-        data['MACD_hist'] = data['MACD'] - data['Signal_Line']
-        
-        # Indicatori di volatilità
-        data['ATR'] = calculate_atr(data)
-        data['Volatility'] = calculate_volatility(data)
-        data['NATR'] = data['ATR'] / data['close'] * 100  # ATR normalizzato
-        
-        # Indicatori di momentum
-        data['MOM'] = data['close'].diff(10)
-        data['ROC'] = data['close'].pct_change(10) * 100
-        
-        # Indicatori di trend
-        data['ADX'] = calculate_adx(data)
-        
-        # Calcolo delle direzioni (DI+ e DI-)
-        df = data.copy()
-        period = 14
-        df['TR'] = np.maximum(df['high'] - df['low'], 
-                            np.maximum(abs(df['high'] - df['close'].shift(1)), 
-                                        abs(df['low'] - df['close'].shift(1))))
-        df['DM+'] = np.where((df['high'] - df['high'].shift(1)) > (df['low'].shift(1) - df['low']), 
-                            df['high'] - df['high'].shift(1), 0)
-        df['DM-'] = np.where((df['low'].shift(1) - df['low']) > (df['high'] - df['high'].shift(1)), 
-                            df['low'].shift(1) - df['low'], 0)
-        tr_rolling = df['TR'].rolling(window=period).sum()
-        dm_plus_rolling = df['DM+'].rolling(window=period).sum()
-        dm_minus_rolling = df['DM-'].rolling(window=period).sum()
-        data['PLUS_DI'] = 100 * (dm_plus_rolling / tr_rolling)
-        data['MINUS_DI'] = 100 * (dm_minus_rolling / tr_rolling)
-        
-        # Medie Mobili
-        data['EMA_9'] = data['close'].ewm(span=9).mean()
-        data['EMA_21'] = data['close'].ewm(span=21).mean()
-        data['EMA_50'] = data['close'].ewm(span=50).mean()
-        data['EMA_200'] = data['close'].ewm(span=200).mean()
-        
-        # Indicatori di volume
-        data['OBV'] = (np.sign(data['close'].diff()) * data['volume']).fillna(0).cumsum()
-        
-        # Bande di Bollinger
-        data['BB_upper'], data['BB_lower'] = calculate_bollinger_bands(data)
-        data['BB_middle'] = data['close'].rolling(window=20).mean()
-        
-        # Calcolo di trend change (cambio di direzione)
-        data['Trend_Change'] = ((data['close'] > data['EMA_50']) & 
-                              (data['close'].shift(1) <= data['EMA_50'].shift(1))).astype(int) - \
-                             ((data['close'] < data['EMA_50']) & 
-                              (data['close'].shift(1) >= data['EMA_50'].shift(1))).astype(int)
-        
-        # Feature engineered (combinazioni di indicatori)
-        data['RSI_change'] = data['RSI'] - data['RSI'].shift(1)
-        data['Price_to_EMA50'] = data['close'] / data['EMA_50']
-        data['EMA_ratio'] = data['EMA_9'] / data['EMA_21']
-        
-        return data.dropna()
-    except Exception as e:
+_model_packs = {}
+_model_packs_lock = threading.Lock()
+
+def get_model_pack_path(type="bot1"):
+    return f'model_cache/{type}.pack'
+
+def _pack_regressor(model, nodes, roots):
+    """
+    Aggiunge gli alberi di un regressore ai blocchi della famiglia e restituisce
+    la sua voce nell'header. Supporta GradientBoostingRegressor e
+    HistGradientBoostingRegressor senza feature categoriali.
+    """
+    tree_start = len(roots)
+
+    def next_offset():
+        # I nodi di ogni albero seguono quelli dell'albero precedente
+        return roots[-1] + len(nodes['feature'][-1]) if roots else 0
+
+    if hasattr(model, 'estimators_'):
+        # GradientBoostingRegressor: previsione = init + learning_rate * somma delle foglie
+        if not hasattr(model.init_, 'constant_'):
+            raise ValueError("init del modello non supportato")
+        for estimator in model.estimators_[:, 0]:
+            tree = estimator.tree_
+            offset = next_offset()
+            leaf = tree.children_left < 0
+            roots.append(offset)
+            nodes['feature'].append(np.where(leaf, 0, tree.feature).astype(np.int32))
+            nodes['threshold'].append(tree.threshold.astype(np.float64))
+            nodes['left'].append(np.where(leaf, -1, tree.children_left + offset).astype(np.int32))
+            nodes['right'].append(np.where(leaf, -1, tree.children_right + offset).astype(np.int32))
+            nodes['value'].append(tree.value[:, 0, 0].astype(np.float64))
+            nodes['missing_left'].append(np.zeros(tree.node_count, dtype=np.uint8))
+        return {
+            'tree_start': tree_start,
+            'tree_end': len(roots),
+            'scale': float(model.learning_rate),
+            'baseline': float(np.ravel(model.init_.constant_)[0]),
+            # Gli alberi di sklearn confrontano le feature in float32
+            'float32_input': True,
+            'max_depth': int(max(e.tree_.max_depth for e in model.estimators_[:, 0])),
+            'n_features': int(model.n_features_in_)
+        }
+
+    if hasattr(model, '_predictors'):
+        # HistGradientBoostingRegressor: il learning rate è già nei valori delle foglie
+        if getattr(model, 'is_categorical_', None) is not None and np.any(model.is_categorical_):
+            raise ValueError("feature categoriali non supportate")
+        max_depth = 0
+        for (predictor,) in model._predictors:
+            tree = predictor.nodes
+            offset = next_offset()
+            leaf = tree['is_leaf'].astype(bool)
+            roots.append(offset)
+            nodes['feature'].append(np.where(leaf, 0, tree['feature_idx']).astype(np.int32))
+            nodes['threshold'].append(tree['num_threshold'].astype(np.float64))
+            nodes['left'].append(np.where(leaf, -1, tree['left'].astype(np.int64) + offset).astype(np.int32))
+            nodes['right'].append(np.where(leaf, -1, tree['right'].astype(np.int64) + offset).astype(np.int32))
+            nodes['value'].append(tree['value'].astype(np.float64))
+            nodes['missing_left'].append(tree['missing_go_to_left'].astype(np.uint8))
+            max_depth = max(max_depth, int(tree['depth'].max()))
+        return {
+            'tree_start': tree_start,
+            'tree_end': len(roots),
+            'scale': 1.0,
+            'baseline': float(np.ravel(model._baseline_prediction)[0]),
+            'float32_input': False,
+            'max_depth': max_depth,
+            'n_features': int(model.n_features_in_)
+        }
+
+    raise ValueError(f"modello non supportato: {type(model).__name__}")
+
+class PackedRegressor:
+    """
+    Regressore ad alberi letto dal file impacchettato (viste sulla memoria
+    mappata). predict() percorre tutti gli alberi in parallelo, un livello
+    alla volta, e restituisce gli stessi valori del modello originale.
+    """
+    def __init__(self, arrays, entry):
+        self.arrays = arrays
+        self.entry = entry
+        self.n_features_in_ = entry['n_features']
+
+    def predict(self, X):
+        arrays, entry = self.arrays, self.entry
+        X = np.asarray(X, dtype=np.float32 if entry['float32_input'] else np.float64).astype(np.float64)
+        X = np.atleast_2d(X)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(arrays['roots'][entry['tree_start']:entry['tree_end']], (len(X), entry['tree_end'] - entry['tree_start'])).copy()
+        for _ in range(entry['max_depth']):
+            left = arrays['left'][node]
+            internal = left >= 0
+            if not internal.any():
+                break
+            x = X[rows, arrays['feature'][node]]
+            go_left = (x <= arrays['threshold'][node]) | (np.isnan(x) & (arrays['missing_left'][node] == 1))
+            node = np.where(internal, np.where(go_left, left, arrays['right'][node]), node)
+        return entry['baseline'] + entry['scale'] * arrays['value'][node].sum(axis=1)
+
+def pack_model_family(type="bot1"):
+    """
+    Impacchetta tutti i modelli in cache di una famiglia in un unico file.
+    I modelli non supportati restano solo in joblib. Restituisce le statistiche.
+    """
+    import glob
+    import joblib
+
+    suffix = f'_{type}.joblib'
+    nodes = {name: [] for name in MODEL_PACK_ARRAYS if name != 'roots'}
+    roots = []
+    models, skipped = {}, []
+    for path in sorted(glob.glob(f'model_cache/*{suffix}')):
+        key = os.path.basename(path)[:-len(suffix)]
+        try:
+            model = joblib.load(path)
+            members = model if isinstance(model, dict) else {None: model}
+            packed = {str(name): _pack_regressor(member, nodes, roots) for name, member in members.items()}
+        except Exception as e:
+            print(f"Model {key} ({type}) not packed: {e}")
+            skipped.append(key)
+            continue
+        models[key] = {
+            'kind': 'dict' if isinstance(model, dict) else 'single',
+            'members': packed,
+            'version': get_model_version(key, type),
+            'features': load_model_meta(key, type).get('features', [])
+        }
+
+    blocks = {name: np.concatenate(parts) if parts else np.empty(0, dtype=MODEL_PACK_ARRAYS[name])
+              for name, parts in nodes.items()}
+    blocks['roots'] = np.asarray(roots, dtype=np.int64)
+
+    layout, offset = {}, 0
+    for name, dtype in MODEL_PACK_ARRAYS.items():
+        blocks[name] = np.ascontiguousarray(blocks[name], dtype=dtype)
+        layout[name] = {'offset': offset, 'dtype': np.dtype(dtype).str, 'length': len(blocks[name])}
+        offset += -(-blocks[name].nbytes // MODEL_PACK_ALIGN) * MODEL_PACK_ALIGN
+    header = json.dumps({'type': type, 'arrays': layout, 'models': models,
+                         'created_at': datetime.now().isoformat()}).encode()
+    data_offset = -(-(24 + len(header)) // MODEL_PACK_ALIGN) * MODEL_PACK_ALIGN
+
+    path = get_model_pack_path(type)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MODEL_PACK_MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(data_offset.to_bytes(8, 'little'))
+        f.write(header)
+        for name in MODEL_PACK_ARRAYS:
+            f.seek(data_offset + layout[name]['offset'])
+            f.write(blocks[name].tobytes())
+    os.replace(tmp_path, path)
+    return {'type': type, 'models': len(models), 'skipped': len(skipped), 'trees': len(roots),
+            'nodes': len(blocks['feature']), 'bytes': os.path.getsize(path)}
+
+def open_model_pack(type="bot1"):
+    """
+    Apre (una volta per processo, di nuovo se il file cambia) il file
+    impacchettato della famiglia: solo l'header viene letto, i blocchi sono
+    viste np.memmap. Restituisce None se il file non esiste.
+    """
+    path = get_model_pack_path(type)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _model_packs_lock:
+        cached = _model_packs.get(type)
+        if cached and cached['mtime'] == mtime:
+            return cached
+    try:
+        with open(path, 'rb') as f:
+            if f.read(8) != MODEL_PACK_MAGIC:
+                raise ValueError("formato non riconosciuto")
+            header_length = int.from_bytes(f.read(8), 'little')
+            data_offset = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_length))
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        arrays = {}
+        for name, block in header['arrays'].items():
+            dtype = np.dtype(block['dtype'])
+            start = data_offset + block['offset']
+            arrays[name] = raw[start:start + block['length'] * dtype.itemsize].view(dtype)
+    except Exception as e:
+        print(f"Error opening model pack {path}: {e}")
+        return None
+    pack = {'mtime': mtime, 'arrays': arrays, 'models': header['models'], 'created_at': header.get('created_at')}
+    with _model_packs_lock:
+        _model_packs[type] = pack
+    return pack
+
+def load_packed_model(symbol, type="bot1"):
+    """
+    Modello dal file impacchettato se la sua versione coincide con il joblib
+    in cache (altrimenti None: il file va rigenerato con pack_model_family).
+    """
+    pack = open_model_pack(type)
+    if pack is None:
+        return None, []
+    entry = pack['models'].get(symbol.replace("/", "_"))
+    if entry is None or entry['version'] != get_model_version(symbol, type):
+        return None, []
+    members = {name: PackedRegressor(pack['arrays'], member) for name, member in entry['members'].items()}
+    if entry['kind'] == 'dict':
+        # Le chiavi dei quantili tornano numeriche come nel modello originale
+        model = {float(name): member for name, member in members.items()}
+    else:
+        model = members['None']
+    return model, entry['features']
+
+
+# Bot 1 (Market Analysis) Functions - Migliorate
+def get_indicator_columns(bot="bot1", features=None):
+    """
+    Colonne da calcolare per un bot: tutte se `features` è None, altrimenti
+    le feature richieste più le colonne di base usate dall'analisi.
+    """
+    all_columns = BOT1_INDICATOR_COLUMNS if bot == "bot1" else BOT2_INDICATOR_COLUMNS
+    if features is None:
+        return all_columns
+    base = BOT1_BASE_COLUMNS if bot == "bot1" else BOT2_BASE_COLUMNS
+    needed = set(features) | set(base)
+    return [c for c in all_columns if c in needed] + [c for c in features if c not in all_columns and c in INDICATOR_GRAPH]
+
+def get_fetch_limit(features=None, bot="bot1", limit=DEFAULT_LIMIT):
+    """
+    Candele da scaricare: `limit` è tarato sull'insieme completo degli
+    indicatori, con meno indicatori basta meno storico per ottenere le stesse
+    righe utilizzabili dopo il dropna.
+    """
+    full_warmup = plan_indicators(get_indicator_columns(bot))['warmup']
+    return limit - full_warmup + plan_indicators(get_indicator_columns(bot, features))['warmup']
+
+def calculate_indicators_bot1(data, features=None):
+    """
+    Indicatori per il Bot 1 calcolati dal grafo: con `features` solo i nodi
+    necessari alle feature richieste e alle colonne di base.
+    """
+    try:
+        columns = get_indicator_columns("bot1", features)
+        data = compute_indicators(fill_source_gaps(data), columns)
+        return trim_warmup(compact_market_data(data), columns)
+    except Exception as e:
         print(f"Error calculating indicators: {e}")
         # Fallback al metodo originale
         data['RSI'] = calculate_rsi(data)
@@ -433,13 +1779,11 @@ def calculate_indicators_bot1(data):
         return data.dropna()
 
 def train_and_forecast_bot1(data, symbol=None, perform_cv=False):
+    from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, ExtraTreesRegressor
+    from sklearn.preprocessing import StandardScaler
     try:
-        # Selezioniamo le features disponibili nei dati attuali
-        possible_features = [
-            'RSI', 'MACD', 'MACD_hist', 'Signal_Line', 'ATR', 'Volatility', 'NATR', 
-            'MOM', 'ROC', 'ADX', 'PLUS_DI', 'MINUS_DI', 'OBV', 
-            'BB_upper', 'BB_lower', 'Price_to_EMA50', 'EMA_ratio'
-        ]
+        # Selezioniamo le features disponibili nei dati attuali (selezione offline se presente)
+        possible_features = get_model_features(symbol, "bot1")
         
         available_features = [f for f in possible_features if f in data.columns]
         
@@ -448,7 +1792,7 @@ def train_and_forecast_bot1(data, symbol=None, perform_cv=False):
         if symbol:
             try:
                 # Qui è il cambiamento principale: ora gestiamo una tupla
-                cached_result = load_cached_model(symbol, "bot1")
+                cached_result = load_cached_model(symbol, "bot1", packed=True)
                 if cached_result and cached_result[0]:  # Se abbiamo un modello
                     cached_model, cached_features = cached_result
                     print(f"Using cached model for {symbol}")
@@ -462,7 +1806,8 @@ def train_and_forecast_bot1(data, symbol=None, perform_cv=False):
                     # Verifichiamo se abbiamo tutte le features necessarie
                     if len(features_to_use) > 0:
                         latest_features = data[features_to_use].values[-48:]
-                        return cached_model.predict(latest_features)
+                        latest_scaled = scale_model_inputs(symbol, "bot1", latest_features, data[features_to_use].values[:-1])
+                        return cached_model.predict(latest_scaled)
                     else:
                         print(f"Not enough features available for cached model, retraining")
             except Exception as cache_err:
@@ -497,12 +1842,13 @@ def train_and_forecast_bot1(data, symbol=None, perform_cv=False):
             n_jobs=1  # Ridotto a 1 per evitare problemi di multiprocessing su macOS
         )
         
-        model3 = GradientBoostingRegressor(
+        model3 = GradientBoostingRegressor(**gbr_params(
+            symbol, "bot1",
             n_estimators=100, 
             learning_rate=0.05, 
             max_depth=4, 
             random_state=44
-        )
+        ))
         
         # Training dei modelli
         model1.fit(X_scaled, y)
@@ -520,12 +1866,7 @@ def train_and_forecast_bot1(data, symbol=None, perform_cv=False):
         
         ensemble_pred = (pred1 + pred2 + pred3) / 3.0
         
-        # Feature importance - utile per debug
-        feature_importance = pd.DataFrame({
-            'feature': available_features,
-            'importance': model1.feature_importances_
-        }).sort_values('importance', ascending=False)
-        print("Top 5 features:", feature_importance.head(5).to_string())
+        # Le importanze delle feature sono calcolate offline (/api/model-diagnostics)
         
         # Aggiungiamo validazione incrociata
         if perform_cv:
@@ -545,18 +1886,12 @@ def train_and_forecast_bot1(data, symbol=None, perform_cv=False):
                 if symbol:
                     # Nel meta file aggiungiamo i risultati
                     try:
-                        meta_file = f'model_cache/{symbol.replace("/", "_")}_bot1_meta.json'
-                        if os.path.exists(meta_file):
-                            with open(meta_file, 'r') as f:
-                                meta_data = json.load(f)
-                        else:
-                            meta_data = {'features': available_features}
-                        
-                        meta_data['cv_results'] = cv_results['avg_scores']
-                        meta_data['timestamp'] = datetime.now().isoformat()
-                        
-                        with open(meta_file, 'w') as f:
-                            json.dump(meta_data, f)
+                        update_model_meta(
+                            symbol, "bot1",
+                            features=load_model_meta(symbol, "bot1").get('features', available_features),
+                            cv_results=cv_results['avg_scores'],
+                            timestamp=datetime.now().isoformat()
+                        )
                     except Exception as cv_save_err:
                         print(f"Error saving CV results: {cv_save_err}")
         
@@ -565,23 +1900,18 @@ def train_and_forecast_bot1(data, symbol=None, perform_cv=False):
             try:
                 # Salviamo un modello più semplice che utilizzi esattamente le stesse feature
                 # Questo evita problemi se in futuro il set di feature cambia
-                ensemble_model = GradientBoostingRegressor(
+                ensemble_model = GradientBoostingRegressor(**gbr_params(
+                    symbol, "bot1",
                     n_estimators=100,
                     learning_rate=0.05,
                     max_depth=4,
                     random_state=42
-                )
+                ))
                 ensemble_model.fit(X_scaled, y)
                 
-                # Salviamo anche le feature utilizzate in un file metadata separato
-                import json
+                # Salviamo anche le feature utilizzate nel file metadata separato
                 os.makedirs('model_cache', exist_ok=True)
-                cache_file = f'model_cache/{symbol.replace("/", "_")}_bot1.joblib'
-                meta_file = f'model_cache/{symbol.replace("/", "_")}_bot1_meta.json'
-                
-                joblib.dump(ensemble_model, cache_file)
-                with open(meta_file, 'w') as f:
-                    json.dump({'features': available_features}, f)
+                cache_model(ensemble_model, symbol, "bot1", available_features, scaler)
                 
                 print(f"Model cached for {symbol} with {len(available_features)} features")
             except Exception as cache_err:
@@ -629,81 +1959,16 @@ def train_and_forecast_bot1(data, symbol=None, perform_cv=False):
         return data['close'].iloc[-1] * (1 + predictions)
 
 # Bot 2 (Trading Analysis) Functions
-def calculate_indicators_bot2(data):
+def calculate_indicators_bot2(data, features=None):
     """
     Calcola indicatori tecnici avanzati per il Bot 2.
+    Con `features` vengono calcolati solo gli indicatori richiesti (più le
+    colonne di base usate dall'analisi) e i loro intermedi.
     """
     try:
-        # RSI e MACD di base
-        data['RSI'] = calculate_rsi(data)
-        data['MACD'], data['Signal_Line'] = calculate_macd(data)
-        data['MACD_hist'] = data['MACD'] - data['Signal_Line']
-        
-        # Indicatori di volatilità
-        data['ATR'] = calculate_atr(data)
-        data['Volatility'] = calculate_volatility(data)
-        data['NATR'] = data['ATR'] / data['close'] * 100  # ATR normalizzato
-        
-        # Indicatori di momentum
-        data['MOM'] = data['close'].diff(10)
-        data['ROC'] = data['close'].pct_change(10) * 100
-        
-        # Indicatori di trend
-        data['ADX'] = calculate_adx(data)
-        
-        # Calcolo delle direzioni (DI+ e DI-)
-        df = data.copy()
-        period = 14
-        df['TR'] = np.maximum(df['high'] - df['low'], 
-                            np.maximum(abs(df['high'] - df['close'].shift(1)), 
-                                      abs(df['low'] - df['close'].shift(1))))
-        df['DM+'] = np.where((df['high'] - df['high'].shift(1)) > (df['low'].shift(1) - df['low']), 
-                           df['high'] - df['high'].shift(1), 0)
-        df['DM-'] = np.where((df['low'].shift(1) - df['low']) > (df['high'] - df['high'].shift(1)), 
-                           df['low'].shift(1) - df['low'], 0)
-        tr_rolling = df['TR'].rolling(window=period).sum()
-        dm_plus_rolling = df['DM+'].rolling(window=period).sum()
-        dm_minus_rolling = df['DM-'].rolling(window=period).sum()
-        data['PLUS_DI'] = 100 * (dm_plus_rolling / tr_rolling)
-        data['MINUS_DI'] = 100 * (dm_minus_rolling / tr_rolling)
-        
-        # Medie Mobili
-        data['EMA_9'] = data['close'].ewm(span=9).mean()
-        data['EMA_21'] = data['close'].ewm(span=21).mean()
-        data['EMA_50'] = data['close'].ewm(span=50).mean()
-        data['EMA_200'] = data['close'].ewm(span=200).mean()
-        
-        # Indicatori di volume
-        data['OBV'] = (np.sign(data['close'].diff()) * data['volume']).fillna(0).cumsum()
-        
-        # Bande di Bollinger
-        data['Bollinger_Upper'], data['Bollinger_Lower'] = calculate_bollinger_bands(data)
-        data['Bollinger_Middle'] = data['close'].rolling(window=20).mean()
-        data['BB_Width'] = (data['Bollinger_Upper'] - data['Bollinger_Lower']) / data['close']
-        
-        # Calcolo di trend change (cambio di direzione)
-        data['Trend_Change'] = ((data['close'] > data['EMA_50']) & 
-                              (data['close'].shift(1) <= data['EMA_50'].shift(1))).astype(int) - \
-                             ((data['close'] < data['EMA_50']) & 
-                              (data['close'].shift(1) >= data['EMA_50'].shift(1))).astype(int)
-        
-        # Feature engineered (combinazioni di indicatori)
-        data['RSI_change'] = data['RSI'] - data['RSI'].shift(1)
-        data['Price_to_EMA50'] = data['close'] / data['EMA_50']
-        data['EMA_ratio'] = data['EMA_9'] / data['EMA_21']
-        
-        # Indicatori avanzati di oscillazione
-        data['Stochastic_K'] = 100 * ((data['close'] - data['low'].rolling(window=14).min()) / 
-                                      (data['high'].rolling(window=14).max() - 
-                                       data['low'].rolling(window=14).min()))
-        data['Stochastic_D'] = data['Stochastic_K'].rolling(window=3).mean()
-        
-        # Chaikin Money Flow (CMF)
-        data['MF_Multiplier'] = ((data['close'] - data['low']) - (data['high'] - data['close'])) / (data['high'] - data['low'])
-        data['MF_Volume'] = data['MF_Multiplier'] * data['volume']
-        data['CMF'] = data['MF_Volume'].rolling(window=20).sum() / data['volume'].rolling(window=20).sum()
-        
-        return data.dropna()
+        columns = get_indicator_columns("bot2", features)
+        data = compute_indicators(fill_source_gaps(data), columns)
+        return trim_warmup(compact_market_data(data), columns)
     except Exception as e:
         print(f"Error calculating bot2 indicators: {e}")
         # Fallback al metodo originale in caso di errore
@@ -715,14 +1980,107 @@ def calculate_indicators_bot2(data):
         data['Bollinger_Upper'], data['Bollinger_Lower'] = calculate_bollinger_bands(data)
         return data.dropna()
 
+def build_horizon_training_set(data, features, horizon):
+    """
+    Dataset diretto multi-step: ogni riga t viene replicata per h = 1..horizon
+    con la colonna 'step' = h e target = close[t + h] / close[t] - 1.
+    """
+    X = data[features].values
+    close = data['close'].values
+    X_parts, y_parts = [], []
+    for h in range(1, horizon + 1):
+        X_parts.append(np.column_stack([X[:-h], np.full(len(X) - h, h)]))
+        y_parts.append(close[h:] / close[:-h] - 1)
+    return np.vstack(X_parts), np.concatenate(y_parts)
+
+def train_horizon_models(X, y):
+    """Un modello quantile per ciascun quantile di HORIZON_QUANTILES."""
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    models = {}
+    for q in HORIZON_QUANTILES:
+        model = HistGradientBoostingRegressor(
+            loss='quantile',
+            quantile=q,
+            max_iter=150,
+            learning_rate=0.05,
+            max_depth=4,
+            min_samples_leaf=10,
+            early_stopping=False,
+            random_state=42
+        )
+        model.fit(X, y)
+        models[q] = model
+    return models
+
+def forecast_horizon_bot2(data, forecast_days, symbol=None):
+    """
+    Previsione diretta multi-step per Bot 2: le feature dell'ultima candela
+    vengono combinate con lo step h, senza ricalcolare indicatori.
+    Restituisce i prezzi previsti per ogni step con intervallo di previsione.
+    """
+    features = [f for f in get_model_features(symbol, "bot2") if f in data.columns]
+    if len(data) - forecast_days < 30:
+        raise ValueError("Dati insufficienti per il motore multi-step")
+
+    models = None
+    if symbol:
+        cached_models, cached_features = load_cached_model(symbol, "bot2_horizon", packed=True)
+        meta = load_model_meta(symbol, "bot2_horizon")
+        cached_horizon = meta.get('horizon', 0)
+        # I modelli senza trained_at (salvati prima di questo campo) sono considerati scaduti
+        try:
+            age_hours = (datetime.now() - datetime.fromisoformat(meta['trained_at'])).total_seconds() / 3600
+        except (KeyError, TypeError, ValueError):
+            age_hours = float('inf')
+        fresh = HORIZON_MODEL_MAX_AGE <= 0 or age_hours <= HORIZON_MODEL_MAX_AGE
+        if cached_models and cached_features == features and cached_horizon >= forecast_days and fresh:
+            print(f"Using cached horizon models for {symbol}")
+            models = cached_models
+
+    if models is None:
+        X, y = build_horizon_training_set(data, features, forecast_days)
+        models = train_horizon_models(X, y)
+        if symbol:
+            cache_model(models, symbol, "bot2_horizon", features)
+            update_model_meta(
+                symbol, "bot2_horizon",
+                horizon=forecast_days,
+                trained_at=datetime.now().isoformat(),
+                last_candle_ts=int(data['timestamp'].iloc[-1]) if 'timestamp' in data.columns else None
+            )
+
+    steps = np.arange(1, forecast_days + 1)
+    latest = data[features].values[-1]
+    X_future = np.column_stack([np.repeat(latest[None, :], forecast_days, axis=0), steps])
+
+    # Ordina i quantili per evitare incroci tra le previsioni
+    returns = np.sort(np.vstack([models[q].predict(X_future) for q in HORIZON_QUANTILES]), axis=0)
+    prices = data['close'].iloc[-1] * (1 + returns)
+
+    return {
+        'steps': steps,
+        'quantiles': HORIZON_QUANTILES,
+        'lower': prices[0],
+        'median': prices[len(HORIZON_QUANTILES) // 2],
+        'upper': prices[-1]
+    }
+
 def forecast_prices_bot2(data, forecast_days, symbol=None):
     """
     Predice i prezzi futuri utilizzando un ensemble di modelli avanzato.
     """
+    from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, ExtraTreesRegressor
+    from sklearn.preprocessing import StandardScaler
+    if FORECAST_ENGINE == 'horizon':
+        try:
+            return forecast_horizon_bot2(data, forecast_days, symbol)['median']
+        except Exception as horizon_err:
+            print(f"Horizon engine failed, using legacy bot2 model: {horizon_err}")
+
     try:
         # Verifica se esiste un modello in cache
         if symbol:
-            cached_result = load_cached_model(symbol, "bot2")
+            cached_result = load_cached_model(symbol, "bot2", packed=True)
             if cached_result and cached_result[0]:  # Se abbiamo un modello
                 cached_model, cached_features = cached_result
                 print(f"Using cached model for {symbol} (bot2)")
@@ -731,28 +2089,21 @@ def forecast_prices_bot2(data, forecast_days, symbol=None):
                 features_to_use = cached_features if cached_features else get_default_bot2_features()
                 available_features = [f for f in features_to_use if f in data.columns]
                 
-                if len(available_features) > 0:
+                # Gli indicatori non usati dalla selezione corrente non vengono calcolati
+                if available_features and len(available_features) == len(features_to_use):
                     latest_features = data[available_features].values[-forecast_days:]
                     
-                    # Normalizzazione
-                    scaler = StandardScaler()
+                    # Normalizzazione dell'addestramento (ristimata per i modelli senza scaler salvato)
                     historical_data = data[available_features].values[:-forecast_days]
-                    scaler.fit(historical_data)
-                    latest_scaled = scaler.transform(latest_features)
+                    latest_scaled = scale_model_inputs(symbol, "bot2", latest_features, historical_data)
                     
                     return cached_model.predict(latest_scaled)
                 else:
                     print(f"Not enough features for cached model, retraining {symbol}")
         
         # Se siamo qui, o non abbiamo trovato cache o non è compatibile
-        # Selezioniamo le features disponibili nei dati
-        possible_features = [
-            'RSI', 'MACD', 'MACD_hist', 'Signal_Line', 'ATR', 'Volatility', 'NATR',
-            'MOM', 'ROC', 'ADX', 'PLUS_DI', 'MINUS_DI', 'OBV', 'EMA_9', 'EMA_21',
-            'EMA_50', 'EMA_200', 'Bollinger_Upper', 'Bollinger_Lower', 'Bollinger_Middle',
-            'BB_Width', 'RSI_change', 'Price_to_EMA50', 'EMA_ratio', 'Trend_Change',
-            'Stochastic_K', 'Stochastic_D', 'CMF'
-        ]
+        # Selezioniamo le features disponibili nei dati (selezione offline se presente)
+        possible_features = get_model_features(symbol, "bot2")
         
         available_features = [f for f in possible_features if f in data.columns]
         print(f"Bot2 training with {len(available_features)} features")
@@ -781,26 +2132,20 @@ def forecast_prices_bot2(data, forecast_days, symbol=None):
             n_jobs=1  # Ridotto per evitare problemi di multiprocessing
         )
         
-        model3 = GradientBoostingRegressor(
+        model3 = GradientBoostingRegressor(**gbr_params(
+            symbol, "bot2",
             n_estimators=200, 
             learning_rate=0.05, 
             max_depth=5, 
             min_samples_split=5,
             random_state=44
-        )
+        ))
         
         # Training dei modelli
         model1.fit(X_scaled, y)
         model2.fit(X_scaled, y)
         model3.fit(X_scaled, y)
         
-        # Feature importance - utile per debug
-        feature_importance = pd.DataFrame({
-            'feature': available_features,
-            'importance': model1.feature_importances_
-        }).sort_values('importance', ascending=False)
-        print(f"Bot2 Top 5 features: {feature_importance.head(5).to_string()}")
-        
         # Preparazione dati per previsione futura
         future_features = data[available_features].values[-forecast_days:]
         future_scaled = scaler.transform(future_features)
@@ -818,15 +2163,16 @@ def forecast_prices_bot2(data, forecast_days, symbol=None):
         if symbol:
             try:
                 # Salviamo un modello ottimizzato per la cache
-                ensemble_model = GradientBoostingRegressor(
+                ensemble_model = GradientBoostingRegressor(**gbr_params(
+                    symbol, "bot2",
                     n_estimators=200,
                     learning_rate=0.05,
                     max_depth=5,
                     random_state=42
-                )
+                ))
                 ensemble_model.fit(X_scaled, y)
                 
-                cache_model(ensemble_model, symbol, "bot2", available_features)
+                cache_model(ensemble_model, symbol, "bot2", available_features, scaler)
                 print(f"Bot2 model cached for {symbol} with {len(available_features)} features")
             except Exception as cache_err:
                 print(f"Error caching Bot2 model: {cache_err}")
@@ -875,13 +2221,7 @@ def validate_bot2_model(data, symbol):
     """
     Esegue cross-validation per il modello Bot 2.
     """
-    possible_features = [
-        'RSI', 'MACD', 'MACD_hist', 'Signal_Line', 'ATR', 'Volatility', 'NATR',
-        'MOM', 'ROC', 'ADX', 'PLUS_DI', 'MINUS_DI', 'OBV', 'EMA_9', 'EMA_21',
-        'EMA_50', 'EMA_200', 'Bollinger_Upper', 'Bollinger_Lower', 'Bollinger_Middle',
-        'BB_Width', 'RSI_change', 'Price_to_EMA50', 'EMA_ratio', 'Trend_Change',
-        'Stochastic_K', 'Stochastic_D', 'CMF'
-    ]
+    possible_features = BOT2_FEATURES
     
     available_features = [f for f in possible_features if f in data.columns]
     
@@ -900,24 +2240,56 @@ def validate_bot2_model(data, symbol):
     
     if cv_results:
         # Salviamo i risultati nei metadati del modello
-        meta_file = f'model_cache/{symbol.replace("/", "_")}_bot2_meta.json'
-        if os.path.exists(meta_file):
-            with open(meta_file, 'r') as f:
-                meta_data = json.load(f)
-        else:
-            meta_data = {'features': available_features}
-        
-        meta_data['cv_results'] = cv_results['avg_scores']
-        meta_data['timestamp'] = datetime.now().isoformat()
-        
-        with open(meta_file, 'w') as f:
-            json.dump(meta_data, f)
+        update_model_meta(
+            symbol, "bot2",
+            features=load_model_meta(symbol, "bot2").get('features', available_features),
+            cv_results=cv_results['avg_scores'],
+            timestamp=datetime.now().isoformat()
+        )
         
         print(f"Bot2 CV Results for {symbol}:")
         print(f"Direction Accuracy: {cv_results['avg_scores']['direction_accuracy']:.2f}%")
         print(f"RMSE: {cv_results['avg_scores']['rmse']:.6f}")
     
     return cv_results
+def _lagged(values, periods, groups=None):
+    """Valori spostati di `periods` candele, per simbolo se vengono passati i gruppi."""
+    series = pd.Series(values)
+    shifted = series.groupby(groups).shift(periods) if groups is not None else series.shift(periods)
+    return shifted.values
+
+def candlestick_pattern_arrays(data, groups=None):
+    """
+    Pattern candlestick per ogni candela (array booleani), con le stesse
+    definizioni di detect_candlestick_patterns.
+    """
+    open_ = data['open'].values
+    high = data['high'].values
+    low = data['low'].values
+    close = data['close'].values
+    prev_open = _lagged(open_, 1, groups)
+    prev_close = _lagged(close, 1, groups)
+
+    body_size = np.abs(close - open_)
+    total_range = high - low
+    green = close > open_
+    upper_shadow = np.where(green, high - close, high - open_)
+    lower_shadow = np.where(green, open_ - low, close - low)
+    has_range = total_range > 0
+
+    return {
+        # Doji (corpo molto piccolo)
+        'doji': has_range & (body_size <= 0.1 * total_range),
+        # Hammer (corpo piccolo in alto, ombra lunga in basso)
+        'hammer': has_range & (lower_shadow >= 2 * body_size) & (upper_shadow <= 0.1 * total_range),
+        # Shooting Star (corpo piccolo in basso, ombra lunga in alto)
+        'shooting_star': has_range & (upper_shadow >= 2 * body_size) & (lower_shadow <= 0.1 * total_range),
+        # Bullish Engulfing (seconda candela verde ingloba prima candela rossa)
+        'bullish_engulfing': (prev_close < prev_open) & green & (open_ < prev_close) & (close > prev_open),
+        # Bearish Engulfing (seconda candela rossa ingloba prima candela verde)
+        'bearish_engulfing': (prev_close > prev_open) & (close < open_) & (open_ > prev_close) & (close < prev_open)
+    }
+
 def detect_candlestick_patterns(data):
     """
     Rileva pattern candlestick avanzati per il Bot 2.
@@ -925,63 +2297,11 @@ def detect_candlestick_patterns(data):
     if len(data) < 5:
         return {}
     
-    patterns = {}
-    
-    # Doji (corpo molto piccolo)
-    latest = data.iloc[-1]
-    body_size = abs(latest['close'] - latest['open'])
-    total_range = latest['high'] - latest['low']
-    if total_range > 0 and body_size <= 0.1 * total_range:
-        patterns['doji'] = True
-    else:
-        patterns['doji'] = False
-        
-    # Hammer (corpo piccolo in alto, ombra lunga in basso)
-    if latest['close'] > latest['open']:  # Candela verde
-        upper_shadow = latest['high'] - latest['close']
-        lower_shadow = latest['open'] - latest['low']
-    else:  # Candela rossa
-        upper_shadow = latest['high'] - latest['open']
-        lower_shadow = latest['close'] - latest['low']
-    
-    if total_range > 0 and lower_shadow >= 2 * body_size and upper_shadow <= 0.1 * total_range:
-        patterns['hammer'] = True
-    else:
-        patterns['hammer'] = False
-        
-    # Shooting Star (corpo piccolo in basso, ombra lunga in alto)
-    if total_range > 0 and upper_shadow >= 2 * body_size and lower_shadow <= 0.1 * total_range:
-        patterns['shooting_star'] = True
-    else:
-        patterns['shooting_star'] = False
-        
-    # Bullish Engulfing (seconda candela verde ingloba prima candela rossa)
-    if len(data) >= 2:
-        prev = data.iloc[-2]
-        curr = data.iloc[-1]
-        if (prev['close'] < prev['open'] and  # Prima candela rossa
-            curr['close'] > curr['open'] and  # Seconda candela verde
-            curr['open'] < prev['close'] and  # Apertura sotto chiusura precedente
-            curr['close'] > prev['open']):    # Chiusura sopra apertura precedente
-            patterns['bullish_engulfing'] = True
-        else:
-            patterns['bullish_engulfing'] = False
-            
-    # Bearish Engulfing (seconda candela rossa ingloba prima candela verde)
-    if len(data) >= 2:
-        prev = data.iloc[-2]
-        curr = data.iloc[-1]
-        if (prev['close'] > prev['open'] and  # Prima candela verde
-            curr['close'] < curr['open'] and  # Seconda candela rossa
-            curr['open'] > prev['close'] and  # Apertura sopra chiusura precedente
-            curr['close'] < prev['open']):    # Chiusura sotto apertura precedente
-            patterns['bearish_engulfing'] = True
-        else:
-            patterns['bearish_engulfing'] = False
-    
-    return patterns
+    return {name: bool(values[-1]) for name, values in candlestick_pattern_arrays(data.iloc[-2:]).items()}
 
 def fetch_news_and_sentiment(symbol, news_limit):
+    import requests
+    from textblob import TextBlob
     try:
         crypto_name = symbol.split('/')[0]
         url = f"https://newsapi.org/v2/everything?q={crypto_name}&language=en&apiKey={NEWS_API_KEY}"
@@ -997,22 +2317,613 @@ def fetch_news_and_sentiment(symbol, news_limit):
         print(f"Error fetching news: {e}")
         return 0
 
+# Hyperparameter tuning (successive halving)
+GBR_PARAM_GRID = {
+    'learning_rate': [0.02, 0.05, 0.1],
+    'max_depth': [3, 4, 5],
+    'min_samples_split': [2, 5, 10],
+    'subsample': [0.8, 1.0]
+}
+
+_tuning_state = {
+    'running': False,
+    'started_at': None,
+    'finished_at': None,
+    'total': 0,
+    'completed': 0,
+    'errors': 0,
+    'stopped_by_budget': False
+}
+_tuning_lock = threading.Lock()
+
+def build_training_set(data, bot="bot1", features=None):
+    """
+    Costruisce (X, y, features) con lo stesso target usato in addestramento:
+    variazione percentuale per Bot 1, prezzo successivo per Bot 2.
+    """
+    if features is None:
+        features = BOT1_FEATURES if bot == "bot1" else BOT2_FEATURES
+    features = [f for f in features if f in data.columns]
+    X = data[features].values[:-1]
+    if bot == "bot1":
+        y = data['close'].pct_change(1).shift(-1).iloc[:-1].values
+    else:
+        y = data['close'].shift(-1).iloc[:-1].values
+    return X, y, features
+
+def fetch_training_data(symbol, bot="bot1"):
+    """Scarica i dati e calcola gli indicatori con la stessa configurazione del bot."""
+    if bot == "bot1":
+        data = fetch_market_data(symbol, limit=get_fetch_limit(get_model_features(symbol, "bot1"), "bot1"))
+        return calculate_indicators_bot1(data) if data is not None and not data.empty else None
+    data = fetch_market_data(symbol, timeframe='1d', limit=200)
+    return calculate_indicators_bot2(data) if data is not None and not data.empty else None
+
+def _lower_process_priority():
+    """Initializer dei worker di tuning: priorità CPU ridotta."""
+    try:
+        os.nice(TUNING_NICE)
+    except (AttributeError, OSError):
+        pass
+
+def _tune_gbr_worker(X, y, param_grid, k=TUNING_CV_FOLDS):
+    """
+    Successive halving sul numero di stimatori: tutte le combinazioni partono
+    con pochi alberi e solo le migliori ricevono il budget completo.
+    """
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (abilita HalvingGridSearchCV)
+    from sklearn.model_selection import HalvingGridSearchCV, TimeSeriesSplit
+    search = HalvingGridSearchCV(
+        GradientBoostingRegressor(random_state=42),
+        param_grid,
+        resource='n_estimators',
+        min_resources=TUNING_MIN_ESTIMATORS,
+        max_resources=TUNING_MAX_ESTIMATORS,
+        factor=3,
+        aggressive_elimination=True,
+        cv=TimeSeriesSplit(n_splits=k, gap=CV_PURGE),
+        scoring='neg_mean_squared_error',
+        refit=False,
+        n_jobs=1
+    )
+    search.fit(X, y)
+    return ensure_python_types({
+        'best_params': search.best_params_,
+        'best_score': search.best_score_,
+        'candidates': len(search.cv_results_['params'])
+    })
+
+def run_tuning_job(symbols, bots=("bot1", "bot2"), time_budget=TUNING_TIME_BUDGET,
+                   max_workers=TUNING_MAX_WORKERS, param_grid=None):
+    """
+    Ottimizza i parametri GBR per ogni (simbolo, bot) in un pool di processi
+    e salva i migliori nel registro dei modelli. Si ferma allo scadere del budget.
+    """
+    param_grid = param_grid or GBR_PARAM_GRID
+    deadline = time.time() + time_budget
+    tasks = iter([(symbol, bot) for symbol in symbols for bot in bots])
+
+    with _tuning_lock:
+        _tuning_state.update({
+            'running': True,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'total': len(symbols) * len(bots),
+            'completed': 0,
+            'errors': 0,
+            'stopped_by_budget': False
+        })
+
+    # 'spawn' evita il fork di un processo che ha già thread attivi (Flask, scanner).
+    # Un Pool proprio (e non ProcessPoolExecutor) permette di terminare le ricerche
+    # ancora in corso allo scadere del budget.
+    pool = multiprocessing.get_context('spawn').Pool(processes=max_workers, initializer=_lower_process_priority)
+    completed_queue = queue.Queue()
+    task_ids = itertools.count()
+    pending = {}
+
+    def submit_next():
+        # I dati vengono scaricati qui (I/O); i worker eseguono solo il calcolo
+        for symbol, bot in tasks:
+            try:
+                data = fetch_training_data(symbol, bot)
+                if data is None or len(data) < TUNING_CV_FOLDS * 10:
+                    raise ValueError("dati insufficienti")
+                X, y, _ = build_training_set(data, bot)
+                task_id = next(task_ids)
+                pending[task_id] = (symbol, bot)
+                pool.apply_async(
+                    _tune_gbr_worker, (X, y, param_grid),
+                    callback=lambda result, task_id=task_id: completed_queue.put((task_id, result, None)),
+                    error_callback=lambda error, task_id=task_id: completed_queue.put((task_id, None, error))
+                )
+                return True
+            except Exception as e:
+                print(f"Tuning skipped for {symbol} ({bot}): {e}")
+                with _tuning_lock:
+                    _tuning_state['errors'] += 1
+        return False
+
+    try:
+        while len(pending) < max_workers and time.time() < deadline and submit_next():
+            pass
+
+        while pending:
+            try:
+                task_id, result, error = completed_queue.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                print("Tuning time budget exhausted, stopping")
+                with _tuning_lock:
+                    _tuning_state['stopped_by_budget'] = True
+                break
+
+            symbol, bot = pending.pop(task_id)
+            try:
+                if error is not None:
+                    raise error
+                update_model_meta(
+                    symbol, bot,
+                    tuned_params=result['best_params'],
+                    tuned_score=result['best_score'],
+                    tuned_at=datetime.now().isoformat()
+                )
+                print(f"Tuned {symbol} ({bot}): {result['best_params']}")
+                with _tuning_lock:
+                    _tuning_state['completed'] += 1
+            except Exception as e:
+                print(f"Tuning failed for {symbol} ({bot}): {e}")
+                with _tuning_lock:
+                    _tuning_state['errors'] += 1
+
+            if time.time() < deadline:
+                submit_next()
+    finally:
+        # Ricerche ancora in corso (budget scaduto o errore): i processi vengono terminati
+        if pending:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+        with _tuning_lock:
+            _tuning_state['running'] = False
+            _tuning_state['finished_at'] = datetime.now().isoformat()
+
+    return dict(_tuning_state)
+
+# Diagnostica dei modelli (importanze, permutation importance, metriche CV)
+_diagnostics_state = {
+    'running': False,
+    'started_at': None,
+    'finished_at': None,
+    'total': 0,
+    'completed': 0,
+    'skipped': 0,
+    'errors': 0
+}
+_diagnostics_lock = threading.Lock()
+
+def compute_model_diagnostics(symbol, bot="bot1", data=None):
+    """
+    Calcola la diagnostica del modello in cache: importanze del modello,
+    permutation importance sulla parte finale dei dati e metriche CV.
+    Pensata per il job offline, non per il percorso delle richieste.
+    """
+    from sklearn.inspection import permutation_importance
+    model, features = load_cached_model(symbol, bot)
+    if model is None:
+        raise ValueError("nessun modello in cache")
+    version = get_model_version(symbol, bot)
+
+    if data is None:
+        data = fetch_training_data(symbol, bot)
+    if data is None or len(data) < TUNING_CV_FOLDS * 10:
+        raise ValueError("dati insufficienti")
+    X, y, features = build_training_set(data, bot, features or None)
+    if X.shape[1] != getattr(model, 'n_features_in_', X.shape[1]):
+        raise ValueError("feature del modello non disponibili nei dati")
+    # Il modello è addestrato sugli input normalizzati: stessa trasformazione prima dello scoring
+    X = scale_model_inputs(symbol, bot, X)
+
+    diagnostics = {
+        'model_version': version,
+        'features': features,
+        'computed_at': datetime.now().isoformat(),
+        'rows': len(X)
+    }
+    if hasattr(model, 'feature_importances_'):
+        diagnostics['feature_importance'] = dict(zip(features, model.feature_importances_))
+
+    # Permutation importance sulla coda più recente (scoring R² del modello)
+    holdout = max(int(len(X) * DIAGNOSTICS_HOLDOUT), 10)
+    permutation = permutation_importance(
+        model, X[-holdout:], y[-holdout:],
+        n_repeats=DIAGNOSTICS_REPEATS, random_state=42, n_jobs=1
+    )
+    diagnostics['permutation_importance'] = {
+        feature: {'mean': mean, 'std': std}
+        for feature, mean, std in zip(features, permutation.importances_mean, permutation.importances_std)
+    }
+
+    target = pd.Series(y)
+    cv_results = cross_validate_model(
+        data=pd.DataFrame(X, columns=features),
+        features=features,
+        target=target,
+        k=TUNING_CV_FOLDS,
+        model_params=gbr_params(symbol, bot, n_estimators=100, learning_rate=0.05, max_depth=4, random_state=42)
+    )
+    if cv_results:
+        diagnostics['cv_results'] = {
+            'avg_scores': cv_results['avg_scores'],
+            'std_scores': cv_results['std_scores'],
+            'k_folds': cv_results['k_folds'],
+            'splitter': cv_results['splitter']
+        }
+    return ensure_python_types(diagnostics)
+
+def run_diagnostics_job(symbols, bots=("bot1", "bot2"), force=False):
+    """
+    Aggiorna la diagnostica nel registro dei modelli. I modelli la cui
+    versione non è cambiata dall'ultimo calcolo vengono saltati.
+    """
+    with _diagnostics_lock:
+        _diagnostics_state.update({
+            'running': True,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'total': len(symbols) * len(bots),
+            'completed': 0,
+            'skipped': 0,
+            'errors': 0
+        })
+
+    try:
+        for symbol in symbols:
+            for bot in bots:
+                version = get_model_version(symbol, bot)
+                stored = load_model_meta(symbol, bot).get('diagnostics') or {}
+                if version is None or (not force and stored.get('model_version') == version):
+                    with _diagnostics_lock:
+                        _diagnostics_state['skipped'] += 1
+                    continue
+                try:
+                    update_model_meta(symbol, bot, diagnostics=compute_model_diagnostics(symbol, bot))
+                    with _diagnostics_lock:
+                        _diagnostics_state['completed'] += 1
+                except Exception as e:
+                    print(f"Diagnostics failed for {symbol} ({bot}): {e}")
+                    with _diagnostics_lock:
+                        _diagnostics_state['errors'] += 1
+    finally:
+        with _diagnostics_lock:
+            _diagnostics_state['running'] = False
+            _diagnostics_state['finished_at'] = datetime.now().isoformat()
+
+    return dict(_diagnostics_state)
+
+_feature_selection_state = {
+    'running': False,
+    'started_at': None,
+    'finished_at': None,
+    'total': 0,
+    'completed': 0,
+    'errors': 0
+}
+_feature_selection_lock = threading.Lock()
+
+def select_features(data, bot="bot2", correlation=FEATURE_SELECTION_CORRELATION,
+                    coverage=FEATURE_SELECTION_COVERAGE, tolerance=FEATURE_SELECTION_TOLERANCE,
+                    min_features=FEATURE_SELECTION_MIN_FEATURES):
+    """
+    Riduce le feature in due passi: clustering gerarchico sulla correlazione
+    (un rappresentante per cluster, il più importante) e potatura per importanza
+    cumulata. Il set ridotto viene accettato solo se l'RMSE in cross-validation
+    temporale non peggiora oltre `tolerance` rispetto al set completo.
+    """
+    from scipy.cluster.hierarchy import linkage, fcluster
+    from scipy.spatial.distance import squareform
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    X, y, features = build_training_set(data, bot)
+    if len(X) < TUNING_CV_FOLDS * 10:
+        raise ValueError("dati insufficienti")
+
+    # Distanza 1 - |corr di Spearman|: le feature quasi collineari finiscono nello stesso cluster
+    corr = pd.DataFrame(X, columns=features).corr(method='spearman').abs().fillna(0).to_numpy(copy=True)
+    np.fill_diagonal(corr, 1.0)
+    distance = np.clip(1 - (corr + corr.T) / 2, 0, None)
+    clusters = fcluster(linkage(squareform(distance, checks=False), method='average'),
+                        t=1 - correlation, criterion='distance')
+
+    model = GradientBoostingRegressor(n_estimators=100, learning_rate=0.05, max_depth=4, random_state=42)
+    model.fit(X, y)
+    importance = dict(zip(features, model.feature_importances_))
+
+    representatives = [
+        max((f for f, c in zip(features, clusters) if c == cluster), key=importance.get)
+        for cluster in np.unique(clusters)
+    ]
+    representatives.sort(key=importance.get, reverse=True)
+
+    # Potatura: si tengono le feature fino a coprire `coverage` dell'importanza dei rappresentanti
+    total = sum(importance[f] for f in representatives) or 1.0
+    pruned, covered = [], 0.0
+    for feature in representatives:
+        if covered >= coverage and len(pruned) >= min_features:
+            break
+        pruned.append(feature)
+        covered += importance[feature] / total
+
+    frame = pd.DataFrame(X, columns=features)
+    target = pd.Series(y)
+
+    def cv_rmse(subset):
+        cv_results = cross_validate_model(frame, subset, target, k=TUNING_CV_FOLDS)
+        return cv_results['avg_scores']['rmse'] if cv_results else None
+
+    baseline = cv_rmse(features)
+    selected, selected_rmse = features, baseline
+    for candidate in (pruned, representatives):
+        rmse = cv_rmse(candidate)
+        if baseline is not None and rmse is not None and rmse <= baseline * (1 + tolerance):
+            selected, selected_rmse = candidate, rmse
+            break
+
+    # Ordine originale delle feature, per matrici stabili tra i simboli
+    selected = [f for f in features if f in selected]
+    return ensure_python_types({
+        'selected_features': selected,
+        'feature_selection': {
+            'features_before': len(features),
+            'features_after': len(selected),
+            'clusters': len(representatives),
+            'cv_rmse_full': baseline,
+            'cv_rmse_selected': selected_rmse,
+            'dropped': [f for f in features if f not in selected],
+            'computed_at': datetime.now().isoformat()
+        }
+    })
+
+def run_feature_selection_job(symbols, bot="bot2"):
+    """
+    Calcola e salva la selezione delle feature per ogni simbolo. Le feature
+    scelte dalla maggioranza dei simboli diventano la selezione condivisa.
+    """
+    with _feature_selection_lock:
+        _feature_selection_state.update({
+            'running': True,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'total': len(symbols),
+            'completed': 0,
+            'errors': 0
+        })
+
+    votes = {}
+    try:
+        for symbol in symbols:
+            try:
+                data = fetch_training_data(symbol, bot)
+                if data is None:
+                    raise ValueError("dati non disponibili")
+                selection = select_features(data, bot)
+                update_model_meta(symbol, bot, **selection)
+                for feature in selection['selected_features']:
+                    votes[feature] = votes.get(feature, 0) + 1
+                print(f"Feature selection {symbol} ({bot}): "
+                      f"{selection['feature_selection']['features_before']} -> {selection['feature_selection']['features_after']}")
+                with _feature_selection_lock:
+                    _feature_selection_state['completed'] += 1
+            except Exception as e:
+                print(f"Feature selection failed for {symbol} ({bot}): {e}")
+                with _feature_selection_lock:
+                    _feature_selection_state['errors'] += 1
+
+        with _feature_selection_lock:
+            completed = _feature_selection_state['completed']
+        if completed:
+            full = BOT1_FEATURES if bot == "bot1" else BOT2_FEATURES
+            shared = [f for f in full if votes.get(f, 0) * 2 >= completed]
+            update_model_meta(FEATURE_SELECTION_DEFAULT_KEY, bot, selected_features=shared,
+                              symbols=completed, computed_at=datetime.now().isoformat())
+    finally:
+        with _feature_selection_lock:
+            _feature_selection_state['running'] = False
+            _feature_selection_state['finished_at'] = datetime.now().isoformat()
+
+    return dict(_feature_selection_state)
+
+def get_model_diagnostics(symbol, bot="bot1"):
+    """Diagnostica salvata nel registro, con l'indicazione se il modello è cambiato nel frattempo."""
+    diagnostics = load_model_meta(symbol, bot).get('diagnostics')
+    if not diagnostics:
+        return None
+    diagnostics['stale'] = diagnostics.get('model_version') != get_model_version(symbol, bot)
+    return diagnostics
+
+# Global cross-asset model (Bot 1)
+GLOBAL_MODEL_KEY = 'global'
+GLOBAL_CATEGORICAL_FEATURES = ['symbol_bucket']
+GLOBAL_ASSET_FEATURES = ['asset_natr_mean', 'asset_log_dollar_volume']
+GLOBAL_FEATURES_VERSION = 2  # Normalizzazione su finestra mobile (la 1 usava media e deviazione dell'intera serie)
+
+_global_model = {'model': None, 'features': [], 'loaded': False}
+_global_model_lock = threading.Lock()
+_global_training_state = {
+    'running': False,
+    'started_at': None,
+    'finished_at': None,
+    'symbols': 0,
+    'rows': 0,
+    'iterations': 0,
+    'incremental': False
+}
+
+def get_symbol_bucket(symbol):
+    """Codice categoriale stabile del simbolo (hash nei bucket supportati)."""
+    return zlib.crc32(symbol.encode()) % GLOBAL_SYMBOL_BUCKETS
+
+def build_global_features(data, symbol):
+    """
+    Normalizza le feature di un asset per il modello globale: z-score per simbolo
+    (rende confrontabili indicatori espressi in prezzo) più descrittori dell'asset
+    e il bucket categoriale del simbolo. Media e deviazione sono calcolate solo
+    sulle GLOBAL_ZSCORE_WINDOW candele fino alla riga corrente, così le righe di
+    addestramento non vedono dati futuri; le prime GLOBAL_ZSCORE_MIN_PERIODS - 1
+    righe restano senza statistiche (vedi train_global_model).
+    """
+    features = [f for f in BOT1_FEATURES if f in data.columns]
+    values = data[features]
+    window = values.rolling(window=GLOBAL_ZSCORE_WINDOW, min_periods=GLOBAL_ZSCORE_MIN_PERIODS)
+    std = window.std().replace(0, 1.0)
+    normalised = ((values - window.mean()) / std).fillna(0)
+
+    trailing = lambda series: series.rolling(window=GLOBAL_ZSCORE_WINDOW, min_periods=1).mean()
+    normalised['asset_natr_mean'] = trailing(data['NATR']).values if 'NATR' in data.columns else 0.0
+    normalised['asset_log_dollar_volume'] = np.log1p(trailing(data['close'] * data['volume'])).values
+    normalised['symbol_bucket'] = get_symbol_bucket(symbol)
+    return normalised
+
+def get_global_model():
+    """Restituisce il modello globale in memoria (caricato dal disco al primo uso)."""
+    with _global_model_lock:
+        if not _global_model['loaded']:
+            model, features = load_cached_model(GLOBAL_MODEL_KEY, "bot1")
+            if load_model_meta(GLOBAL_MODEL_KEY, "bot1").get('features_version') != GLOBAL_FEATURES_VERSION:
+                # Modello addestrato con un'altra normalizzazione: va riaddestrato da zero
+                model, features = None, []
+            _global_model.update({'model': model, 'features': features, 'loaded': True})
+        return _global_model['model'], _global_model['features']
+
+def train_global_model(symbols, incremental=True):
+    """
+    Addestra un unico modello sulle feature normalizzate di tutti gli asset.
+    In modalità incrementale continua il boosting del modello esistente
+    aggiungendo GLOBAL_MODEL_INCREMENT alberi sui dati più recenti, finché il
+    totale non supera GLOBAL_MODEL_ITER_CAP: allora riparte da zero.
+    """
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    with _global_model_lock:
+        _global_training_state.update({
+            'running': True,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None
+        })
+
+    try:
+        frames = []
+        with ThreadPoolExecutor(max_workers=min(NUM_CORES, 8)) as executor:
+            futures = {executor.submit(fetch_training_data, symbol, "bot1"): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    print(f"Global model: error fetching {symbol}: {e}")
+                    continue
+                if data is None or len(data) < GLOBAL_ZSCORE_MIN_PERIODS + 50:
+                    continue
+                features = build_global_features(data, symbol)
+                features['target'] = data['close'].pct_change(1).shift(-1).values
+                # Solo righe con statistiche dello z-score complete
+                frames.append(features.iloc[GLOBAL_ZSCORE_MIN_PERIODS - 1:-1])
+
+        if not frames:
+            print("Global model: nessun dato disponibile")
+            return None
+
+        pooled = pd.concat(frames, ignore_index=True)
+        feature_names = [c for c in pooled.columns if c != 'target']
+        X = pooled[feature_names].values
+        y = pooled['target'].values
+        categorical_mask = [f in GLOBAL_CATEGORICAL_FEATURES for f in feature_names]
+
+        current, cached_features = get_global_model()
+        warm = (incremental and current is not None and cached_features == feature_names
+                and current.max_iter + GLOBAL_MODEL_INCREMENT <= GLOBAL_MODEL_ITER_CAP)
+        if incremental and current is not None and not warm:
+            print("Global model: riaddestramento completo (feature cambiate o limite di alberi raggiunto)")
+        if warm:
+            # Warm start su una copia: lo scanner continua a usare il modello corrente
+            # finché la copia non viene sostituita sotto lock
+            model = copy.deepcopy(current)
+            model.set_params(max_iter=model.max_iter + GLOBAL_MODEL_INCREMENT, warm_start=True)
+        else:
+            model = HistGradientBoostingRegressor(
+                max_iter=GLOBAL_MODEL_MAX_ITER,
+                learning_rate=0.05,
+                max_depth=6,
+                l2_regularization=1.0,
+                categorical_features=categorical_mask,
+                early_stopping=False,
+                random_state=42
+            )
+        model.fit(X, y)
+
+        cache_model(model, GLOBAL_MODEL_KEY, "bot1", feature_names)
+        update_model_meta(
+            GLOBAL_MODEL_KEY, "bot1",
+            symbols=len(frames),
+            rows=len(pooled),
+            iterations=int(model.n_iter_),
+            features_version=GLOBAL_FEATURES_VERSION,
+            timestamp=datetime.now().isoformat()
+        )
+        with _global_model_lock:
+            _global_model.update({'model': model, 'features': feature_names, 'loaded': True})
+            _global_training_state.update({
+                'symbols': len(frames),
+                'rows': len(pooled),
+                'iterations': int(model.n_iter_),
+                'incremental': warm
+            })
+
+        print(f"Global model trained on {len(frames)} symbols, {len(pooled)} rows ({'incremental' if warm else 'full'})")
+        return model
+    finally:
+        with _global_model_lock:
+            _global_training_state['running'] = False
+            _global_training_state['finished_at'] = datetime.now().isoformat()
+
+def forecast_global_bot1(data, symbol):
+    """
+    Previsione Bot 1 dal modello globale, senza addestramento per simbolo.
+    Restituisce None se il modello globale non è disponibile.
+    """
+    model, feature_names = get_global_model()
+    if model is None:
+        return None
+    features = build_global_features(data, symbol)
+    if any(f not in features.columns for f in feature_names):
+        return None
+    latest_features = features[feature_names].values[-48:]
+    predictions = model.predict(latest_features)
+    return data['close'].iloc[-1] * (1 + predictions)
+
 # Funzione per analizzare un asset in parallelo con filtri di qualità
-def analyze_asset_parallel(symbol, forecast_threshold, include_negative, quality_filter=True):
+def analyze_asset_parallel(symbol, forecast_threshold, include_negative, quality_filter=True, model_mode=MODEL_MODE, token=None):
     """
     Analizza un asset in parallelo con filtri di qualità.
+    Il token viene controllato tra download, indicatori e addestramento.
     """
     try:
+        if token is not None:
+            token.check()
         print(f"Processing {symbol}...")
-        data = fetch_market_data(symbol)
+        features = get_model_features(symbol, "bot1")
+        data = fetch_market_data(symbol, limit=get_fetch_limit(features, "bot1"))
         if data is None or data.empty:
             print(f"No data for {symbol}")
             return None
 
-        data = calculate_indicators_bot1(data)
+        if token is not None:
+            token.check()
+        data = calculate_indicators_bot1(data, features)
         if data.empty:
             print(f"No indicators for {symbol}")
             return None
+        record_symbol_memory(symbol, data)
         
         # Variabili per filtri di qualità
         has_adx_trend = False
@@ -1042,11 +2953,25 @@ def analyze_asset_parallel(symbol, forecast_threshold, include_negative, quality
                 print(f"Asset {symbol} non supera i filtri di qualità")
                 return None
         
-        forecast = train_and_forecast_bot1(data, symbol)
+        if token is not None:
+            token.check()
+        forecast = forecast_global_bot1(data, symbol) if model_mode == 'global' else None
+        model_key = GLOBAL_MODEL_KEY
+        if forecast is None:
+            forecast = train_and_forecast_bot1(data, symbol)
+            model_key = symbol
         forecast_change = (forecast.mean() - data['close'].iloc[-1]) / data['close'].iloc[-1]
         
         # Include asset se è sopra la soglia positiva O se include_negative è true e il trend è negativo
-        if forecast_change > forecast_threshold or (include_negative and forecast_change < -forecast_threshold):
+        selected = forecast_change > forecast_threshold or (include_negative and forecast_change < -forecast_threshold)
+        decision = evaluate_decisions(data.iloc[-3:], forecast_gain=forecast_change)[-1] if selected else None
+        # Tutte le previsioni vanno nell'archivio, anche quelle sotto soglia
+        record_forecast(
+            'scanner', symbol, DEFAULT_TIMEFRAME, data, forecast_change, BOT1_FORECAST_HORIZON,
+            'global' if model_key == GLOBAL_MODEL_KEY else 'bot1', get_model_version(model_key, "bot1"),
+            DECISION_CODES[decision] if selected else None
+        )
+        if selected:
             # Aggiunti più indicatori nei risultati
             asset_details = {
                 'symbol': symbol,
@@ -1062,14 +2987,1297 @@ def analyze_asset_parallel(symbol, forecast_threshold, include_negative, quality
                 'hasAdxTrend': has_adx_trend if quality_filter else None,
                 'hasRsiSignal': has_rsi_signal if quality_filter else None,
                 'hasVolumeSignal': has_volume_signal if quality_filter else None,
+                'decisionCode': DECISION_CODES[decision],
             }
             return asset_details
         return None
+    except OperationCancelled:
+        print(f"Analysis of {symbol} cancelled")
+        return None
     except Exception as e:
         print(f"Error analyzing {symbol}: {e}")
         return None
 
-@app.route('/api/market-analysis', methods=['POST'])
+# Portfolio optimiser
+ALLOCATION_METHODS = ('heuristic', 'mean_variance', 'risk_parity', 'max_sharpe')
+
+def build_covariance_matrix(price_series, horizon=1, shrinkage=COVARIANCE_SHRINKAGE):
+    """
+    Matrice di covarianza dei rendimenti sull'orizzonte di previsione, dalle
+    serie di chiusura (indicizzate per timestamp) allineate sulle date comuni.
+    Lo shrinkage verso la diagonale stabilizza la stima con poche osservazioni.
+    """
+    closes = pd.concat(price_series, axis=1, join='inner')
+    returns = closes.pct_change().dropna().values
+    if len(returns) < 2:
+        raise ValueError("Storico comune insufficiente per la covarianza")
+    cov = np.cov(returns, rowvar=False) * horizon
+    return (1 - shrinkage) * cov + shrinkage * np.diag(np.diag(cov))
+
+def optimise_portfolio(expected_returns, cov, method='mean_variance',
+                       max_weight=DEFAULT_MAX_ASSET_WEIGHT, risk_aversion=DEFAULT_RISK_AVERSION):
+    """
+    Pesi long-only (somma 1, ciascuno <= max_weight) secondo il metodo scelto:
+    - mean_variance: massimizza mu'w - (lambda/2) w'Sw
+    - max_sharpe: massimizza mu'w / sqrt(w'Sw)
+    - risk_parity: contributi al rischio uguali tra gli asset
+    Obiettivi e gradienti sono vettoriali, risolti con SLSQP.
+    """
+    from scipy.optimize import minimize
+
+    mu = np.asarray(expected_returns, dtype=np.float64)
+    cov = np.asarray(cov, dtype=np.float64)
+    n = len(mu)
+    cap = max(max_weight, 1.0 / n)  # Vincolo sempre ammissibile
+
+    if method == 'max_sharpe' and not np.any(mu > 0):
+        # Nessun rendimento atteso positivo: lo Sharpe massimo non è definito
+        method = 'risk_parity'
+
+    if method == 'mean_variance':
+        def objective(w):
+            cov_w = cov @ w
+            return -(mu @ w) + 0.5 * risk_aversion * (w @ cov_w), -mu + risk_aversion * cov_w
+    elif method == 'max_sharpe':
+        def objective(w):
+            cov_w = cov @ w
+            variance = max(w @ cov_w, 1e-16)
+            volatility = np.sqrt(variance)
+            ret = mu @ w
+            return -ret / volatility, -(mu / volatility - ret * cov_w / (volatility * variance))
+    elif method == 'risk_parity':
+        # Scala costante (varianza equipesata) per rendere l'obiettivo ben condizionato
+        scale = 1.0 / max(cov.sum() / n ** 2, 1e-16)
+
+        def objective(w):
+            cov_w = cov @ w
+            contributions = w * cov_w
+            diff = contributions - contributions.mean()
+            # d(contrib_i)/dw = diag(cov_w) + w_i * cov; il termine della media si annulla (diff centrato)
+            jacobian = np.diag(cov_w) + w[:, None] * cov
+            return scale * (diff @ diff), scale * 2 * (jacobian.T @ diff)
+    else:
+        raise ValueError(f"Metodo di allocazione non supportato: {method}")
+
+    result = minimize(
+        objective,
+        np.full(n, 1.0 / n),
+        jac=True,
+        method='SLSQP',
+        bounds=[(0.0, cap)] * n,
+        constraints=[{'type': 'eq', 'fun': lambda w: w.sum() - 1.0, 'jac': lambda w: np.ones(n)}],
+        options={'maxiter': 200, 'ftol': 1e-10}
+    )
+
+    weights = np.clip(result.x, 0.0, cap)
+    weights = weights / weights.sum()
+    volatility = float(np.sqrt(weights @ cov @ weights))
+    expected = float(mu @ weights)
+    return {
+        'method': method,
+        'weights': weights,
+        'expected_return': expected,
+        'volatility': volatility,
+        'sharpe': expected / volatility if volatility > 0 else 0.0,
+        'converged': bool(result.success)
+    }
+
+# Profili di rischio per utente
+# Stessi campi del RiskControlPanel del frontend (percentuali in punti: 2.0 = 2%)
+DEFAULT_RISK_PROFILE = {
+    'maxRiskPerTrade': 1.0,  # % del capitale rischiata per trade
+    'stopLossType': 'fixed',
+    'stopLossPercentage': 2.0,
+    'takeProfitRatio': DEFAULT_RISK_REWARD_RATIO,
+    'enableTrailingStop': False,
+    'trailingStopPercentage': 1.0,
+    'maxOpenPositions': 3,
+    'enableHedging': False,
+    'atrMultiplier': DEFAULT_ATR_MULTIPLIER,
+    'varConfidence': RISK_VAR_CONFIDENCE,
+    'horizonDays': RISK_HORIZON_DAYS,
+    'maxExposure': 100.0,  # Esposizione lorda massima in % del capitale
+    'maxAssetExposure': DEFAULT_MAX_ASSET_WEIGHT * 100  # Esposizione massima per asset in % del capitale
+}
+STOP_LOSS_TYPES = ('fixed', 'atr')
+
+def normalise_risk_profile(profile):
+    """
+    Profilo completo e tipizzato a partire da quello inviato dal client
+    (i campi mancanti prendono i default). Solleva ValueError sui valori non validi.
+    I flag booleani accettano solo true/false JSON (es. "false" non è valido).
+    """
+    if profile is not None and not isinstance(profile, dict):
+        raise ValueError("Profilo di rischio non valido: atteso un oggetto")
+    profile = {**DEFAULT_RISK_PROFILE, **(profile or {})}
+    for key, default in DEFAULT_RISK_PROFILE.items():
+        if isinstance(default, bool) and not isinstance(profile[key], bool):
+            raise ValueError(f"Valore non valido per {key}: {profile[key]} (atteso true/false)")
+    try:
+        normalised = {
+            key: profile[key] if isinstance(default, bool)
+            else int(profile[key]) if isinstance(default, int)
+            else str(profile[key]) if isinstance(default, str)
+            else float(profile[key])
+            for key, default in DEFAULT_RISK_PROFILE.items()
+        }
+    except (TypeError, ValueError):
+        raise ValueError("Profilo di rischio non valido: valori non numerici")
+
+    checks = [
+        ('stopLossType', normalised['stopLossType'] in STOP_LOSS_TYPES),
+        ('maxRiskPerTrade', 0 < normalised['maxRiskPerTrade'] <= 100),
+        ('varConfidence', 0.5 <= normalised['varConfidence'] < 1),
+        ('horizonDays', normalised['horizonDays'] >= 1),
+        ('maxOpenPositions', normalised['maxOpenPositions'] >= 0)
+    ] + [
+        (key, normalised[key] > 0)
+        for key in ('stopLossPercentage', 'takeProfitRatio', 'trailingStopPercentage',
+                    'atrMultiplier', 'maxExposure', 'maxAssetExposure')
+    ]
+    for key, valid in checks:
+        if not valid:
+            raise ValueError(f"Valore non valido per {key}: {profile[key]}")
+    return normalised
+
+def load_risk_market_data(symbols, timeframe, limit):
+    """
+    Chiusure (indicizzate per timestamp) e ultimo ATR per simbolo, dallo store
+    delle candele: un solo fetch per simbolo anche con molti utenti.
+    """
+    def load(symbol):
+        market_data = fetch_market_data(symbol, timeframe=timeframe, limit=limit)
+        if market_data is None or len(market_data) < 2:
+            return symbol, None
+        atr = compute_indicators(market_data, ['ATR'])['ATR'].iloc[-1]
+        return symbol, (pd.Series(market_data['close'].values, index=market_data['timestamp'].values), float(atr))
+
+    with ThreadPoolExecutor(max_workers=min(NUM_CORES, 8)) as executor:
+        return {symbol: value for symbol, value in executor.map(load, symbols) if value is not None}
+
+def evaluate_risk_profiles(users, timeframe='1d', limit=RISK_HISTORY_LIMIT):
+    """
+    Valuta in una sola passata i profili di rischio di più utenti.
+    `users` è una lista di {'user_id', 'profile', 'portfolio'} con portfolio
+    {'capital', 'positions': [{'symbol', 'quantity', 'side'}], 'candidates': [simboli]}.
+
+    - VaR/CVaR: simulazione storica sui rendimenti dell'orizzonte; il P&L di
+      tutti i portafogli è il prodotto rendimenti (scenari x simboli) per
+      esposizioni (simboli x utenti)
+    - sizing dei candidati: rischio per trade / distanza dello stop (ATR o
+      percentuale), limitato dall'esposizione residua per asset e totale
+    - limiti: esposizione lorda, per asset, posizioni aperte e short senza hedging
+    """
+    parsed = []
+    for index, user in enumerate(users):
+        if not isinstance(user, dict):
+            raise ValueError(f"Profilo {index} non valido: atteso un oggetto")
+        user_id = user.get('user_id', index)
+        portfolio = user.get('portfolio') or {}
+        if not isinstance(portfolio, dict):
+            raise ValueError(f"Portafoglio non valido per l'utente {user_id}")
+        capital = float(portfolio.get('capital', 0))
+        if capital <= 0:
+            raise ValueError(f"Capitale non valido per l'utente {user_id}")
+        raw_positions = portfolio.get('positions', [])
+        candidates = portfolio.get('candidates', [])
+        if not isinstance(raw_positions, list) or not all(isinstance(p, dict) for p in raw_positions):
+            raise ValueError(f"Posizioni non valide per l'utente {user_id}: attesa una lista di oggetti")
+        if not isinstance(candidates, list) or not all(isinstance(s, str) for s in candidates):
+            raise ValueError(f"Candidati non validi per l'utente {user_id}: attesa una lista di simboli")
+        positions = []
+        for position in raw_positions:
+            side = position.get('side', 'long')
+            if side not in ('long', 'short'):
+                raise ValueError(f"Lato non valido per {position['symbol']}: {side}")
+            positions.append((position['symbol'], abs(float(position['quantity'])) * (-1 if side == 'short' else 1)))
+        parsed.append({
+            'user_id': user_id,
+            'profile': normalise_risk_profile(user.get('profile')),
+            'capital': capital,
+            'positions': positions,
+            'candidates': candidates
+        })
+
+    symbols = sorted({s for u in parsed for s, _ in u['positions']} | {s for u in parsed for s in u['candidates']})
+    market = load_risk_market_data(symbols, timeframe, limit)
+    available = [s for s in symbols if s in market]
+    column = {s: j for j, s in enumerate(available)}
+    n_users, n_symbols = len(parsed), len(available)
+
+    prices = np.array([market[s][0].iloc[-1] for s in available], dtype=np.float64)
+    atr = np.array([market[s][1] for s in available], dtype=np.float64)
+    closes = pd.concat([market[s][0] for s in available], axis=1, join='inner').values if available else np.empty((0, 0))
+    profiles = {key: np.array([u['profile'][key] for u in parsed]) for key in DEFAULT_RISK_PROFILE}
+    capital = np.array([u['capital'] for u in parsed], dtype=np.float64)
+
+    # Matrici utenti x simboli: quantità con segno (short negativi) e candidati
+    quantities = np.zeros((n_users, n_symbols))
+    candidates = np.zeros((n_users, n_symbols), dtype=bool)
+    for i, user in enumerate(parsed):
+        for symbol, quantity in user['positions']:
+            if symbol in column:
+                quantities[i, column[symbol]] += quantity
+        for symbol in user['candidates']:
+            if symbol in column:
+                candidates[i, column[symbol]] = True
+    exposure = quantities * prices
+    gross = np.abs(exposure).sum(axis=1)
+    asset_pct = np.abs(exposure) / capital[:, None] * 100
+    open_positions = (quantities != 0).sum(axis=1)
+    available_exposure = np.maximum(capital * profiles['maxExposure'] / 100 - gross, 0)
+    remaining_slots = np.maximum(profiles['maxOpenPositions'] - open_positions, 0)
+
+    # VaR/CVaR storici, un prodotto matriciale per ogni orizzonte distinto
+    var = np.full(n_users, np.nan)
+    cvar = np.full(n_users, np.nan)
+    contribution = np.zeros((n_users, n_symbols))
+    scenarios = np.zeros(n_users, dtype=int)
+    for horizon in np.unique(profiles['horizonDays']):
+        if n_symbols == 0 or len(closes) <= horizon:
+            continue
+        rows = np.flatnonzero(profiles['horizonDays'] == horizon)
+        cols = np.arange(len(rows))
+        returns = closes[horizon:] / closes[:-horizon] - 1
+        pnl = returns @ exposure[rows].T
+        order = np.argsort(pnl, axis=0)
+        ranked = np.take_along_axis(pnl, order, axis=0)
+        tail = np.maximum(np.floor((1 - profiles['varConfidence'][rows]) * len(pnl)).astype(int), 1)
+        var[rows] = -ranked[tail - 1, cols]
+        cvar[rows] = -np.cumsum(ranked, axis=0)[tail - 1, cols] / tail
+        # Contributo di ogni posizione alla perdita nello scenario del VaR
+        contribution[rows] = -returns[order[tail - 1, cols]] * exposure[rows]
+        scenarios[rows] = len(pnl)
+
+    # Stop (ATR o percentuale), take profit e sizing per ogni coppia utente/simbolo
+    use_atr = (profiles['stopLossType'] == 'atr')[:, None] & np.isfinite(atr)[None, :]
+    stop_distance = np.where(
+        use_atr,
+        atr[None, :] * profiles['atrMultiplier'][:, None],
+        prices[None, :] * profiles['stopLossPercentage'][:, None] / 100
+    )
+    take_distance = stop_distance * profiles['takeProfitRatio'][:, None]
+    trailing_distance = prices[None, :] * profiles['trailingStopPercentage'][:, None] / 100
+    risk_amount = capital * profiles['maxRiskPerTrade'] / 100
+    asset_room = np.maximum(capital[:, None] * profiles['maxAssetExposure'][:, None] / 100 - np.abs(exposure), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        size = np.minimum(risk_amount[:, None] / stop_distance,
+                          np.minimum(asset_room, available_exposure[:, None]) / prices[None, :])
+    # Nuove posizioni solo se restano slot liberi; gli incrementi di posizioni aperte sono sempre ammessi
+    allowed = candidates & ((quantities != 0) | (remaining_slots[:, None] > 0))
+    size = np.where(allowed & np.isfinite(size), size, 0.0)
+
+    results = []
+    for i, user in enumerate(parsed):
+        profile = user['profile']
+        breaches = []
+        if gross[i] > capital[i] * profile['maxExposure'] / 100:
+            breaches.append({'limit': 'maxExposure', 'value': gross[i] / capital[i] * 100, 'max': profile['maxExposure']})
+        if open_positions[i] > profile['maxOpenPositions']:
+            breaches.append({'limit': 'maxOpenPositions', 'value': open_positions[i], 'max': profile['maxOpenPositions']})
+        for j in np.flatnonzero(asset_pct[i] > profile['maxAssetExposure']):
+            breaches.append({'limit': 'maxAssetExposure', 'symbol': available[j], 'value': asset_pct[i, j],
+                             'max': profile['maxAssetExposure']})
+        shorts = [available[j] for j in np.flatnonzero(quantities[i] < 0)]
+        if shorts and not profile['enableHedging']:
+            breaches.append({'limit': 'enableHedging', 'symbols': shorts})
+
+        positions = []
+        for j in np.flatnonzero(quantities[i]):
+            side = 1 if quantities[i, j] > 0 else -1
+            positions.append({
+                'symbol': available[j],
+                'side': 'long' if side > 0 else 'short',
+                'quantity': abs(quantities[i, j]),
+                'price': prices[j],
+                'value': exposure[i, j],
+                'exposurePct': asset_pct[i, j],
+                'stopLoss': max(prices[j] - side * stop_distance[i, j], 0.0),
+                'takeProfit': max(prices[j] + side * take_distance[i, j], 0.0),
+                'trailingStop': max(prices[j] - side * trailing_distance[i, j], 0.0) if profile['enableTrailingStop'] else None,
+                'varContribution': contribution[i, j]
+            })
+
+        sizing = []
+        for j in np.flatnonzero(candidates[i]):
+            entry = {
+                'symbol': available[j],
+                'price': prices[j],
+                'atr': atr[j],
+                'stopType': 'atr' if use_atr[i, j] else 'fixed',
+                'stopDistance': stop_distance[i, j],
+                'stopLoss': max(prices[j] - stop_distance[i, j], 0.0),
+                'takeProfit': prices[j] + take_distance[i, j],
+                'trailingStop': max(prices[j] - trailing_distance[i, j], 0.0) if profile['enableTrailingStop'] else None,
+                'quantity': size[i, j],
+                'investment': size[i, j] * prices[j],
+                'riskAmount': size[i, j] * stop_distance[i, j],
+                'allowed': bool(allowed[i, j])
+            }
+            if profile['enableHedging']:
+                entry['shortStopLoss'] = prices[j] + stop_distance[i, j]
+                entry['shortTakeProfit'] = max(prices[j] - take_distance[i, j], 0.0)
+            sizing.append(entry)
+
+        results.append({
+            'user_id': user['user_id'],
+            'profile': profile,
+            'capital': capital[i],
+            'portfolio': {
+                'value': exposure[i].sum(),
+                'grossExposurePct': gross[i] / capital[i] * 100,
+                'netExposurePct': exposure[i].sum() / capital[i] * 100,
+                'openPositions': open_positions[i],
+                'var': var[i] if scenarios[i] else None,
+                'cvar': cvar[i] if scenarios[i] else None,
+                'varPct': var[i] / capital[i] * 100 if scenarios[i] else None,
+                'cvarPct': cvar[i] / capital[i] * 100 if scenarios[i] else None,
+                'confidence': profile['varConfidence'],
+                'horizonDays': profile['horizonDays'],
+                'scenarios': scenarios[i]
+            },
+            'limits': {
+                'breaches': breaches,
+                'remainingPositions': remaining_slots[i],
+                'availableExposure': available_exposure[i],
+                'riskPerTrade': risk_amount[i]
+            },
+            'positions': positions,
+            'sizing': sizing
+        })
+
+    return {
+        'users': results,
+        'missing': [s for s in symbols if s not in market],
+        'timeframe': timeframe,
+        'history': len(closes)
+    }
+
+# Decision engine (tabella di regole vettoriale)
+# Ogni regola è (codice, lato, condizione): la prima condizione vera decide,
+# nello stesso ordine di priorità della catena storica di trading_analysis.
+DECISION_RULES = [
+    ('LONG_FORECAST_PATTERN', 1, lambda c: c['forecast_long'] & c['bullish_pattern']),
+    ('LONG_FORECAST', 1, lambda c: c['forecast_long']),
+    ('SHORT_FORECAST_PATTERN', -1, lambda c: c['forecast_short'] & c['bearish_pattern']),
+    ('SHORT_FORECAST', -1, lambda c: c['forecast_short']),
+    ('SHORT_RSI_OVERBOUGHT', -1, lambda c: (c['rsi'] > c['rsi_high']) & (c['macd'] < c['signal_line'])),
+    ('LONG_RSI_OVERSOLD', 1, lambda c: (c['rsi'] < c['rsi_low']) & (c['macd'] > c['signal_line'])),
+    ('HOLD_INSUFFICIENT_DATA', 0, lambda c: ~c['has_oscillators']),
+    ('LONG_RSI_DIVERGENCE', 1, lambda c: c['lower_low'] & (c['rsi'] > c['prev_rsi'])),
+    ('SHORT_RSI_DIVERGENCE', -1, lambda c: c['higher_high'] & (c['rsi'] < c['prev_rsi'])),
+    ('HOLD_NO_CLEAR_SIGNAL', 0, lambda c: (np.abs(c['forecast_gain']) < 0.01) | (c['sentiment'] == 0))
+]
+DECISION_DEFAULT = 'HOLD_NO_CHANGE'
+DECISION_INPUT_COLUMNS = ['open', 'high', 'low', 'close', 'RSI', 'MACD', 'Signal_Line', 'ADX']
+DECISION_CODES = [code for code, _, _ in DECISION_RULES] + [DECISION_DEFAULT]
+DECISION_SIDES = np.array([side for _, side, _ in DECISION_RULES] + [0], dtype=np.int8)
+
+# Testo delle decisioni, separato dai codici
+DECISION_TEXTS = {
+    'LONG_FORECAST_PATTERN': "COMPRARE (LONG): Previsione positiva con conferma pattern. Target a {take_profit_level:.2f} USDT, Stop Loss a {stop_loss_level:.2f} USDT",
+    'LONG_FORECAST': "COMPRARE (LONG): Previsione positiva. Target a {take_profit_level:.2f} USDT, Stop Loss a {stop_loss_level:.2f} USDT",
+    'SHORT_FORECAST_PATTERN': "VENDERE (SHORT): Perdita prevista con conferma pattern. Target a {short_target:.2f} USDT, Stop Loss a {short_stop:.2f} USDT",
+    'SHORT_FORECAST': "VENDERE (SHORT): Perdita prevista. Target a {short_target:.2f} USDT, Stop Loss a {short_stop:.2f} USDT",
+    'SHORT_RSI_OVERBOUGHT': "VENDERE (SHORT): RSI in ipercomprato ({rsi:.2f}) e MACD in inversione.",
+    'LONG_RSI_OVERSOLD': "COMPRARE (LONG): RSI in ipervenduto ({rsi:.2f}) e MACD in inversione. Target a {take_profit_level:.2f} USDT, Stop Loss a {stop_loss_level:.2f} USDT",
+    'HOLD_INSUFFICIENT_DATA': "MANTENERE O MONITORARE: Dati insufficienti per una decisione.",
+    'LONG_RSI_DIVERGENCE': "COMPRARE (LONG): Divergenza RSI rialzista rilevata. Target a {take_profit_level:.2f} USDT, Stop Loss a {stop_loss_level:.2f} USDT",
+    'SHORT_RSI_DIVERGENCE': "VENDERE (SHORT): Divergenza RSI ribassista rilevata. Target a {short_target:.2f} USDT, Stop Loss a {short_stop:.2f} USDT",
+    'HOLD_NO_CLEAR_SIGNAL': "MANTENERE O MONITORARE: Nessun segnale chiaro.",
+    'HOLD_NO_CHANGE': "MANTENERE O MONITORARE: Nessun segnale per cambiare posizione."
+}
+
+def build_decision_context(data, forecast_gain=None, sentiment=None, take_profit=DEFAULT_TAKE_PROFIT,
+                           stop_loss=DEFAULT_STOP_LOSS, adx_min=25, rsi_low=30, rsi_high=70):
+    """
+    Array di input delle regole per ogni candela. `data` può contenere più
+    asset (colonna 'symbol'): i valori precedenti vengono calcolati per simbolo.
+    `forecast_gain`, `sentiment` e le soglie possono essere scalari o array.
+    """
+    n = len(data)
+    groups = data['symbol'].values if 'symbol' in data.columns else None
+    has_oscillators = 'RSI' in data.columns and 'MACD' in data.columns
+    nan = np.full(n, np.nan)
+    close = data['close'].values.astype(np.float64)
+    rsi = data['RSI'].values.astype(np.float64) if 'RSI' in data.columns else nan
+    adx = data['ADX'].values.astype(np.float64) if 'ADX' in data.columns else nan
+    forecast_gain = np.broadcast_to(np.nan if forecast_gain is None else np.asarray(forecast_gain, dtype=np.float64), n)
+    prev_close = _lagged(close, 1, groups)
+    prev2_close = _lagged(close, 2, groups)
+    patterns = candlestick_pattern_arrays(data, groups)
+
+    return {
+        'rsi': rsi,
+        'prev_rsi': _lagged(rsi, 1, groups),
+        'macd': data['MACD'].values.astype(np.float64) if 'MACD' in data.columns else nan,
+        'signal_line': data['Signal_Line'].values.astype(np.float64) if 'Signal_Line' in data.columns else nan,
+        'forecast_gain': forecast_gain,
+        'forecast_long': (forecast_gain > take_profit) & (adx > adx_min),
+        'forecast_short': (forecast_gain < stop_loss) & (adx > adx_min),
+        'bullish_pattern': patterns['bullish_engulfing'] | patterns['hammer'],
+        'bearish_pattern': patterns['bearish_engulfing'] | patterns['shooting_star'],
+        'lower_low': (close < prev_close) & (prev_close < prev2_close),
+        'higher_high': (close > prev_close) & (prev_close > prev2_close),
+        'sentiment': np.broadcast_to(np.nan if sentiment is None else np.asarray(sentiment, dtype=np.float64), n),
+        'has_oscillators': np.full(n, has_oscillators),
+        'rsi_low': rsi_low,
+        'rsi_high': rsi_high
+    }
+
+def evaluate_decisions(data, **context_params):
+    """
+    Valuta la tabella di regole su tutte le candele (e tutti gli asset) in una
+    volta. Restituisce l'indice in DECISION_CODES per ogni riga.
+    """
+    context = build_decision_context(data, **context_params)
+    conditions = [np.asarray(rule(context), dtype=bool) for _, _, rule in DECISION_RULES]
+    return np.select(conditions, np.arange(len(DECISION_RULES)), len(DECISION_RULES)).astype(np.int8)
+
+def render_decision(code, **values):
+    """Testo italiano della decisione a partire dal codice strutturato."""
+    return DECISION_TEXTS[code].format(**values)
+
+# Trade simulator
+def generate_rule_signals(data, forecast_gain=None, take_profit=DEFAULT_TAKE_PROFIT, stop_loss=DEFAULT_STOP_LOSS,
+                          adx_min=25, rsi_low=30, rsi_high=70):
+    """
+    Segnali per ogni candela (+1 LONG, -1 SHORT, 0 nessuno) dalla tabella di
+    regole di trading_analysis. Le regole basate sulla previsione sono
+    applicate solo se viene passato `forecast_gain`.
+    """
+    decisions = evaluate_decisions(
+        data, forecast_gain=forecast_gain, take_profit=take_profit, stop_loss=stop_loss,
+        adx_min=adx_min, rsi_low=rsi_low, rsi_high=rsi_high
+    )
+    return DECISION_SIDES[decisions]
+
+def _future_windows(values, horizon):
+    """Matrice (N, horizon): la riga t contiene values[t+1 .. t+horizon] (NaN oltre la fine)."""
+    padded = np.concatenate([np.asarray(values, dtype=np.float64), np.full(horizon, np.nan)])
+    return np.lib.stride_tricks.sliding_window_view(padded[1:], horizon)[:len(values)]
+
+def validate_parameter_grid(grid, allowed):
+    """
+    Controlla una griglia {parametro: [valori]} ricevuta dal client: solo
+    parametri in `allowed`, ciascuno con una lista non vuota di numeri finiti.
+    Restituisce il numero di combinazioni; solleva ValueError altrimenti.
+    """
+    if not isinstance(grid, dict):
+        raise ValueError("La griglia deve essere un oggetto {parametro: [valori]}")
+    unknown = set(grid) - set(allowed)
+    if unknown:
+        raise ValueError(f"Parametri non supportati nella griglia: {sorted(unknown)}")
+    combinations = 1
+    for name, values in grid.items():
+        if (not isinstance(values, list) or not values
+                or not all(isinstance(v, (int, float)) and not isinstance(v, bool) and np.isfinite(v) for v in values)):
+            raise ValueError(f"Valori non validi per {name}: attesa una lista non vuota di numeri")
+        combinations *= len(values)
+    return combinations
+
+def expand_parameter_grid(grid):
+    """Prodotto cartesiano di una griglia {parametro: [valori]} in array per parametro."""
+    names = list(grid)
+    combos = np.array(list(itertools.product(*[grid[name] for name in names])), dtype=np.float64)
+    return {name: combos[:, i] for i, name in enumerate(names)}
+
+def simulate_trade_grid(close, high, low, atr, signals, grid, fee=DEFAULT_TRADING_FEE,
+                        slippage=DEFAULT_SLIPPAGE, max_holding=DEFAULT_MAX_HOLDING, periods_per_year=8760):
+    """
+    Simula in un unico passaggio vettoriale tutte le combinazioni della griglia
+    (stop_loss, take_profit, atr_multiplier, risk_reward_ratio) su un asset.
+    Ingresso alla chiusura della candela del segnale, uscita al primo tocco di
+    stop o target (stop prioritario se entrambi nella stessa candela) o dopo
+    `max_holding` candele. Una sola posizione aperta alla volta.
+    `signals` può essere (N,) oppure (C, N) se dipende dalla combinazione.
+    """
+    params = expand_parameter_grid({
+        'stop_loss': grid.get('stop_loss', [DEFAULT_STOP_LOSS]),
+        'take_profit': grid.get('take_profit', [DEFAULT_TAKE_PROFIT]),
+        'atr_multiplier': grid.get('atr_multiplier', [DEFAULT_ATR_MULTIPLIER]),
+        'risk_reward_ratio': grid.get('risk_reward_ratio', [DEFAULT_RISK_REWARD_RATIO])
+    })
+    n_combos = len(params['stop_loss'])
+    close = np.asarray(close, dtype=np.float64)
+    n_bars = len(close)
+    signals = np.broadcast_to(np.asarray(signals, dtype=np.int8), (n_combos, n_bars))
+
+    # Solo le candele con almeno un segnale (e almeno una candela successiva)
+    entry_idx = np.flatnonzero(signals.any(axis=0))
+    entry_idx = entry_idx[entry_idx < n_bars - 1]
+    empty = {'trades': 0, 'total_return': 0.0, 'pnl_pct': 0.0, 'max_drawdown': 0.0, 'win_rate': 0.0, 'sharpe': 0.0}
+    if len(entry_idx) == 0:
+        return [dict(empty, **{k: v[c] for k, v in params.items()}) for c in range(n_combos)]
+
+    side = signals[:, entry_idx]  # (C, E)
+    price = close[entry_idx][None, :]
+    entry_atr = np.asarray(atr, dtype=np.float64)[entry_idx][None, :]
+    sl = params['stop_loss'][:, None]
+    tp = params['take_profit'][:, None]
+    atr_mult = params['atr_multiplier'][:, None]
+    rr = params['risk_reward_ratio'][:, None]
+
+    # Livelli come in trading_analysis: il più conservativo tra ATR e percentuale (LONG)
+    pct_stop, pct_target = price * (1 + sl), price * (1 + tp)
+    long_stop = np.where(np.isnan(entry_atr), pct_stop, np.maximum(price - entry_atr * atr_mult, pct_stop))
+    long_target = np.where(np.isnan(entry_atr), pct_target, np.minimum(price + entry_atr * atr_mult * rr, pct_target))
+    is_long = side > 0
+    stop = np.where(is_long, long_stop, price * (1 - sl))
+    target = np.where(is_long, long_target, price * (1 - tp))
+
+    high_w = _future_windows(high, max_holding)[entry_idx][None]  # (1, E, H)
+    low_w = _future_windows(low, max_holding)[entry_idx][None]
+    close_w = _future_windows(close, max_holding)[entry_idx]
+
+    long_3d = is_long[:, :, None]
+    stop_hit = np.where(long_3d, low_w <= stop[:, :, None], high_w >= stop[:, :, None])
+    target_hit = np.where(long_3d, high_w >= target[:, :, None], low_w <= target[:, :, None])
+    first_stop = np.where(stop_hit.any(-1), stop_hit.argmax(-1), max_holding)
+    first_target = np.where(target_hit.any(-1), target_hit.argmax(-1), max_holding)
+
+    # Uscita a tempo sull'ultima candela disponibile della finestra
+    last_step = np.minimum(max_holding, n_bars - 1 - entry_idx) - 1  # (E,)
+    time_exit_price = close_w[np.arange(len(entry_idx)), last_step][None, :]
+    stopped = (first_stop <= first_target) & (first_stop <= last_step[None, :])
+    targeted = ~stopped & (first_target <= last_step[None, :])
+    exit_price = np.where(stopped, stop, np.where(targeted, target, time_exit_price))
+    exit_step = np.where(stopped, first_stop, np.where(targeted, first_target, last_step[None, :]))
+    exit_bar = entry_idx[None, :] + exit_step + 1
+
+    # Rendimento netto con slippage su entrambi i lati e commissioni
+    entry_eff = np.where(is_long, price * (1 + slippage), price * (1 - slippage))
+    exit_eff = np.where(is_long, exit_price * (1 - slippage), exit_price * (1 + slippage))
+    net = np.where(is_long, exit_eff / entry_eff - 1, 1 - exit_eff / entry_eff) - 2 * fee
+
+    # Concatenazione dei trade (una posizione alla volta), vettoriale sulle combinazioni
+    taken = np.zeros(side.shape, dtype=bool)
+    free_from = np.zeros(n_combos, dtype=np.int64)
+    for j, bar in enumerate(entry_idx):
+        take = (side[:, j] != 0) & (bar >= free_from)
+        taken[:, j] = take
+        free_from = np.where(take, exit_bar[:, j] + 1, free_from)
+
+    returns = np.where(taken, net, 0.0)
+    trades = taken.sum(axis=1)
+    equity = np.cumprod(1 + returns, axis=1)
+    peak = np.maximum.accumulate(np.concatenate([np.ones((n_combos, 1)), equity], axis=1), axis=1)[:, 1:]
+    max_drawdown = np.max(1 - equity / peak, axis=1)
+    safe_trades = np.maximum(trades, 1)
+    mean_ret = returns.sum(axis=1) / safe_trades
+    var_ret = np.where(taken, (returns - mean_ret[:, None]) ** 2, 0).sum(axis=1) / np.maximum(trades - 1, 1)
+    trades_per_year = trades * periods_per_year / n_bars
+    sharpe = np.where(var_ret > 0, mean_ret / np.sqrt(var_ret) * np.sqrt(trades_per_year), 0.0)
+
+    metrics = {
+        'trades': trades,
+        'total_return': equity[:, -1] - 1,
+        'pnl_pct': returns.sum(axis=1) * 100,
+        'max_drawdown': max_drawdown,
+        'win_rate': ((returns > 0) & taken).sum(axis=1) / safe_trades * 100,
+        'sharpe': sharpe
+    }
+    return [
+        ensure_python_types({**{k: v[c] for k, v in params.items()}, **{k: v[c] for k, v in metrics.items()}})
+        for c in range(n_combos)
+    ]
+
+# Parameter sweep (previsioni in cache, soglie come post-processing)
+SWEEP_SIGNAL_PARAMS = {
+    'forecast_threshold': [DEFAULT_FORECAST_THRESHOLD],
+    'adx_min': [25],
+    'rsi_low': [30],
+    'rsi_high': [70]
+}
+SWEEP_LEVEL_PARAMS = ('stop_loss', 'take_profit', 'atr_multiplier', 'risk_reward_ratio')
+SWEEP_CACHE_COLUMNS = ['timestamp', 'close', 'high', 'low', 'ATR', 'RSI', 'MACD', 'Signal_Line', 'ADX', 'forecast_change']
+
+def get_forecast_cache_path(symbol, timeframe, limit):
+    return os.path.join(SWEEP_CACHE_DIR, f"{symbol.replace('/', '_')}_{timeframe}_{limit}.pkl")
+
+def build_walk_forward_forecasts(data, symbol=None, folds=SWEEP_FORECAST_FOLDS):
+    """
+    Previsioni fuori campione della variazione a 1 passo (target di Bot 1):
+    ogni fold temporale è previsto da un modello addestrato solo sul passato.
+    Le candele del primo blocco di training restano senza previsione (NaN).
+    """
+    from sklearn.ensemble import GradientBoostingRegressor
+    X, y, _ = build_training_set(data, "bot1")
+    forecasts = np.full(len(data), np.nan)
+    params = gbr_params(symbol, "bot1", n_estimators=100, learning_rate=0.05, max_depth=4, random_state=42)
+    for train_idx, test_idx in get_cv_splits(len(X), k=folds, splitter='timeseries'):
+        model = GradientBoostingRegressor(**params)
+        model.fit(X[train_idx], y[train_idx])
+        forecasts[test_idx] = model.predict(X[test_idx])
+    return forecasts
+
+def load_forecast_cache(symbol, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT, refresh=False):
+    """
+    Previsioni walk-forward in cache su disco per (simbolo, timeframe, limit).
+    Vengono ricalcolate solo se il file manca o se `refresh` è True, quindi
+    cambiare la griglia delle soglie non riaddestra mai i modelli.
+    """
+    path = get_forecast_cache_path(symbol, timeframe, limit)
+    if not refresh and os.path.exists(path):
+        return pd.read_pickle(path)
+
+    data = fetch_market_data(symbol, timeframe=timeframe, limit=limit)
+    if data is None or data.empty:
+        return None
+    data = calculate_indicators_bot1(data)
+    if len(data) < SWEEP_FORECAST_FOLDS * 10:
+        return None
+
+    data['forecast_change'] = build_walk_forward_forecasts(data, symbol).astype(np.float32)
+    cache = data.loc[data['forecast_change'].notna(), SWEEP_CACHE_COLUMNS].reset_index(drop=True)
+    os.makedirs(SWEEP_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    cache.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Forecast cache built for {symbol} ({timeframe}, {len(cache)} candles)")
+    return cache
+
+def _sweep_symbol_worker(symbol, timeframe, limit, grid, fee, slippage, max_holding, refresh):
+    """Valuta tutta la griglia per un simbolo e restituisce i risultati per colonna."""
+    cache = load_forecast_cache(symbol, timeframe, limit, refresh)
+    if cache is None or cache.empty:
+        return symbol, None
+
+    periods_per_year = 365 * 86400 / timeframe_to_seconds(timeframe)
+    level_grid = {name: grid[name] for name in SWEEP_LEVEL_PARAMS if name in grid}
+    signal_grid = expand_parameter_grid({name: grid.get(name, values) for name, values in SWEEP_SIGNAL_PARAMS.items()})
+    columns = {}
+
+    for i in range(len(signal_grid['forecast_threshold'])):
+        signal_params = {name: values[i] for name, values in signal_grid.items()}
+        threshold = signal_params['forecast_threshold']
+        signals = generate_rule_signals(
+            cache, forecast_gain=cache['forecast_change'].values,
+            take_profit=threshold, stop_loss=-threshold,
+            adx_min=signal_params['adx_min'], rsi_low=signal_params['rsi_low'], rsi_high=signal_params['rsi_high']
+        )
+        rows = simulate_trade_grid(
+            cache['close'].values, cache['high'].values, cache['low'].values, cache['ATR'].values,
+            signals, level_grid, fee, slippage, max_holding, periods_per_year
+        )
+        for row in rows:
+            for name, value in {**signal_params, **row}.items():
+                columns.setdefault(name, []).append(value)
+
+    return symbol, columns
+
+def write_columnar(frame, base_path):
+    """Scrive un DataFrame in formato colonnare (Parquet, CSV se pyarrow non è installato)."""
+    try:
+        frame.to_parquet(f"{base_path}.parquet", index=False)
+        return f"{base_path}.parquet"
+    except ImportError:
+        print("pyarrow not installed, writing CSV")
+        frame.to_csv(f"{base_path}.csv", index=False)
+        return f"{base_path}.csv"
+
+def read_columnar(path):
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+
+def write_sweep_results(results):
+    """Scrive i risultati dello sweep in formato colonnare."""
+    os.makedirs(SWEEP_RESULTS_DIR, exist_ok=True)
+    return write_columnar(results, os.path.join(SWEEP_RESULTS_DIR, f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}"))
+
+def run_parameter_sweep(symbols, grid, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT,
+                        fee=DEFAULT_TRADING_FEE, slippage=DEFAULT_SLIPPAGE, max_holding=DEFAULT_MAX_HOLDING,
+                        refresh=False, max_workers=SWEEP_MAX_WORKERS):
+    """
+    Esegue lo sweep su tutti i simboli in un pool di processi e salva una riga
+    per (simbolo, combinazione). Restituisce il DataFrame e il percorso del file.
+    """
+    frames = []
+    errors = []
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {
+            pool.submit(_sweep_symbol_worker, symbol, timeframe, limit, grid, fee, slippage, max_holding, refresh): symbol
+            for symbol in symbols
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                _, columns = future.result()
+                if columns is None:
+                    errors.append(symbol)
+                    continue
+                frame = pd.DataFrame(columns)
+                frame.insert(0, 'symbol', symbol)
+                frames.append(frame)
+            except Exception as e:
+                print(f"Sweep failed for {symbol}: {e}")
+                errors.append(symbol)
+
+    if not frames:
+        return None, None, errors
+    results = pd.concat(frames, ignore_index=True)
+    return results, write_sweep_results(results), errors
+
+# Archivio dei risultati
+# Layout in RESULTS_WAREHOUSE_DIR:
+#   forecasts/part-*.parquet  previsioni (file parziali append-only, uno per scrittura e processo)
+#   outcomes/part-*.parquet   esiti realizzati, per forecast_id
+#   rollups.parquet           aggregati per giorno, sorgente, modello, versione, simbolo e timeframe
+#   models.parquet            metriche CV dal registro dei modelli
+RESULTS_TABLES = ('forecasts', 'outcomes')
+ROLLUP_KEYS = ['day', 'source', 'model', 'model_version', 'symbol', 'timeframe']
+ROLLUP_COUNTS = ['forecasts', 'resolved', 'hits', 'misses', 'neutral']
+ROLLUP_SUMS = ROLLUP_COUNTS + ['abs_error_sum', 'sq_error_sum', 'forecast_change_sum', 'realized_change_sum']
+
+_results_buffer = []
+_results_lock = threading.Lock()
+_results_last_flush = [time.time()]
+_results_snapshot_cache = {}
+_results_state = {
+    'running': False,
+    'started_at': None,
+    'finished_at': None,
+    'pending': 0,
+    'resolved': 0,
+    'expired': 0,
+    'rollup_rows': 0,
+    'error': None
+}
+_results_state_lock = threading.Lock()
+
+def record_forecast(source, symbol, timeframe, data, forecast_change, horizon, model, model_version, decision_code=None):
+    """
+    Aggiunge una previsione al buffer dell'archivio. Il buffer viene scritto
+    come nuovo file parziale ogni RESULTS_FLUSH_SIZE previsioni o
+    RESULTS_FLUSH_INTERVAL secondi, senza riscrivere i file esistenti.
+    """
+    record = {
+        'forecast_id': uuid.uuid4().hex,
+        'created_at': time.time(),
+        'source': source,
+        'model': model,
+        'model_version': model_version or 'none',
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'candle_ts': int(data['timestamp'].iloc[-1]),
+        'horizon': int(horizon),
+        'price': float(data['close'].iloc[-1]),
+        'forecast_change': float(forecast_change),
+        'decision_code': decision_code
+    }
+    with _results_lock:
+        _results_buffer.append(record)
+        due = (len(_results_buffer) >= RESULTS_FLUSH_SIZE
+               or time.time() - _results_last_flush[0] >= RESULTS_FLUSH_INTERVAL)
+    if due:
+        flush_forecasts()
+
+def flush_forecasts():
+    """Scrive le previsioni in memoria in un nuovo file parziale di forecasts/."""
+    with _results_lock:
+        records = list(_results_buffer)
+        _results_buffer.clear()
+        _results_last_flush[0] = time.time()
+    if not records:
+        return None
+    try:
+        return write_results_part('forecasts', pd.DataFrame(records))
+    except Exception as e:
+        print(f"Error writing forecasts to results warehouse: {e}")
+        return None
+
+atexit.register(flush_forecasts)
+
+def write_results_part(table, frame):
+    directory = os.path.join(RESULTS_WAREHOUSE_DIR, table)
+    os.makedirs(directory, exist_ok=True)
+    name = f"part-{datetime.now().strftime('%Y%m%d_%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    return write_columnar(frame, os.path.join(directory, name))
+
+def read_results_table(table):
+    """Legge tutti i file parziali di una tabella. Restituisce (DataFrame, percorsi letti)."""
+    import glob
+    paths = sorted(glob.glob(os.path.join(RESULTS_WAREHOUSE_DIR, table, 'part-*')))
+    frames = []
+    for path in paths:
+        try:
+            frames.append(read_columnar(path))
+        except Exception as e:
+            print(f"Skipping unreadable results file {path}: {e}")
+    return (pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()), paths
+
+def compact_results_table(table, frame, paths):
+    """Sostituisce i file parziali letti con un unico file (i nuovi file restano intatti)."""
+    if len(paths) < RESULTS_COMPACT_PARTS or frame.empty:
+        return
+    write_results_part(table, frame)
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def write_results_snapshot(name, frame):
+    """Riscrive una tabella aggregata in modo atomico (file temporaneo + os.replace)."""
+    os.makedirs(RESULTS_WAREHOUSE_DIR, exist_ok=True)
+    temp_path = write_columnar(frame, os.path.join(RESULTS_WAREHOUSE_DIR, f".{name}.{os.getpid()}.tmp"))
+    path = os.path.join(RESULTS_WAREHOUSE_DIR, name + os.path.splitext(temp_path)[1])
+    os.replace(temp_path, path)
+    return path
+
+def load_results_snapshot(name):
+    """Tabella aggregata in memoria, riletta solo quando il file cambia."""
+    for extension in ('.parquet', '.csv'):
+        path = os.path.join(RESULTS_WAREHOUSE_DIR, name + extension)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        cached = _results_snapshot_cache.get(name)
+        if cached is None or cached[0] != (path, mtime):
+            frame = read_columnar(path)
+            if name == 'rollups':
+                # Chiavi categoriali: filtri e groupby lavorano sui codici interi
+                frame = frame.astype({key: str for key in ROLLUP_KEYS}).astype({key: 'category' for key in ROLLUP_KEYS})
+            cached = ((path, mtime), frame)
+            _results_snapshot_cache[name] = cached
+        return cached[1]
+    return None
+
+def resolve_forecast_outcomes(forecasts, outcomes, now=None):
+    """
+    Esiti delle previsioni non ancora risolte la cui candela obiettivo
+    (candle_ts + horizon candele) è chiusa. Le candele vengono scaricate una
+    volta per (simbolo, timeframe); le previsioni più vecchie dello storico
+    disponibile vengono chiuse senza esito.
+    """
+    now_ms = (now or time.time()) * 1000
+    if forecasts.empty:
+        return pd.DataFrame()
+    pending = forecasts if outcomes.empty else forecasts[~forecasts['forecast_id'].isin(outcomes['forecast_id'])]
+    step = pending['timeframe'].map(lambda tf: timeframe_to_seconds(tf) * 1000)
+    target = pending['candle_ts'] + pending['horizon'] * step
+    pending = pending.assign(target_ts=target)[target + step <= now_ms]
+
+    frames = []
+    for (symbol, timeframe), group in pending.groupby(['symbol', 'timeframe']):
+        step = timeframe_to_seconds(timeframe) * 1000
+        limit = min(int((now_ms - group['candle_ts'].min()) // step) + 2, RESULTS_MAX_CANDLES)
+        market_data = fetch_market_data(symbol, timeframe=timeframe, limit=limit)
+        if market_data is None or market_data.empty:
+            continue
+        timestamps = market_data['timestamp'].values
+        # Le previsioni oltre l'ultima candela scaricata restano in attesa
+        group = group[group['target_ts'].values <= timestamps[-1]]
+        index = np.searchsorted(timestamps, group['target_ts'].values, side='right') - 1
+        expired = index < 0
+        realized_price = np.where(expired, np.nan, market_data['close'].values[np.maximum(index, 0)])
+        frames.append(pd.DataFrame({
+            'forecast_id': group['forecast_id'].values,
+            'resolved_at': now_ms / 1000,
+            'realized_price': realized_price,
+            'realized_change': realized_price / group['price'].values - 1
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def build_results_rollups(forecasts, outcomes):
+    """
+    Aggrega previsioni ed esiti per ROLLUP_KEYS. Si salvano somme e conteggi,
+    così le query possono riaggregare su qualsiasi sottoinsieme di chiavi.
+    """
+    if forecasts.empty:
+        return pd.DataFrame(columns=ROLLUP_KEYS + ROLLUP_SUMS)
+    if outcomes.empty:
+        merged = forecasts.assign(realized_change=np.nan)
+    else:
+        merged = forecasts.merge(outcomes[['forecast_id', 'realized_change']], on='forecast_id', how='left')
+
+    predicted = merged['forecast_change'].to_numpy(dtype=np.float64)
+    realized = merged['realized_change'].to_numpy(dtype=np.float64)
+    resolved = ~np.isnan(realized)
+    neutral = resolved & (np.abs(realized) < RESULTS_NEUTRAL_BAND)
+    hits = resolved & ~neutral & (np.sign(predicted) == np.sign(realized))
+    error = np.where(resolved, predicted - realized, 0.0)
+    frame = pd.DataFrame({
+        'day': pd.to_datetime(merged['created_at'], unit='s').dt.strftime('%Y-%m-%d'),
+        'source': merged['source'],
+        'model': merged['model'],
+        'model_version': merged['model_version'].fillna('none').astype(str),
+        'symbol': merged['symbol'],
+        'timeframe': merged['timeframe'],
+        'forecasts': 1,
+        'resolved': resolved.astype(int),
+        'hits': hits.astype(int),
+        'misses': (resolved & ~neutral & ~hits).astype(int),
+        'neutral': neutral.astype(int),
+        'abs_error_sum': np.abs(error),
+        'sq_error_sum': error ** 2,
+        'forecast_change_sum': predicted,
+        'realized_change_sum': np.where(resolved, realized, 0.0)
+    })
+    return frame.groupby(ROLLUP_KEYS, as_index=False)[ROLLUP_SUMS].sum()
+
+def build_model_metrics_table():
+    """Metriche CV sparse nei _meta.json raccolte in una tabella (una riga per modello)."""
+    import glob
+    rows = []
+    for bot in ('bot1', 'bot2'):
+        suffix = f'_{bot}_meta.json'
+        for path in glob.glob(f'model_cache/*{suffix}'):
+            key = os.path.basename(path)[:-len(suffix)]
+            meta = load_model_meta(key, bot)
+            diagnostics = meta.get('diagnostics') or {}
+            cv = diagnostics.get('cv_results') or meta.get('cv_results') or {}
+            row = {
+                'symbol': '/'.join(key.rsplit('_', 1)),
+                'model': 'global' if key == GLOBAL_MODEL_KEY else bot,
+                'model_version': diagnostics.get('model_version') or get_model_version(key, bot) or 'none',
+                'k_folds': cv.get('k_folds'),
+                'splitter': cv.get('splitter')
+            }
+            row.update({f'cv_{name}': value for name, value in (cv.get('avg_scores') or {}).items()})
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+def acquire_results_lock():
+    """
+    Lock esclusivo (fcntl.flock) sul file .rollup.lock dell'archivio, condiviso
+    tra i worker gunicorn. Restituisce il file aperto, None se è già occupato.
+    Senza fcntl (Windows) il lock è solo per processo.
+    """
+    os.makedirs(RESULTS_WAREHOUSE_DIR, exist_ok=True)
+    lock_file = open(os.path.join(RESULTS_WAREHOUSE_DIR, '.rollup.lock'), 'a')
+    try:
+        import fcntl
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except ImportError:
+        pass
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def run_results_rollup_job():
+    """
+    Risolve gli esiti maturati, ricalcola i rollup e la tabella delle metriche
+    dei modelli, poi compatta i file parziali. Un solo processo alla volta
+    (lock su file): gli altri registrano l'errore e terminano.
+    """
+    with _results_state_lock:
+        _results_state.update({
+            'running': True,
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None,
+            'error': None
+        })
+
+    lock_file = None
+    try:
+        lock_file = acquire_results_lock()
+        if lock_file is None:
+            raise RuntimeError('Aggiornamento dei rollup già in corso in un altro processo')
+        flush_forecasts()
+        forecasts, forecast_paths = read_results_table('forecasts')
+        outcomes, outcome_paths = read_results_table('outcomes')
+        # Una compattazione interrotta può lasciare le stesse righe in due file
+        if not forecasts.empty:
+            forecasts = forecasts.drop_duplicates('forecast_id', ignore_index=True)
+        if not outcomes.empty:
+            outcomes = outcomes.drop_duplicates('forecast_id', ignore_index=True)
+        resolved = resolve_forecast_outcomes(forecasts, outcomes)
+        if not resolved.empty:
+            outcome_paths = outcome_paths + [write_results_part('outcomes', resolved)]
+            outcomes = pd.concat([outcomes, resolved], ignore_index=True)
+
+        rollups = build_results_rollups(forecasts, outcomes)
+        write_results_snapshot('rollups', rollups)
+        write_results_snapshot('models', build_model_metrics_table())
+
+        compact_results_table('forecasts', forecasts, forecast_paths)
+        compact_results_table('outcomes', outcomes, outcome_paths)
+
+        with _results_state_lock:
+            _results_state.update({
+                'pending': int(len(forecasts) - len(outcomes)),
+                'resolved': int(len(resolved)),
+                'expired': int(resolved['realized_change'].isna().sum()) if not resolved.empty else 0,
+                'rollup_rows': len(rollups)
+            })
+    except Exception as e:
+        print(f"Results rollup failed: {e}")
+        with _results_state_lock:
+            _results_state['error'] = str(e)
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+        with _results_state_lock:
+            _results_state['running'] = False
+            _results_state['finished_at'] = datetime.now().isoformat()
+
+    return dict(_results_state)
+
+def rollup_metrics(frame):
+    """Metriche derivate (accuratezza direzionale, MAE, RMSE in %) dalle somme dei rollup."""
+    directional = frame['hits'] + frame['misses']
+    resolved = frame['resolved'].where(frame['resolved'] > 0)
+    metrics = frame.assign(
+        accuracy=frame['hits'] / directional.where(directional > 0) * 100,
+        mae_pct=frame['abs_error_sum'] / resolved * 100,
+        rmse_pct=np.sqrt(frame['sq_error_sum'] / resolved) * 100,
+        avg_forecast_change_pct=frame['forecast_change_sum'] / frame['forecasts'].where(frame['forecasts'] > 0) * 100,
+        avg_realized_change_pct=frame['realized_change_sum'] / resolved * 100
+    ).drop(columns=['abs_error_sum', 'sq_error_sum', 'forecast_change_sum', 'realized_change_sum'])
+    return metrics.astype(object).where(metrics.notna(), None).to_dict('records')
+
+def query_performance(filters, group_by=('day',), date_from=None, date_to=None):
+    """
+    Interroga i rollup precalcolati: filtri per valore (liste) sulle chiavi,
+    intervallo di giorni e riaggregazione sulle chiavi di group_by.
+    """
+    rollups = load_results_snapshot('rollups')
+    if rollups is None:
+        return None
+    mask = np.ones(len(rollups), dtype=bool)
+    for key, values in filters.items():
+        if values:
+            mask &= rollups[key].isin(values).to_numpy()
+    # Le categorie dei giorni (YYYY-MM-DD) sono ordinate: l'intervallo diventa un confronto sui codici
+    days = rollups['day'].cat
+    if date_from:
+        mask &= days.codes >= np.searchsorted(days.categories, date_from, side='left')
+    if date_to:
+        mask &= days.codes < np.searchsorted(days.categories, date_to, side='right')
+    selected = rollups[mask]
+
+    totals = rollup_metrics(selected[ROLLUP_SUMS].sum().to_frame().T.astype({c: np.int64 for c in ROLLUP_COUNTS}))[0]
+    groups = rollup_metrics(
+        selected.groupby(list(group_by), as_index=False, observed=True)[ROLLUP_SUMS].sum()
+    ) if group_by else []
+    return {
+        'summary': totals,
+        'groups': groups,
+        # Stessi campi delle props del PerformanceDashboard
+        'dashboard': {
+            'forecastAccuracy': totals['accuracy'],
+            'trades': {'positive': totals['hits'], 'negative': totals['misses'], 'neutral': totals['neutral']}
+        }
+    }
+
+# Response cache per gli endpoint POST
+class MemoryResponseCache:
+    """Backend LRU in memoria (per processo)."""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DiskResponseCache:
+    """
+    Backend su disco locale, condiviso tra i worker della stessa macchina.
+    Ad ogni scrittura vengono eliminate le voci scadute e, oltre max_entries,
+    le meno recenti (le voci non rilette non restano su disco).
+    """
+
+    def __init__(self, directory=RESPONSE_CACHE_DIR, max_entries=RESPONSE_CACHE_SIZE):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry['expires_at'] <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def set(self, key, entry):
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+        self.sweep()
+
+    def sweep(self):
+        """
+        Le voci scadono al più RESPONSE_CACHE_MAX_AGE secondi dopo la scrittura:
+        basta l'mtime dei file, senza deserializzarli.
+        """
+        files = []
+        for item in os.scandir(self.directory):
+            if item.name.endswith('.pkl'):
+                try:
+                    files.append((item.stat().st_mtime, item.path))
+                except OSError:
+                    continue
+        files.sort()
+        expired_before = time.time() - RESPONSE_CACHE_MAX_AGE
+        excess = len(files) - self.max_entries
+        for index, (mtime, path) in enumerate(files):
+            if mtime > expired_before and index >= excess:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                os.remove(os.path.join(self.directory, name))
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+_inflight_requests = {}
+_inflight_lock = threading.Lock()
+
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None and RESPONSE_CACHE_BACKEND != 'none':
+            _response_cache = DiskResponseCache() if RESPONSE_CACHE_BACKEND == 'disk' else MemoryResponseCache()
+        return _response_cache
+
+def get_candle_version(timeframe, now=None):
+    """Apertura (epoch ms) dell'ultima candela del timeframe: cambia quando una candela chiude."""
+    seconds = timeframe_to_seconds(timeframe)
+    now = time.time() if now is None else now
+    return int(now // seconds) * seconds * 1000
+
+def normalise_request_params(params):
+    """Normalizza i parametri della richiesta per ottenere chiavi di cache stabili."""
+    params = dict(params or {})
+    symbol = params.get('symbol')
+    if isinstance(symbol, str) and symbol:
+        symbol = symbol.upper()
+        params['symbol'] = symbol if '/' in symbol else f"{symbol}/USDT"
+    return json.dumps(params, sort_keys=True, default=str)
+
+def cached_response(timeframes):
+    """
+    Decoratore per endpoint POST: la risposta viene riutilizzata per richieste
+    identiche finché non chiude una nuova candela dei timeframe in input.
+    Le richieste concorrenti identiche condividono un solo calcolo.
+    Le richieste in streaming (parametro 'stream') non passano dalla cache.
+    Un timeframe non valido restituisce 400 prima di calcolare la chiave; le
+    risposte che riportano un errore non vengono salvate.
+    `timeframes` riceve i parametri della richiesta e restituisce i timeframe usati.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_response_cache()
+            params = request.get_json(silent=True) or {}
+            try:
+                input_timeframes = sorted(set(timeframes(params)))
+                versions = [get_candle_version(tf) for tf in input_timeframes]
+            except (KeyError, ValueError, TypeError, IndexError):
+                return jsonify({'error': f"Timeframe non valido: {params.get('timeframe')}"}), 400
+            if cache is None or params.get('stream') or 'no-cache' in request.headers.get('Cache-Control', ''):
+                return view(*args, **kwargs)
+
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(request.path.encode())
+            digest.update(normalise_request_params(params).encode())
+            digest.update(json.dumps(versions).encode())
+            key = digest.hexdigest()
+
+            entry = cache.get(key)
+            if entry is not None:
+                return _build_cached_response(entry, 'HIT')
+
+            with _inflight_lock:
+                inflight = _inflight_requests.get(key)
+                leader = inflight is None
+                if leader:
+                    inflight = {'event': threading.Event(), 'entry': None}
+                    _inflight_requests[key] = inflight
+
+            if not leader:
+                # Un'altra richiesta identica sta già calcolando la risposta
+                inflight['event'].wait()
+                if inflight['entry'] is not None:
+                    return _build_cached_response(inflight['entry'], 'COALESCED')
+                return view(*args, **kwargs)
+
+            try:
+                response = make_response(view(*args, **kwargs))
+                if (response.status_code == 200 and not response.is_streamed
+                        and 'X-Partial-Result' not in response.headers
+                        and not (response.is_json and payload_signals_failure(response.get_json(silent=True)))):
+                    now = time.time()
+                    next_close = min(
+                        (v / 1000) + timeframe_to_seconds(tf) for v, tf in zip(versions, input_timeframes)
+                    ) if versions else now + RESPONSE_CACHE_MAX_AGE
+                    entry = {
+                        'body': response.get_data(),
+                        'status': response.status_code,
+                        'mimetype': response.mimetype,
+                        'expires_at': min(next_close, now + RESPONSE_CACHE_MAX_AGE)
+                    }
+                    cache.set(key, entry)
+                    inflight['entry'] = entry
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            finally:
+                with _inflight_lock:
+                    _inflight_requests.pop(key, None)
+                inflight['event'].set()
+        return wrapper
+    return decorator
+
+def payload_signals_failure(payload, depth=2):
+    """
+    True se la risposta JSON, o uno dei risultati annidati (es. per simbolo),
+    riporta un errore ('success': False o 'error'): non va messa in cache.
+    """
+    if not isinstance(payload, dict):
+        return False
+    if payload.get('success') is False or payload.get('error'):
+        return True
+    return depth > 0 and any(payload_signals_failure(value, depth - 1) for value in payload.values())
+
+def _build_cached_response(entry, status):
+    response = Response(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+    response.headers['X-Cache'] = status
+    return response
+
+@api.route('/api/market-analysis', methods=['POST'])
+@cached_response(lambda params: [DEFAULT_TIMEFRAME])
 def market_analysis():
     print("Received market analysis request")
     data = request.json
@@ -1079,41 +4287,329 @@ def market_analysis():
     forecast_threshold = float(data.get('forecast_threshold', DEFAULT_FORECAST_THRESHOLD))
     include_negative = data.get('include_negative', False)  # Nuovo parametro
     quality_filter = data.get('quality_filter', True)  # Nuovo parametro
+    model_mode = data.get('model_mode', MODEL_MODE)
+    
+    stream_format = data.get('stream')
+    token = get_request_token(data)
+    scanner = get_scanner(data.get('distributed', SCAN_MODE == 'cluster'))
     
     assets = fetch_market_assets()[:top_assets]
     print(f"Fetched {len(assets)} assets")
+    
+    if stream_format:
+        return stream_market_analysis(
+            assets, forecast_threshold, include_negative, quality_filter, model_mode,
+            'sse' if stream_format == 'sse' else 'ndjson', token, scanner
+        )
 
     results = []
-    
+    processed = 0
+    for processed, result in scanner(assets, forecast_threshold, include_negative, quality_filter, model_mode, token):
+        if result:
+            results.append(result)
+            
+    partial = processed < len(assets)
+    print(f"Returning {len(results)} results" + (f" (partial, {processed}/{len(assets)} assets)" if partial else ""))
+    response_data = {
+        'assets': results,
+        'stats': build_scan_stats(results),
+        'partial': partial,
+        'processed': processed,
+        'total': len(assets)
+    }
+    # Converte tipi NumPy prima della serializzazione
+    return mark_partial(jsonify(ensure_python_types(response_data)), partial)
+
+def scan_market(assets, forecast_threshold, include_negative, quality_filter=True, model_mode=MODEL_MODE, token=None):
+    """
+    Analizza gli asset in parallelo e restituisce (asset processati, risultato)
+    appena ciascun asset termina; il risultato è None se l'asset è scartato.
+    Alla scadenza del token (o se il consumatore smette di leggere) il lavoro
+    in coda viene scartato e quello in corso si ferma al controllo successivo.
+    """
     # Utilizziamo il parallelismo per aumentare la velocità
     max_workers = min(NUM_CORES, 8)
     print(f"Using {max_workers} threads for parallel processing")
     
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(analyze_asset_parallel, symbol, forecast_threshold, include_negative, quality_filter): symbol for symbol in assets}
-        
-        for i, future in enumerate(as_completed(futures)):
-            result = future.result()
-            if result:
-                results.append(result)
-            
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(analyze_asset_parallel, symbol, forecast_threshold, include_negative, quality_filter, model_mode, token): symbol for symbol in assets}
+    completed = False
+    try:
+        for i, future in enumerate(as_completed(futures, timeout=token.remaining() if token is not None else None)):
             if (i + 1) % 5 == 0 or (i + 1) == len(assets):
                 print(f"Processed {i + 1}/{len(assets)} assets")
-            
-    print(f"Returning {len(results)} results")
-    response_data = {
-        'assets': results,
-        'stats': {
-            'positive': sum(1 for asset in results if asset['trend'] == 'Positivo'),
-            'negative': sum(1 for asset in results if asset['trend'] == 'Negativo'),
-            'highQuality': sum(1 for asset in results if asset.get('qualityScore', 0) > 1)
-        }
+            yield i + 1, future.result()
+        completed = True
+    except FutureTimeoutError:
+        print("Scan deadline reached, returning partial results")
+    finally:
+        if not completed and token is not None:
+            token.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# Scansione distribuita (broker con code condivise via multiprocessing.managers)
+_cluster_task_queue = queue.Queue()
+_cluster_result_queues = {}
+_cluster_result_lock = threading.Lock()
+
+def _cluster_get_task_queue():
+    return _cluster_task_queue
+
+def _cluster_open_result_queue(scan_id):
+    """Solo il coordinatore della scansione crea la coda dei risultati."""
+    with _cluster_result_lock:
+        return _cluster_result_queues.setdefault(scan_id, queue.Queue())
+
+def _cluster_release_result_queue(scan_id):
+    with _cluster_result_lock:
+        _cluster_result_queues.pop(scan_id, None)
+
+class _ClusterResultRouter:
+    """Inoltra i risultati dei worker alla coda della scansione; quelli di scansioni già chiuse vengono scartati."""
+
+    def put(self, message):
+        with _cluster_result_lock:
+            results = _cluster_result_queues.get(message['scan_id'])
+        if results is None:
+            return False
+        results.put(message)
+        return True
+
+_cluster_result_router = _ClusterResultRouter()
+
+def _cluster_get_result_router():
+    return _cluster_result_router
+
+class ScanClusterManager(BaseManager):
+    """Code del cluster: una coda di shard condivisa e una coda di risultati per scansione."""
+
+ScanClusterManager.register('get_task_queue', callable=_cluster_get_task_queue)
+ScanClusterManager.register('open_result_queue', callable=_cluster_open_result_queue)
+ScanClusterManager.register('release_result_queue', callable=_cluster_release_result_queue)
+ScanClusterManager.register('get_result_router', callable=_cluster_get_result_router)
+
+def parse_cluster_address(address=None):
+    host, port = (address or SCAN_CLUSTER_ADDRESS).rsplit(':', 1)
+    return host, int(port)
+
+def get_cluster_authkey(address=None, authkey=None):
+    """
+    Chiave di autenticazione del cluster. La chiave di default è ammessa solo
+    su indirizzi di loopback: altrimenti SCAN_CLUSTER_AUTHKEY è obbligatoria.
+    """
+    if authkey:
+        return authkey
+    if SCAN_CLUSTER_AUTHKEY:
+        return SCAN_CLUSTER_AUTHKEY.encode()
+    host, _ = parse_cluster_address(address)
+    try:
+        loopback = ipaddress.ip_address(socket.gethostbyname(host)).is_loopback if host else False
+    except (OSError, ValueError):
+        loopback = False
+    if not loopback:
+        raise ValueError(f"SCAN_CLUSTER_AUTHKEY obbligatoria per l'indirizzo {host or '0.0.0.0'}")
+    return b'realtradingbot'
+
+def connect_scan_cluster(address=None, authkey=None):
+    manager = ScanClusterManager(address=parse_cluster_address(address), authkey=get_cluster_authkey(address, authkey))
+    manager.connect()
+    return manager
+
+def run_scan_broker(address=None, authkey=None):
+    """Avvia il broker del cluster (bloccante)."""
+    manager = ScanClusterManager(address=parse_cluster_address(address), authkey=get_cluster_authkey(address, authkey))
+    server = manager.get_server()
+    print(f"Scan broker listening on {address or SCAN_CLUSTER_ADDRESS}")
+    server.serve_forever()
+
+def run_scan_worker(address=None, authkey=None, poll_interval=1.0):
+    """
+    Nodo worker: preleva gli shard dal broker, li analizza con scan_market e
+    invia i risultati alla coda della scansione. Gli shard scaduti vengono scartati.
+    """
+    manager = connect_scan_cluster(address, authkey)
+    tasks = manager.get_task_queue()
+    router = manager.get_result_router()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"Scan worker {worker_id} connected to {address or SCAN_CLUSTER_ADDRESS}")
+
+    while True:
+        try:
+            task = tasks.get(timeout=poll_interval)
+        except queue.Empty:
+            continue
+
+        deadline = task.get('deadline')
+        if deadline is not None and time.time() >= deadline:
+            print(f"Skipping expired shard {task['shard_id']} of scan {task['scan_id']}")
+            continue
+
+        message = {'scan_id': task['scan_id'], 'shard_id': task['shard_id'], 'worker': worker_id}
+        try:
+            token = CancellationToken(deadline - time.time()) if deadline is not None else None
+            params = task['params']
+            results = [
+                result for _, result in scan_market(
+                    task['symbols'], params['forecast_threshold'], params['include_negative'],
+                    params['quality_filter'], params['model_mode'], token
+                )
+            ]
+            message.update({'results': ensure_python_types(results), 'processed': len(results)})
+        except Exception as e:
+            print(f"Shard {task['shard_id']} failed on {worker_id}: {e}")
+            message['error'] = str(e)
+        if not router.put(message):
+            print(f"Dropping late result of shard {task['shard_id']}: scan {task['scan_id']} already closed")
+
+def distributed_scan(assets, forecast_threshold, include_negative, quality_filter=True, model_mode=MODEL_MODE, token=None):
+    """
+    Come scan_market, ma divide i simboli in shard eseguiti dai worker del
+    cluster. Gli shard in errore o senza risposta entro SCAN_SHARD_TIMEOUT
+    vengono riassegnati; dopo SCAN_SHARD_RETRIES tentativi vengono eseguiti
+    in locale, così la risposta ha sempre la stessa forma. Con un budget il
+    timeout è ridotto in modo che tutti i tentativi rientrino nella deadline.
+    """
+    manager = connect_scan_cluster()
+    scan_id = uuid.uuid4().hex
+    tasks = manager.get_task_queue()
+    results_queue = manager.open_result_queue(scan_id)
+    params = {
+        'forecast_threshold': forecast_threshold,
+        'include_negative': include_negative,
+        'quality_filter': quality_filter,
+        'model_mode': model_mode
     }
-    # Converte tipi NumPy prima della serializzazione
-    return jsonify(ensure_python_types(response_data))
+    deadline = token.deadline if token is not None else None
+    shard_timeout = SCAN_SHARD_TIMEOUT
+    remaining = token.remaining() if token is not None else None
+    if remaining is not None:
+        shard_timeout = min(SCAN_SHARD_TIMEOUT, remaining / (SCAN_SHARD_RETRIES + 1))
+    shards = {
+        shard_id: {'symbols': assets[start:start + SCAN_SHARD_SIZE], 'attempts': 0, 'sent_at': 0.0}
+        for shard_id, start in enumerate(range(0, len(assets), SCAN_SHARD_SIZE))
+    }
+
+    def dispatch(shard_id):
+        shard = shards[shard_id]
+        shard['attempts'] += 1
+        shard['sent_at'] = time.time()
+        tasks.put({'scan_id': scan_id, 'shard_id': shard_id, 'symbols': shard['symbols'],
+                   'params': params, 'deadline': deadline})
+
+    for shard_id in shards:
+        dispatch(shard_id)
+    print(f"Scan {scan_id}: {len(assets)} assets in {len(shards)} shards")
+
+    processed = 0
+    failed = []
+    try:
+        while shards:
+            if token is not None and token.cancelled:
+                print(f"Scan {scan_id} deadline reached with {len(shards)} shards pending")
+                return
+            try:
+                message = results_queue.get(timeout=1.0)
+            except queue.Empty:
+                message = None
+
+            if message is not None and message['shard_id'] in shards:
+                shard_id = message['shard_id']
+                if 'error' not in message:
+                    del shards[shard_id]
+                    for result in message['results']:
+                        processed += 1
+                        yield processed, result
+                elif shards[shard_id]['attempts'] <= SCAN_SHARD_RETRIES:
+                    print(f"Retrying shard {shard_id} after error on {message['worker']}: {message['error']}")
+                    dispatch(shard_id)
+                else:
+                    failed.append(shards.pop(shard_id))
+
+            # Shard senza risposta: riassegnati (eventuali risposte tardive vengono ignorate)
+            for shard_id, shard in list(shards.items()):
+                if time.time() - shard['sent_at'] > shard_timeout:
+                    if shard['attempts'] <= SCAN_SHARD_RETRIES:
+                        print(f"Shard {shard_id} timed out, reassigning")
+                        dispatch(shard_id)
+                    else:
+                        failed.append(shards.pop(shard_id))
+
+        for shard in failed:
+            print(f"Running failed shard locally ({len(shard['symbols'])} assets)")
+            for _, result in scan_market(shard['symbols'], forecast_threshold, include_negative,
+                                         quality_filter, model_mode, token):
+                processed += 1
+                yield processed, result
+    finally:
+        try:
+            manager.release_result_queue(scan_id)
+        except Exception:
+            pass
+
+def get_scanner(distributed=False):
+    """scan_market in locale, oppure distributed_scan se il broker del cluster è raggiungibile."""
+    if not distributed:
+        return scan_market
+    try:
+        connect_scan_cluster()
+        return distributed_scan
+    except Exception as e:
+        print(f"Scan cluster unavailable ({e}), scanning locally")
+        return scan_market
+
+def mark_partial(response, partial):
+    """Le risposte parziali (deadline scaduta) non vengono salvate nella cache."""
+    if partial:
+        response.headers['X-Partial-Result'] = 'true'
+    return response
+
+def build_scan_stats(results):
+    return {
+        'positive': sum(1 for asset in results if asset['trend'] == 'Positivo'),
+        'negative': sum(1 for asset in results if asset['trend'] == 'Negativo'),
+        'highQuality': sum(1 for asset in results if (asset.get('qualityScore') or 0) > 1)
+    }
+
+def format_stream_event(event, stream_format='ndjson'):
+    """Serializza un evento come riga NDJSON o come messaggio SSE."""
+    payload = json.dumps(ensure_python_types(event))
+    if stream_format == 'sse':
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+def stream_market_analysis(assets, forecast_threshold, include_negative, quality_filter, model_mode,
+                           stream_format='ndjson', token=None, scanner=None):
+    """
+    Risposta in streaming dello scanner: un evento 'asset' per ogni asset che
+    supera i filtri appena è pronto, eventi 'progress' e infine 'stats'.
+    Se il client si disconnette il generatore viene chiuso e la scansione annullata.
+    """
+    def generate():
+        results = []
+        processed = 0
+        yield format_stream_event({'type': 'start', 'total': len(assets)}, stream_format)
+        for processed, result in (scanner or scan_market)(assets, forecast_threshold, include_negative, quality_filter, model_mode, token):
+            if result:
+                results.append(result)
+                yield format_stream_event({'type': 'asset', 'asset': result}, stream_format)
+            yield format_stream_event({'type': 'progress', 'processed': processed, 'total': len(assets)}, stream_format)
+        print(f"Streamed {len(results)} results")
+        yield format_stream_event({
+            'type': 'stats',
+            'stats': build_scan_stats(results),
+            'count': len(results),
+            'partial': processed < len(assets)
+        }, stream_format)
+    
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disabilita il buffering di eventuali proxy (nginx)
+    return response
     
 
-@app.route('/api/backtest', methods=['POST'])
+@api.route('/api/backtest', methods=['POST'])
+@cached_response(lambda params: ['1h'])
 def run_backtest():
     """API endpoint per eseguire backtest su un asset specifico"""
     data = request.json
@@ -1131,25 +4627,50 @@ def run_backtest():
     lookback_days = int(data.get('lookback_days', 30))
     prediction_days = int(data.get('prediction_days', 5))
     
-    results = backtest_model(symbol, lookback_days, prediction_days)
+    results = backtest_model(symbol, lookback_days, prediction_days, get_request_token(data))
     # Converte tipi NumPy prima della serializzazione
-    return jsonify(ensure_python_types(results))
+    return mark_partial(jsonify(ensure_python_types(results)), results.get('partial', False))
 
-@app.route('/api/trading-analysis', methods=['POST'])
+@api.route('/api/trading-analysis', methods=['POST'])
+@cached_response(lambda params: ['1d'])
 def trading_analysis():
     data = request.json
     assets = data.get('assets', ['ETH/USDT', 'BTC/USDT'])
     total_budget = float(data.get('total_budget', 10.0))
     forecast_days = int(data.get('forecast_days', DEFAULT_FORECAST_DAYS))
     news_articles_limit = int(data.get('news_articles_limit', DEFAULT_NEWS_LIMIT))
-    stop_loss_percentage = DEFAULT_STOP_LOSS
-    take_profit_percentage = DEFAULT_TAKE_PROFIT
-    risk_reward_ratio = 2.0  # Rapporto rischio/rendimento ottimale
+    allocation_method = data.get('allocation_method', DEFAULT_ALLOCATION_METHOD)
+    max_asset_weight = float(data.get('max_asset_weight', DEFAULT_MAX_ASSET_WEIGHT))
+    risk_aversion = float(data.get('risk_aversion', DEFAULT_RISK_AVERSION))
+    
+    if allocation_method not in ALLOCATION_METHODS:
+        return jsonify({'error': f'Metodo di allocazione non supportato: {allocation_method}'}), 400
+    
+    # Profilo di rischio dell'utente (RiskControlPanel); senza profilo i default globali
+    try:
+        risk_profile = normalise_risk_profile(data['risk_profile']) if data.get('risk_profile') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if risk_profile:
+        stop_loss_percentage = -risk_profile['stopLossPercentage'] / 100
+        take_profit_percentage = risk_profile['stopLossPercentage'] * risk_profile['takeProfitRatio'] / 100
+        risk_reward_ratio = risk_profile['takeProfitRatio']
+        atr_multiplier = risk_profile['atrMultiplier']
+    else:
+        stop_loss_percentage = DEFAULT_STOP_LOSS
+        take_profit_percentage = DEFAULT_TAKE_PROFIT
+        risk_reward_ratio = DEFAULT_RISK_REWARD_RATIO  # Rapporto rischio/rendimento ottimale
+        atr_multiplier = DEFAULT_ATR_MULTIPLIER
     
     results = []
     total_weight = 0
     weights = []
     analyzed_patterns = {}
+    expected_returns = {}
+    price_series = {}
+    decision_frames = []
+    decision_values = []
+    forecast_records = []
     
     # Phase 1: Calculate weights and analyze patterns
     for i, symbol in enumerate(assets):
@@ -1159,7 +4680,7 @@ def trading_analysis():
             analyzed_patterns[i] = {}
             continue
             
-        market_data = calculate_indicators_bot2(market_data)
+        market_data = calculate_indicators_bot2(market_data, get_model_features(symbol, "bot2"))
         forecast = forecast_prices_bot2(market_data, forecast_days, symbol)
         sentiment_score = fetch_news_and_sentiment(symbol, news_articles_limit)
         
@@ -1168,6 +4689,8 @@ def trading_analysis():
         
         # Calcolo peso con nuovi fattori
         forecast_gain = (forecast.mean() - market_data['close'].iloc[-1]) / market_data['close'].iloc[-1]
+        expected_returns[i] = forecast_gain
+        price_series[i] = pd.Series(market_data['close'].values, index=market_data['timestamp'].values)
         
         # Ponderazione avanzata includendo più indicatori
         adx_factor = min(market_data['ADX'].iloc[-1] / 25, 1.5) if 'ADX' in market_data else 1.0
@@ -1192,6 +4715,24 @@ def trading_analysis():
         if weight > 0:
             total_weight += weight
     
+    # Allocazione con l'ottimizzatore (covarianza dalle candele già scaricate)
+    allocation_info = {'method': 'heuristic'}
+    if allocation_method != 'heuristic' and len(price_series) >= 2:
+        try:
+            valid = sorted(price_series)
+            cov = build_covariance_matrix([price_series[j] for j in valid], horizon=forecast_days)
+            optimised = optimise_portfolio(
+                [expected_returns[j] for j in valid], cov,
+                allocation_method, max_asset_weight, risk_aversion
+            )
+            weights = [0.0] * len(assets)
+            for j, w in zip(valid, optimised['weights']):
+                weights[j] = w
+            total_weight = sum(weights)
+            allocation_info = {k: v for k, v in optimised.items() if k != 'weights'}
+        except Exception as e:
+            print(f"Portfolio optimiser failed, using heuristic weights: {e}")
+    
     # Phase 2: Analyze each asset with improved decision logic
     for i, symbol in enumerate(assets):
         market_data = fetch_market_data(symbol, timeframe='1d', limit=200)
@@ -1199,8 +4740,15 @@ def trading_analysis():
             continue
             
         try:
-            market_data = calculate_indicators_bot2(market_data)
-            forecast = forecast_prices_bot2(market_data, forecast_days, symbol)
+            market_data = calculate_indicators_bot2(market_data, get_model_features(symbol, "bot2"))
+            record_symbol_memory(symbol, market_data)
+            horizon = None
+            if FORECAST_ENGINE == 'horizon':
+                try:
+                    horizon = forecast_horizon_bot2(market_data, forecast_days, symbol)
+                except Exception as horizon_err:
+                    print(f"Horizon engine failed for {symbol}: {horizon_err}")
+            forecast = horizon['median'] if horizon else forecast_prices_bot2(market_data, forecast_days, symbol)
             sentiment_score = fetch_news_and_sentiment(symbol, news_articles_limit)
             current_price = market_data['close'].iloc[-1]
             forecast_gain = (forecast.mean() - current_price) / current_price
@@ -1210,81 +4758,32 @@ def trading_analysis():
             investment = normalized_weight * total_budget
             quantity = investment / current_price if current_price > 0 else 0
             
-            # Stop loss dinamico basato su ATR
-            atr_multiplier = 2.0
-            if 'ATR' in market_data.columns:
+            # Stop loss dinamico basato su ATR (con profilo solo se stopLossType è 'atr')
+            if 'ATR' in market_data.columns and (risk_profile is None or risk_profile['stopLossType'] == 'atr'):
                 current_atr = market_data['ATR'].iloc[-1]
                 dynamic_stop_loss = current_price - (current_atr * atr_multiplier)
                 dynamic_take_profit = current_price + (current_atr * atr_multiplier * risk_reward_ratio)
                 
-                # Scegli il valore più conservativo tra stop loss statico e dinamico
-                stop_loss_level = max(dynamic_stop_loss, current_price * (1 + stop_loss_percentage))
-                take_profit_level = min(dynamic_take_profit, current_price * (1 + take_profit_percentage))
+                if risk_profile:
+                    stop_loss_level = dynamic_stop_loss
+                    take_profit_level = dynamic_take_profit
+                else:
+                    # Scegli il valore più conservativo tra stop loss statico e dinamico
+                    stop_loss_level = max(dynamic_stop_loss, current_price * (1 + stop_loss_percentage))
+                    take_profit_level = min(dynamic_take_profit, current_price * (1 + take_profit_percentage))
             else:
                 # Fallback ai calcoli percentuali standard
                 stop_loss_level = current_price * (1 + stop_loss_percentage)
                 take_profit_level = current_price * (1 + take_profit_percentage)
             
-            # Decision making migliorato con pattern e indicatori multipli
-            if forecast_gain > take_profit_percentage and market_data['ADX'].iloc[-1] > 25:
-                # Verifica anche i pattern candlestick
-                pattern_confirmation = False
-                if analyzed_patterns.get(i, {}).get('bullish_engulfing', False):
-                    pattern_confirmation = True
-                if analyzed_patterns.get(i, {}).get('hammer', False):
-                    pattern_confirmation = True
-                    
-                if pattern_confirmation:
-                    decision = f"COMPRARE (LONG): Previsione positiva con conferma pattern. Target a {take_profit_level:.2f} USDT, Stop Loss a {stop_loss_level:.2f} USDT"
-                else:
-                    decision = f"COMPRARE (LONG): Previsione positiva. Target a {take_profit_level:.2f} USDT, Stop Loss a {stop_loss_level:.2f} USDT"
-                    
-            elif forecast_gain < stop_loss_percentage and market_data['ADX'].iloc[-1] > 25:
-                # Verifica anche i pattern candlestick ribassisti
-                pattern_confirmation = False
-                if analyzed_patterns.get(i, {}).get('bearish_engulfing', False):
-                    pattern_confirmation = True
-                if analyzed_patterns.get(i, {}).get('shooting_star', False):
-                    pattern_confirmation = True
-                    
-                if pattern_confirmation:
-                    decision = f"VENDERE (SHORT): Perdita prevista con conferma pattern. Target a {current_price * (1 - take_profit_percentage):.2f} USDT, Stop Loss a {current_price * (1 - stop_loss_percentage):.2f} USDT"
-                else:
-                    decision = f"VENDERE (SHORT): Perdita prevista. Target a {current_price * (1 - take_profit_percentage):.2f} USDT, Stop Loss a {current_price * (1 - stop_loss_percentage):.2f} USDT"
-            
-            # Aggiungiamo ulteriori regole di trading basate su indicatori multipli
-            elif market_data['RSI'].iloc[-1] > 70 and market_data['MACD'].iloc[-1] < market_data['Signal_Line'].iloc[-1]:
-                decision = f"VENDERE (SHORT): RSI in ipercomprato ({market_data['RSI'].iloc[-1]:.2f}) e MACD in inversione."
-            
-            elif market_data['RSI'].iloc[-1] < 30 and market_data['MACD'].iloc[-1] > market_data['Signal_Line'].iloc[-1]:
-                decision = f"COMPRARE (LONG): RSI in ipervenduto ({market_data['RSI'].iloc[-1]:.2f}) e MACD in inversione. Target a {take_profit_level:.2f} USDT, Stop Loss a {stop_loss_level:.2f} USDT"
-            
-            # Controllo divergenze
-            elif 'MACD' in market_data.columns and 'RSI' in market_data.columns:
-                # Divergenza rialzista: prezzo fa nuovi minimi ma RSI non segue
-                price_making_lower_low = market_data['close'].iloc[-1] < market_data['close'].iloc[-2] and market_data['close'].iloc[-2] < market_data['close'].iloc[-3]
-                rsi_not_making_lower_low = market_data['RSI'].iloc[-1] > market_data['RSI'].iloc[-2] and price_making_lower_low
-                
-                # Divergenza ribassista: prezzo fa nuovi massimi ma RSI non segue
-                price_making_higher_high = market_data['close'].iloc[-1] > market_data['close'].iloc[-2] and market_data['close'].iloc[-2] > market_data['close'].iloc[-3]
-                rsi_not_making_higher_high = market_data['RSI'].iloc[-1] < market_data['RSI'].iloc[-2] and price_making_higher_high
-                
-                if rsi_not_making_lower_low:
-                    decision = f"COMPRARE (LONG): Divergenza RSI rialzista rilevata. Target a {take_profit_level:.2f} USDT, Stop Loss a {stop_loss_level:.2f} USDT"
-                elif rsi_not_making_higher_high:
-                    decision = f"VENDERE (SHORT): Divergenza RSI ribassista rilevata. Target a {current_price * (1 - take_profit_percentage):.2f} USDT, Stop Loss a {current_price * (1 - stop_loss_percentage):.2f} USDT"
-                elif abs(forecast_gain) < 0.01 or sentiment_score == 0:
-                    decision = "MANTENERE O MONITORARE: Nessun segnale chiaro."
-                else:
-                    decision = "MANTENERE O MONITORARE: Nessun segnale per cambiare posizione."
-            else:
-                decision = "MANTENERE O MONITORARE: Dati insufficienti per una decisione."
-            
             # Creazione del risultato con campi aggiuntivi
             result = {
                 'asset': symbol,
                 'currentPrice': f"{current_price:.8f}",
                 'forecastPrice': f"{forecast.mean():.8f}",
+                'forecastLower': f"{horizon['lower'][-1]:.8f}" if horizon else "N/A",
+                'forecastUpper': f"{horizon['upper'][-1]:.8f}" if horizon else "N/A",
+                'forecastHorizon': [float(p) for p in forecast],
                 'forecastGain': f"{forecast_gain:.4f}",
                 'rsi': f"{market_data['RSI'].iloc[-1]:.2f}",
                 'macd': f"{market_data['MACD'].iloc[-1]:.8f}",
@@ -1293,7 +4792,7 @@ def trading_analysis():
                 'weightAllocated': f"{normalized_weight:.2%}",
                 'investmentAmount': f"{investment:.2f}",
                 'quantityToBuy': f"{quantity:.8f}",
-                'decision': decision,
+                'decision': None,  # Valorizzata dopo la valutazione delle regole su tutti gli asset
                 'stopLoss': f"{stop_loss_level:.4f}",
                 'takeProfit': f"{take_profit_level:.4f}",
                 'atr': f"{market_data['ATR'].iloc[-1]:.4f}" if 'ATR' in market_data.columns else "N/A",
@@ -1301,19 +4800,79 @@ def trading_analysis():
                 'patterns': analyzed_patterns.get(i, {})
             }
             
+            # Ultime candele per le regole (servono i valori precedenti per divergenze e pattern)
+            decision_frames.append(market_data[DECISION_INPUT_COLUMNS].iloc[-3:].assign(
+                symbol=symbol, forecast_gain=forecast_gain, sentiment=sentiment_score
+            ))
+            decision_values.append({
+                'take_profit_level': take_profit_level,
+                'stop_loss_level': stop_loss_level,
+                'short_target': current_price * (1 - take_profit_percentage),
+                'short_stop': current_price * (1 - stop_loss_percentage),
+                'rsi': market_data['RSI'].iloc[-1]
+            })
+            model = 'bot2_horizon' if horizon else 'bot2'
+            forecast_records.append((symbol, market_data, forecast_gain, model, get_model_version(symbol, model)))
             results.append(result)
         except Exception as e:
             print(f"Error analyzing {symbol}: {e}")
             continue
     
-    return jsonify({'assets': results})
+    # Decision making: tabella di regole valutata su tutti gli asset in una sola passata
+    if decision_frames:
+        frame = pd.concat(decision_frames, ignore_index=True)
+        decisions = evaluate_decisions(
+            frame,
+            forecast_gain=frame['forecast_gain'].values,
+            sentiment=frame['sentiment'].values,
+            take_profit=take_profit_percentage,
+            stop_loss=stop_loss_percentage
+        )
+        last_rows = np.cumsum([len(f) for f in decision_frames]) - 1
+        for result, row, values, record in zip(results, last_rows, decision_values, forecast_records):
+            code = DECISION_CODES[decisions[row]]
+            result['decisionCode'] = code
+            result['decision'] = render_decision(code, **values)
+            symbol, market_data, forecast_gain, model, version = record
+            record_forecast('trading', symbol, '1d', market_data, forecast_gain, forecast_days, model, version, code)
+    
+    return jsonify({'assets': results, 'allocation': ensure_python_types(allocation_info)})
+
+@api.route('/api/risk/evaluate', methods=['POST'])
+@cached_response(lambda params: [params.get('timeframe', '1d')])
+def risk_evaluate():
+    """API endpoint per valutare i profili di rischio di uno o più utenti sui rispettivi portafogli"""
+    data = request.json or {}
+    users = data.get('users')
+    if users is None:
+        users = [{'user_id': data.get('user_id', 'default'), 'profile': data.get('profile'), 'portfolio': data.get('portfolio')}]
+    if not isinstance(users, list) or not users or len(users) > RISK_MAX_USERS:
+        return jsonify({'error': f'users deve essere una lista di 1-{RISK_MAX_USERS} profili'}), 400
+    # Il timeframe è già validato da cached_response
+    timeframe = data.get('timeframe', '1d')
+    min_history = RISK_HORIZON_DAYS + 2
+    try:
+        limit = int(data.get('history', RISK_HISTORY_LIMIT))
+    except (TypeError, ValueError):
+        limit = None
+    if limit is None or not min_history <= limit <= RISK_MAX_HISTORY:
+        return jsonify({'error': f'Storico non valido ({min_history}-{RISK_MAX_HISTORY} candele)'}), 400
+    
+    start = time.time()
+    try:
+        result = evaluate_risk_profiles(users, timeframe, limit)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Richiesta non valida: {e}'}), 400
+    result['elapsed_seconds'] = time.time() - start
+    return jsonify(ensure_python_types(result))
 
-@app.route('/api/available-assets', methods=['GET'])
+@api.route('/api/available-assets', methods=['GET'])
 def available_assets():
     assets = fetch_market_assets()
     return jsonify({'assets': assets})
 
-@app.route('/api/historical-data', methods=['POST'])
+@api.route('/api/historical-data', methods=['POST'])
+@cached_response(lambda params: [params.get('timeframe', '1d')])
 def get_historical_data():
     data = request.json
     symbol = data.get('symbol', 'BTC/USDT')
@@ -1326,19 +4885,23 @@ def get_historical_data():
         return jsonify({'error': 'Could not fetch historical data'}), 400
     
     # Converti il DataFrame in un formato adatto al JSON
-    result = []
-    for index, row in ohlcv_data.iterrows():
-        result.append({
-            'timestamp': row['timestamp'].isoformat(),
-            'open': float(row['open']),
-            'high': float(row['high']),
-            'low': float(row['low']),
-            'close': float(row['close']),
-            'volume': float(row['volume'])
-        })
+    timestamps = pd.to_datetime(ohlcv_data['timestamp'], unit='ms')
+    result = [
+        {
+            'timestamp': ts.isoformat(),
+            'open': float(o),
+            'high': float(h),
+            'low': float(l),
+            'close': float(c),
+            'volume': float(v)
+        }
+        for ts, o, h, l, c, v in zip(timestamps, ohlcv_data['open'], ohlcv_data['high'],
+                                     ohlcv_data['low'], ohlcv_data['close'], ohlcv_data['volume'])
+    ]
     
     return jsonify({'data': result})
-@app.route('/api/backtest-bot2', methods=['POST'])
+@api.route('/api/backtest-bot2', methods=['POST'])
+@cached_response(lambda params: ['1d'])
 def run_backtest_bot2():
     """API endpoint per eseguire backtest specifico su Bot 2"""
     data = request.json
@@ -1355,6 +4918,7 @@ def run_backtest_bot2():
         
     lookback_days = int(data.get('lookback_days', 30))
     prediction_days = int(data.get('prediction_days', 5))
+    token = get_request_token(data)
     
     try:
         # Otteniamo dati storici più ampi per il backtest
@@ -1365,9 +4929,15 @@ def run_backtest_bot2():
             return jsonify({'error': 'Dati insufficienti per backtest Bot 2'}), 400
         
         results = []
+        partial = False
         
         # Creiamo diversi periodi di backtest
         for i in range(lookback_days):
+            if token.cancelled:
+                print(f"Backtest Bot 2 per {symbol} interrotto dopo {i} periodi")
+                partial = True
+                break
+            
             # Dati di training: una finestra che termina lookback_days - i giorni fa
             train_end_idx = len(all_data) - prediction_days - i
             train_data = all_data.iloc[:train_end_idx].copy()
@@ -1414,27 +4984,29 @@ def run_backtest_bot2():
         
         # Calcola le metriche di precisione
         if not results:
-            return jsonify({'symbol': symbol, 'success': False, 'error': 'Nessun risultato valido nel backtest Bot 2'})
+            return mark_partial(jsonify({'symbol': symbol, 'success': False, 'partial': partial, 'error': 'Nessun risultato valido nel backtest Bot 2'}), partial)
         
         direction_accuracy = sum(1 for r in results if r["correct_direction"]) / len(results) * 100
         avg_error = sum(r["error_margin_pct"] for r in results) / len(results)
         pattern_accuracy = sum(1 for r in results if r["pattern_detected"] and r["correct_direction"]) / max(1, sum(1 for r in results if r["pattern_detected"])) * 100
         
-        return jsonify(ensure_python_types({
+        return mark_partial(jsonify(ensure_python_types({
             "symbol": symbol,
             "success": True,
+            "partial": partial,
             "direction_accuracy": direction_accuracy,
             "pattern_accuracy": pattern_accuracy,
             "avg_error_pct": avg_error,
             "periods_tested": len(results),
             "detailed_results": results
-        }))
+        })), partial)
     
     except Exception as e:
         print(f"Error running Bot 2 backtest for {symbol}: {e}")
         return jsonify({'symbol': symbol, 'success': False, 'error': str(e)})
     
-@app.route('/api/cross-validate', methods=['POST'])
+@api.route('/api/cross-validate', methods=['POST'])
+@cached_response(lambda params: [DEFAULT_TIMEFRAME])
 def run_cross_validation():
     """API endpoint per eseguire cross-validation su un asset specifico"""
     data = request.json
@@ -1450,6 +5022,9 @@ def run_cross_validation():
         symbol = f"{symbol}/USDT"
         
     k_folds = int(data.get('k_folds', 5))
+    splitter = data.get('splitter', CV_SPLITTER)
+    if splitter not in ('timeseries', 'purged'):
+        return jsonify({'error': f'Splitter non supportato: {splitter}'}), 400
     
     try:
         # Otteniamo i dati del mercato
@@ -1463,11 +5038,7 @@ def run_cross_validation():
             return jsonify({'error': 'Impossibile calcolare gli indicatori'}), 400
         
         # Selezioniamo le features
-        possible_features = [
-            'RSI', 'MACD', 'MACD_hist', 'Signal_Line', 'ATR', 'Volatility', 'NATR', 
-            'MOM', 'ROC', 'ADX', 'PLUS_DI', 'MINUS_DI', 'OBV', 
-            'BB_upper', 'BB_lower', 'Price_to_EMA50', 'EMA_ratio'
-        ]
+        possible_features = BOT1_FEATURES
         
         available_features = [f for f in possible_features if f in market_data.columns]
         
@@ -1486,23 +5057,18 @@ def run_cross_validation():
             data=feature_data,
             features=available_features,
             target=target,
-            k=k_folds
+            k=k_folds,
+            splitter=splitter
         )
         
         if cv_results:
             # Salviamo i risultati nei metadati del modello
-            meta_file = f'model_cache/{symbol.replace("/", "_")}_bot1_meta.json'
-            if os.path.exists(meta_file):
-                with open(meta_file, 'r') as f:
-                    meta_data = json.load(f)
-            else:
-                meta_data = {'features': available_features}
-            
-            meta_data['cv_results'] = cv_results['avg_scores']
-            meta_data['timestamp'] = datetime.now().isoformat()
-            
-            with open(meta_file, 'w') as f:
-                json.dump(meta_data, f)
+            update_model_meta(
+                symbol, "bot1",
+                features=load_model_meta(symbol, "bot1").get('features', available_features),
+                cv_results=cv_results['avg_scores'],
+                timestamp=datetime.now().isoformat()
+            )
             
             # Converte tipi NumPy prima della serializzazione
             return jsonify(ensure_python_types({
@@ -1519,7 +5085,445 @@ def run_cross_validation():
         print(f"Error in cross-validation: {e}")
         return jsonify({'error': str(e)}), 500
 
+@api.route('/api/simulate', methods=['POST'])
+@cached_response(lambda params: [params.get('timeframe', DEFAULT_TIMEFRAME)])
+def run_trade_simulation():
+    """API endpoint per simulare i trade (stop/target/fee/slippage) su più simboli e griglie di parametri"""
+    data = request.json or {}
+    symbols = data.get('symbols') or [data.get('symbol', 'BTC/USDT')]
+    timeframe = data.get('timeframe', DEFAULT_TIMEFRAME)
+    grid = data.get('grid', {})
+    try:
+        limit = int(data.get('limit', DEFAULT_LIMIT))
+        fee = float(data.get('fee', DEFAULT_TRADING_FEE))
+        slippage = float(data.get('slippage', DEFAULT_SLIPPAGE))
+        max_holding = int(data.get('max_holding', DEFAULT_MAX_HOLDING))
+        top_results = int(data.get('top_results', 10))
+        combinations = validate_parameter_grid(grid, SWEEP_LEVEL_PARAMS)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Richiesta non valida: {e}'}), 400
+    if not 1 <= limit <= SIMULATION_MAX_LIMIT:
+        return jsonify({'error': f'limit non valido (1-{SIMULATION_MAX_LIMIT})'}), 400
+    if not 1 <= max_holding <= SIMULATION_MAX_HOLDING:
+        return jsonify({'error': f'max_holding non valido (1-{SIMULATION_MAX_HOLDING})'}), 400
+    # Le matrici (combinazioni, ingressi, max_holding) crescono con il prodotto dei tre
+    if combinations > SIMULATION_MAX_COMBINATIONS or combinations * limit * max_holding > SIMULATION_MAX_CELLS:
+        return jsonify({'error': f'Griglia troppo grande: {combinations} combinazioni '
+                                 f'(max {SIMULATION_MAX_COMBINATIONS}, {SIMULATION_MAX_CELLS} celle con limit e max_holding)'}), 400
+    
+    try:
+        periods_per_year = 365 * 86400 / timeframe_to_seconds(timeframe)
+    except (KeyError, ValueError):
+        return jsonify({'error': f'Timeframe non valido: {timeframe}'}), 400
+    
+    start = time.time()
+    
+    def simulate_symbol(symbol):
+        market_data = fetch_market_data(symbol, timeframe=timeframe, limit=limit)
+        if market_data is None or market_data.empty:
+            return symbol, None
+        market_data = calculate_indicators_bot2(market_data)
+        if market_data.empty:
+            return symbol, None
+        signals = generate_rule_signals(market_data)
+        return symbol, simulate_trade_grid(
+            market_data['close'].values, market_data['high'].values, market_data['low'].values,
+            market_data['ATR'].values, signals, grid, fee, slippage, max_holding, periods_per_year
+        )
+    
+    results = {}
+    combinations = 0
+    with ThreadPoolExecutor(max_workers=min(NUM_CORES, 8)) as executor:
+        for symbol, symbol_results in executor.map(simulate_symbol, symbols):
+            if symbol_results is None:
+                results[symbol] = {'success': False, 'error': 'Dati insufficienti'}
+                continue
+            combinations = len(symbol_results)
+            ranked = sorted(symbol_results, key=lambda r: r['sharpe'], reverse=True)
+            results[symbol] = {'success': True, 'best': ranked[0], 'results': ranked[:top_results]}
+    
+    return jsonify(ensure_python_types({
+        'symbols': results,
+        'combinations': combinations,
+        'elapsed_seconds': time.time() - start
+    }))
+
+@api.route('/api/sweep', methods=['POST'])
+def run_sweep():
+    """API endpoint per valutare una griglia di soglie decisionali sulle previsioni in cache"""
+    data = request.json or {}
+    symbols = data.get('symbols')
+    if not symbols:
+        symbols = fetch_market_assets()[:int(data.get('top_assets', 20))]
+    timeframe = data.get('timeframe', DEFAULT_TIMEFRAME)
+    limit = int(data.get('limit', DEFAULT_LIMIT))
+    grid = data.get('grid', {})
+    max_workers = max(1, min(int(data.get('max_workers', SWEEP_MAX_WORKERS)), NUM_CORES))
+    top_results = int(data.get('top_results', 10))
+    
+    try:
+        validate_parameter_grid(grid, list(SWEEP_SIGNAL_PARAMS) + list(SWEEP_LEVEL_PARAMS))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    start = time.time()
+    results, path, errors = run_parameter_sweep(
+        symbols, grid, timeframe, limit,
+        fee=float(data.get('fee', DEFAULT_TRADING_FEE)),
+        slippage=float(data.get('slippage', DEFAULT_SLIPPAGE)),
+        max_holding=int(data.get('max_holding', DEFAULT_MAX_HOLDING)),
+        refresh=bool(data.get('refresh_forecasts', False)),
+        max_workers=max_workers
+    )
+    if results is None:
+        return jsonify({'error': 'Nessun simbolo con dati sufficienti', 'failed': errors}), 400
+    
+    # Classifica delle combinazioni aggregate su tutti i simboli
+    param_columns = [c for c in list(SWEEP_SIGNAL_PARAMS) + list(SWEEP_LEVEL_PARAMS) if c in results.columns]
+    summary = results.groupby(param_columns, as_index=False).agg(
+        sharpe=('sharpe', 'mean'),
+        total_return=('total_return', 'mean'),
+        max_drawdown=('max_drawdown', 'max'),
+        win_rate=('win_rate', 'mean'),
+        trades=('trades', 'sum')
+    ).sort_values('sharpe', ascending=False)
+    
+    return jsonify(ensure_python_types({
+        'success': True,
+        'results_file': path,
+        'rows': len(results),
+        'symbols': results['symbol'].nunique(),
+        'failed': errors,
+        'top_combinations': summary.head(top_results).to_dict(orient='records'),
+        'elapsed_seconds': time.time() - start
+    }))
+
+@api.route('/api/tune', methods=['POST'])
+def start_tuning():
+    """API endpoint per avviare in background l'ottimizzazione degli iperparametri"""
+    data = request.json or {}
+    
+    symbols = data.get('symbols')
+    if not symbols:
+        symbols = fetch_market_assets()[:int(data.get('top_assets', DEFAULT_TOP_ASSETS))]
+    bots = tuple(b for b in data.get('bots', ['bot1', 'bot2']) if b in ('bot1', 'bot2'))
+    time_budget = int(data.get('time_budget', TUNING_TIME_BUDGET))
+    max_workers = max(1, min(int(data.get('max_workers', TUNING_MAX_WORKERS)), NUM_CORES))
+    
+    if not symbols or not bots:
+        return jsonify({'error': 'Nessun simbolo o bot da ottimizzare'}), 400
+    
+    with _tuning_lock:
+        if _tuning_state['running']:
+            return jsonify({'error': 'Ottimizzazione già in corso', 'status': dict(_tuning_state)}), 409
+        _tuning_state['running'] = True
+    
+    threading.Thread(
+        target=run_tuning_job,
+        args=(symbols, bots, time_budget, max_workers),
+        daemon=True
+    ).start()
+    
+    return jsonify({'success': True, 'symbols': len(symbols), 'bots': list(bots), 'time_budget': time_budget}), 202
+
+@api.route('/api/tune-status', methods=['GET'])
+def tuning_status():
+    with _tuning_lock:
+        return jsonify(dict(_tuning_state))
+
+@api.route('/api/model-diagnostics', methods=['GET'])
+def model_diagnostics():
+    """API endpoint che legge la diagnostica precalcolata dei modelli (nessun calcolo)"""
+    symbol = request.args.get('symbol')
+    bot = request.args.get('bot', 'bot1')
+    with _diagnostics_lock:
+        status = dict(_diagnostics_state)
+
+    if not symbol:
+        return jsonify(status)
+    if bot not in ('bot1', 'bot2'):
+        return jsonify({'error': 'Bot non valido'}), 400
+
+    diagnostics = get_model_diagnostics(symbol, bot)
+    if diagnostics is None:
+        return jsonify({'error': f'Diagnostica non disponibile per {symbol} ({bot})', 'status': status}), 404
+    return jsonify(ensure_python_types({'symbol': symbol, 'bot': bot, **diagnostics}))
+
+@api.route('/api/model-diagnostics', methods=['POST'])
+def start_model_diagnostics():
+    """API endpoint per calcolare in background la diagnostica dei modelli in cache"""
+    data = request.json or {}
+    
+    symbols = data.get('symbols')
+    if not symbols:
+        symbols = fetch_market_assets()[:int(data.get('top_assets', DEFAULT_TOP_ASSETS))]
+    bots = tuple(b for b in data.get('bots', ['bot1', 'bot2']) if b in ('bot1', 'bot2'))
+    force = bool(data.get('force', False))
+    
+    if not symbols or not bots:
+        return jsonify({'error': 'Nessun simbolo o bot da analizzare'}), 400
+    
+    with _diagnostics_lock:
+        if _diagnostics_state['running']:
+            return jsonify({'error': 'Diagnostica già in corso', 'status': dict(_diagnostics_state)}), 409
+        _diagnostics_state['running'] = True
+    
+    threading.Thread(target=run_diagnostics_job, args=(symbols, bots, force), daemon=True).start()
+    
+    return jsonify({'success': True, 'symbols': len(symbols), 'bots': list(bots), 'force': force}), 202
+
+@api.route('/api/feature-selection', methods=['POST'])
+def start_feature_selection():
+    """API endpoint per avviare in background la selezione delle feature di Bot 2"""
+    data = request.json or {}
+    
+    symbols = data.get('symbols')
+    if not symbols:
+        symbols = fetch_market_assets()[:int(data.get('top_assets', DEFAULT_TOP_ASSETS))]
+    
+    if not symbols:
+        return jsonify({'error': 'Nessun simbolo disponibile'}), 400
+    
+    with _feature_selection_lock:
+        if _feature_selection_state['running']:
+            return jsonify({'error': 'Selezione già in corso', 'status': dict(_feature_selection_state)}), 409
+        _feature_selection_state['running'] = True
+    
+    threading.Thread(target=run_feature_selection_job, args=(symbols, "bot2"), daemon=True).start()
+    
+    return jsonify({'success': True, 'symbols': len(symbols)}), 202
+
+@api.route('/api/feature-selection', methods=['GET'])
+def feature_selection_status():
+    """Stato del job e feature selezionate (per simbolo con ?symbol=, altrimenti condivise)"""
+    symbol = request.args.get('symbol') or FEATURE_SELECTION_DEFAULT_KEY
+    with _feature_selection_lock:
+        status = dict(_feature_selection_state)
+    meta = load_model_meta(symbol, "bot2")
+    status['symbol'] = symbol
+    status['selected_features'] = meta.get('selected_features')
+    status['feature_selection'] = meta.get('feature_selection')
+    return jsonify(ensure_python_types(status))
+
+@api.route('/api/global-model/train', methods=['POST'])
+def start_global_model_training():
+    """API endpoint per (ri)addestrare in background il modello globale cross-asset"""
+    data = request.json or {}
+    
+    symbols = data.get('symbols')
+    if not symbols:
+        symbols = fetch_market_assets()[:int(data.get('top_assets', DEFAULT_TOP_ASSETS))]
+    incremental = bool(data.get('incremental', True))
+    
+    if not symbols:
+        return jsonify({'error': 'Nessun simbolo disponibile'}), 400
+    
+    with _global_model_lock:
+        if _global_training_state['running']:
+            return jsonify({'error': 'Addestramento già in corso', 'status': dict(_global_training_state)}), 409
+        _global_training_state['running'] = True
+    
+    threading.Thread(target=train_global_model, args=(symbols, incremental), daemon=True).start()
+    
+    return jsonify({'success': True, 'symbols': len(symbols), 'incremental': incremental}), 202
+
+@api.route('/api/global-model/status', methods=['GET'])
+def global_model_status():
+    model, features = get_global_model()
+    with _global_model_lock:
+        status = dict(_global_training_state)
+    status['available'] = model is not None
+    status['features'] = features
+    status['meta'] = load_model_meta(GLOBAL_MODEL_KEY, "bot1")
+    return jsonify(ensure_python_types(status))
+
+@api.route('/api/indicator-plan', methods=['GET'])
+def indicator_plan():
+    """Nodi del grafo degli indicatori, storico minimo e candele da scaricare per un insieme di feature"""
+    bot = request.args.get('bot', 'bot1')
+    if bot not in ('bot1', 'bot2'):
+        return jsonify({'error': 'Bot non valido'}), 400
+    features = request.args.get('features')
+    if features:
+        features = [f.strip() for f in features.split(',') if f.strip()]
+    else:
+        features = get_model_features(request.args.get('symbol'), bot)
+    unknown = [f for f in features if f not in INDICATOR_GRAPH]
+    if unknown:
+        return jsonify({'error': f'Indicatori sconosciuti: {unknown}'}), 400
+    
+    columns = get_indicator_columns(bot, features)
+    plan = plan_indicators(columns)
+    plan.update({
+        'bot': bot,
+        'features': features,
+        'columns': columns,
+        'fetch_limit': get_fetch_limit(features, bot),
+        'full_fetch_limit': DEFAULT_LIMIT
+    })
+    return jsonify(plan)
+
+@api.route('/api/models/pack', methods=['POST'])
+def pack_models():
+    """API endpoint per rigenerare i file impacchettati dei modelli in cache"""
+    data = request.json or {}
+    families = [t for t in data.get('types', MODEL_PACK_FAMILIES) if t in MODEL_PACK_FAMILIES]
+    if not families:
+        return jsonify({'error': 'Nessuna famiglia di modelli da impacchettare'}), 400
+    
+    results = []
+    for type in families:
+        start = time.time()
+        stats = pack_model_family(type)
+        stats['elapsed_seconds'] = time.time() - start
+        results.append(stats)
+    return jsonify(ensure_python_types({'packs': results}))
+
+@api.route('/api/models/pack', methods=['GET'])
+def packed_models_status():
+    """Famiglie impacchettate, modelli contenuti e modelli non più allineati al joblib"""
+    families = []
+    for type in MODEL_PACK_FAMILIES:
+        pack = open_model_pack(type)
+        if pack is None:
+            families.append({'type': type, 'available': False})
+            continue
+        stale = [key for key, entry in pack['models'].items() if entry['version'] != get_model_version(key, type)]
+        families.append({
+            'type': type,
+            'available': True,
+            'models': len(pack['models']),
+            'stale': len(stale),
+            'bytes': os.path.getsize(get_model_pack_path(type)),
+            'created_at': pack['created_at']
+        })
+    return jsonify({'families': families})
+
+@api.route('/api/performance', methods=['GET'])
+def performance_data():
+    """
+    Dati del PerformanceDashboard dai rollup precalcolati.
+    Filtri: symbol, timeframe, source, model, model_version (separati da virgola),
+    from/to (YYYY-MM-DD); group_by (default 'day'); models=1 aggiunge le metriche CV.
+    """
+    group_by = [k for k in request.args.get('group_by', 'day').split(',') if k]
+    invalid = [k for k in group_by if k not in ROLLUP_KEYS]
+    if invalid:
+        return jsonify({'error': f'Chiavi di raggruppamento non valide: {invalid}'}), 400
+    filters = {
+        key: [v for v in request.args.get(key, '').split(',') if v]
+        for key in ROLLUP_KEYS if key != 'day'
+    }
+
+    start = time.time()
+    result = query_performance(filters, group_by, request.args.get('from'), request.args.get('to'))
+    with _results_state_lock:
+        status = dict(_results_state)
+    if result is None:
+        return jsonify({'available': False, 'rollup': status})
+    if request.args.get('models') in ('1', 'true'):
+        models = load_results_snapshot('models')
+        if models is not None and not models.empty:
+            for key in ('symbol', 'model', 'model_version'):
+                if filters[key]:
+                    models = models[models[key].astype(str).isin(filters[key])]
+            result['models'] = models.astype(object).where(models.notna(), None).to_dict('records')
+    result.update({'available': True, 'rollup': status, 'elapsed_ms': (time.time() - start) * 1000})
+    return jsonify(ensure_python_types(result))
+
+@api.route('/api/performance/rollup', methods=['POST'])
+def start_results_rollup():
+    """API endpoint per risolvere gli esiti e ricalcolare i rollup in background"""
+    with _results_state_lock:
+        if _results_state['running']:
+            return jsonify({'error': 'Aggiornamento dei rollup già in corso', 'status': dict(_results_state)}), 409
+        _results_state['running'] = True
+
+    threading.Thread(target=run_results_rollup_job, daemon=True).start()
+    return jsonify({'success': True}), 202
+
+@api.route('/api/exchanges', methods=['GET'])
+def exchanges_status():
+    """Venue configurate, latenze misurate e richieste servite da ciascuna"""
+    return jsonify(ensure_python_types(get_exchange().stats()))
+
+@api.route('/api/memory-stats', methods=['GET'])
+def memory_stats():
+    return jsonify(ensure_python_types(get_memory_stats()))
+
+@api.route('/api/health', methods=['GET'])
+def health():
+    """Readiness: 200 solo quando il warmup del processo è completato"""
+    with _preload_lock:
+        status = dict(_preload_state)
+    return jsonify(status), 200 if status['ready'] else 503
+
+# Warmup e app factory
+_preload_state = {
+    'ready': False,
+    'started_at': None,
+    'finished_at': None,
+    'markets': 0,
+    'models': 0,
+    'candles': 0
+}
+_preload_lock = threading.Lock()
+
+def preload_state():
+    """
+    Carica mercati, modelli più usati e candele recenti prima di accettare
+    traffico, così la prima richiesta non paga il costo di inizializzazione.
+    """
+    with _preload_lock:
+        _preload_state['started_at'] = datetime.now().isoformat()
+
+    assets = fetch_market_assets()
+
+    models = 0
+    for symbol in assets[:PRELOAD_TOP_ASSETS]:
+        for type in ("bot1", "bot2"):
+            if load_cached_model(symbol, type, packed=True)[0] is not None:
+                models += 1
+    if MODEL_MODE == 'global' and get_global_model()[0] is not None:
+        models += 1
+
+    candles = 0
+    with ThreadPoolExecutor(max_workers=min(NUM_CORES, 8)) as executor:
+        for data in executor.map(fetch_market_data, assets[:PRELOAD_CANDLE_ASSETS]):
+            if data is not None:
+                candles += 1
+
+    with _preload_lock:
+        _preload_state.update({
+            'ready': True,
+            'finished_at': datetime.now().isoformat(),
+            'markets': len(assets),
+            'models': models,
+            'candles': candles
+        })
+    print(f"Preload completed: {len(assets)} markets, {models} models, {candles} candle sets")
+
+def create_app(preload=False):
+    """
+    App factory. In produzione (wsgi.py) viene chiamata con preload=True in
+    ogni worker, dopo il fork e prima di accettare connessioni.
+    """
+    os.makedirs('model_cache', exist_ok=True)
+
+    flask_app = Flask(__name__)
+    CORS(flask_app)  # Enable CORS for frontend communication
+    flask_app.register_blueprint(api)
+
+    if preload:
+        preload_state()
+    else:
+        with _preload_lock:
+            _preload_state['ready'] = True
+
+    return flask_app
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('DEBUG', 'True').lower() == 'true'
-    app.run(debug=debug, port=port)
\ No newline at end of file
+    print(f"System has {NUM_CORES} CPU cores, optimizing for parallelism")
+    create_app().run(debug=debug, port=port)
\ No newline at end of file
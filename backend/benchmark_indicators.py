@@ -0,0 +1,182 @@
+"""
+Benchmark e verifica dei backend dei kernel degli indicatori.
+
+Confronta i backend 'pandas', 'numpy' e 'numba' con le funzioni calculate_*
+di riferimento (fallisce con exit code 1 oltre la tolleranza), poi misura il
+tempo per indicatore su una singola serie e sui kernel applicati a una matrice
+di simboli x candele.
+
+Uso:  python benchmark_indicators.py [--rows 500] [--symbols 200] [--repeat 20]
+                                     [--backends pandas,numpy,numba]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import App
+
+# Indicatore -> colonne richieste al grafo (con i rispettivi intermedi)
+BENCHMARK_INDICATORS = {
+    'EMA_200': ['EMA_200'],
+    'MACD': ['MACD', 'Signal_Line'],
+    'RSI': ['RSI'],
+    'ATR': ['ATR'],
+    'ADX': ['ADX', 'PLUS_DI', 'MINUS_DI'],
+    'Stochastic': ['Stochastic_K', 'Stochastic_D'],
+    'Bollinger': ['BB_upper', 'BB_lower'],
+    'Volatility': ['Volatility'],
+    'OBV': ['OBV'],
+    'CMF': ['CMF']
+}
+
+
+def make_candles(rows, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, rows)))
+    spread = np.abs(rng.normal(0, 0.005, rows)) * close
+    return pd.DataFrame({
+        'timestamp': np.arange(rows, dtype=np.int64) * 3600_000,
+        'open': close * (1 + rng.normal(0, 0.002, rows)),
+        'high': close + spread,
+        'low': close - spread,
+        'close': close,
+        'volume': rng.lognormal(10, 1, rows)
+    })
+
+
+def reference_columns(data):
+    """Valori calcolati con le funzioni calculate_* originali."""
+    macd, signal = App.calculate_macd(data)
+    adx, plus_di, minus_di = App.calculate_directional_indicators(data)
+    upper, lower = App.calculate_bollinger_bands(data)
+    return {
+        'RSI': App.calculate_rsi(data),
+        'MACD': macd,
+        'Signal_Line': signal,
+        'ATR': App.calculate_atr(data),
+        'Volatility': App.calculate_volatility(data),
+        'ADX': adx,
+        'PLUS_DI': plus_di,
+        'MINUS_DI': minus_di,
+        'BB_upper': upper,
+        'BB_lower': lower,
+        'EMA_200': data['close'].ewm(span=200).mean(),
+        'OBV': (np.sign(data['close'].diff()) * data['volume']).fillna(0).cumsum()
+    }
+
+
+def max_relative_error(actual, expected):
+    actual, expected = np.asarray(actual, dtype=np.float64), np.asarray(expected, dtype=np.float64)
+    # Il True Range del grafo richiede la chiusura precedente: si confronta dove entrambi sono definiti
+    both = ~np.isnan(actual) & ~np.isnan(expected)
+    if not both.any():
+        return 0.0
+    return float(np.max(np.abs(actual[both] - expected[both]) / np.maximum(np.abs(expected[both]), 1e-12)))
+
+
+def verify(backend, data, tolerance):
+    App.set_indicator_backend(backend)
+    columns = sorted({c for cols in BENCHMARK_INDICATORS.values() for c in cols} | set(App.BOT2_INDICATOR_COLUMNS))
+    computed = App.compute_indicators(data.copy(), columns)
+    App.set_indicator_backend('pandas')
+    baseline = App.compute_indicators(data.copy(), columns)
+
+    errors = {name: max_relative_error(computed[name], values) for name, values in reference_columns(data).items()}
+    # Le colonne senza una funzione calculate_* si confrontano con il grafo su pandas
+    errors.update({c: max_relative_error(computed[c], baseline[c]) for c in columns if c not in errors})
+    failed = {name: error for name, error in errors.items() if error > tolerance}
+    return max(errors.values()), failed
+
+
+def time_call(function, repeat):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def benchmark_single(backend, data, repeat):
+    App.set_indicator_backend(backend)
+    return {name: time_call(lambda: App.compute_indicators(data.copy(), columns), repeat)
+            for name, columns in BENCHMARK_INDICATORS.items()}
+
+
+def benchmark_batch(backend, matrices, repeat):
+    """Kernel applicati a tutta la matrice (una riga per simbolo)."""
+    close, high, volume = matrices
+    if backend == 'pandas':
+        # Baseline: DataFrame candele x simboli, pandas lavora per colonna
+        close_df, high_df, volume_df = (pd.DataFrame(m.T) for m in matrices)
+        return {
+            'ewm_mean(span=50)': time_call(lambda: close_df.ewm(span=50).mean(), repeat),
+            'rolling max(14)': time_call(lambda: high_df.rolling(window=14).max(), repeat),
+            'rolling std(20)': time_call(lambda: close_df.rolling(window=20).std(), repeat),
+            'rolling sum(14)': time_call(lambda: volume_df.rolling(window=14).sum(), repeat),
+            'obv': time_call(lambda: (np.sign(close_df.diff()) * volume_df).fillna(0).cumsum(), repeat)
+        }
+    kernels = App.get_indicator_kernels(backend)
+    close_diff = np.diff(close, axis=1, prepend=np.nan)
+    return {
+        'ewm_mean(span=50)': time_call(lambda: kernels['ewm_mean'](close, 50), repeat),
+        'rolling max(14)': time_call(lambda: kernels['rolling'](high, 14, 'max'), repeat),
+        'rolling std(20)': time_call(lambda: kernels['rolling'](close, 20, 'std'), repeat),
+        'rolling sum(14)': time_call(lambda: kernels['rolling'](volume, 14, 'sum'), repeat),
+        'obv': time_call(lambda: kernels['obv'](close_diff, volume), repeat)
+    }
+
+
+def print_table(title, results, backends):
+    print(f"\n{title} (ms)")
+    names = list(next(iter(results.values())))
+    print(f"{'':22}" + ''.join(f"{b:>12}" for b in backends))
+    for name in names:
+        print(f"{name:22}" + ''.join(f"{results[b][name]:12.3f}" for b in backends))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--backends', default=','.join(App.INDICATOR_BACKENDS))
+    parser.add_argument('--tolerance', type=float, default=1e-8, help='Errore relativo massimo rispetto a calculate_*')
+    args = parser.parse_args()
+
+    backends = []
+    for backend in args.backends.split(','):
+        start = time.perf_counter()
+        if App.set_indicator_backend(backend) != backend:
+            print(f"Backend {backend} non disponibile, escluso")
+            continue
+        # Per Numba il primo calcolo include la compilazione (o il caricamento dalla cache)
+        App.compute_indicators(make_candles(50, 0), App.BOT2_INDICATOR_COLUMNS)
+        print(f"Backend {backend}: pronto in {time.perf_counter() - start:.2f}s")
+        backends.append(backend)
+
+    data = make_candles(args.rows, 1)
+    ok = True
+    for backend in backends:
+        worst, failed = verify(backend, data, args.tolerance)
+        print(f"Verifica {backend}: errore relativo massimo {worst:.2e}" + (f"  FALLITA {failed}" if failed else ""))
+        ok = ok and not failed
+
+    single = {backend: benchmark_single(backend, data, args.repeat) for backend in backends}
+    print_table(f"Serie singola, {args.rows} candele", single, backends)
+
+    frames = [make_candles(args.rows, seed) for seed in range(args.symbols)]
+    matrices = tuple(np.vstack([f[c].values for f in frames]) for c in ('close', 'high', 'volume'))
+    batch = {backend: benchmark_batch(backend, matrices, max(1, args.repeat // 4)) for backend in backends}
+    print_table(f"Batch, {args.symbols} simboli x {args.rows} candele", batch, backends)
+
+    App.set_indicator_backend(App.INDICATOR_BACKEND)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark dei tempi di avvio del backend.
+
+Importa App a freddo in processi separati, crea l'app e serve una richiesta
+che non richiede calcoli (/api/health). Fallisce con exit code 1 se la mediana
+supera il budget o se all'avvio vengono caricate dipendenze pesanti.
+
+Uso:  python benchmark_startup.py [--runs 5] [--budget 1.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET = float(os.getenv('IMPORT_TIME_BUDGET', 1.0))
+
+# Moduli che devono essere caricati solo al primo utilizzo del loro sottosistema
+LAZY_MODULES = ['sklearn', 'scipy', 'ccxt', 'textblob', 'nltk', 'joblib', 'requests', 'numba']
+
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import App
+imported = time.perf_counter()
+client = App.create_app().test_client()
+client.get('/api/health')
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'first_request': served - imported,
+    'loaded': [m for m in %r if m in sys.modules]
+}))
+""" % (LAZY_MODULES,)
+
+
+def run_once():
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD_CODE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=IMPORT_TIME_BUDGET)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    import_times = [r['import'] for r in results]
+    request_times = [r['first_request'] for r in results]
+    loaded = sorted({m for r in results for m in r['loaded']})
+
+    median_import = statistics.median(import_times)
+    print(f"Cold import:   median {median_import:.3f}s  max {max(import_times):.3f}s  (budget {args.budget:.3f}s)")
+    print(f"First request: median {statistics.median(request_times):.3f}s")
+    print(f"Lazy modules loaded at startup: {loaded or 'none'}")
+
+    failed = False
+    if median_import > args.budget:
+        print("FAIL: import time budget exceeded")
+        failed = True
+    if loaded:
+        print("FAIL: heavy dependencies imported at startup")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
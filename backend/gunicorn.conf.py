@@ -0,0 +1,31 @@
+"""
+Configurazione gunicorn per la modalità produzione.
+
+Avvio:  gunicorn -c gunicorn.conf.py
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# Worker a thread: le richieste sono in gran parte I/O (exchange, NewsAPI)
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+# Niente preload nel master: nessun fork dopo la creazione di thread o client.
+# Ogni worker esegue il proprio warmup in wsgi.py prima di accettare traffico.
+preload_app = False
+
+# Le scansioni complete e i backtest possono durare diversi minuti
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 600))
+graceful_timeout = 30
+keepalive = 5
+
+# Riavvio periodico dei worker per limitare la crescita della memoria
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,123 @@
+"""
+Test di carico di /api/market-analysis con N utenti concorrenti.
+
+Senza --url il backend viene avviato nello stesso processo con l'exchange di
+replay (EXCHANGE_ADAPTER=replay): nessuna chiamata a Binance e dati
+deterministici, con latenza e rate limit configurabili. Con --url il test
+viene eseguito contro un'istanza già avviata (es. gunicorn).
+
+Uso:  python load_test.py [--users 10] [--requests 3] [--top-assets 20]
+                          [--latency 0.05] [--rate-limit 20] [--venues replay-a,replay-b]
+                          [--url http://localhost:5000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def make_in_process_client(args):
+    # Le variabili vanno impostate prima dell'import di App (costanti di modulo)
+    os.environ['EXCHANGE_ADAPTER'] = 'replay'
+    os.environ['EXCHANGES'] = args.venues
+    os.environ['REPLAY_LATENCY'] = str(args.latency)
+    os.environ['REPLAY_RATE_LIMIT'] = str(args.rate_limit)
+    os.environ['REPLAY_SYMBOLS'] = str(max(args.top_assets, 1))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import App
+
+    app = App.create_app()
+    local = threading.local()
+
+    def post(payload, headers):
+        # Un test client per thread, come connessioni separate
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.post('/api/market-analysis', json=payload, headers=headers)
+        return response.status_code, response.get_json()
+
+    return post, App
+
+
+def make_http_client(args):
+    import requests
+    local = threading.local()
+
+    def post(payload, headers):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        response = local.session.post(f"{args.url.rstrip('/')}/api/market-analysis", json=payload,
+                                      headers=headers, timeout=args.timeout)
+        return response.status_code, response.json()
+
+    return post, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=3, help='Richieste per utente')
+    parser.add_argument('--top-assets', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05, help='Latenza simulata per richiesta (replay)')
+    parser.add_argument('--rate-limit', type=float, default=20, help='Richieste al secondo verso il replay')
+    parser.add_argument('--venues', default='replay', help='Venue di replay separate da virgola (es. replay-a,replay-b)')
+    parser.add_argument('--url', default=None, help='Backend remoto (default: in-process con replay)')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--allow-cache', action='store_true', help='Non bypassa la cache delle risposte')
+    args = parser.parse_args()
+
+    post, app_module = make_http_client(args) if args.url else make_in_process_client(args)
+    payload = {'top_assets': args.top_assets, 'quality_filter': False, 'time_budget': 0}
+    headers = {} if args.allow_cache else {'Cache-Control': 'no-cache'}
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def user():
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            try:
+                status, body = post(payload, headers)
+                ok = status == 200 and 'assets' in body
+            except Exception as e:
+                ok, status = False, str(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                (latencies if ok else errors).append(elapsed if ok else status)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user) for _ in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    total = args.users * args.requests
+    print(f"Users: {args.users}  requests: {total}  assets per scan: {args.top_assets}")
+    print(f"Wall time: {wall:.2f}s  throughput: {len(latencies) / wall:.2f} scans/s  "
+          f"({len(latencies) * args.top_assets / wall:.1f} assets/s)")
+    if latencies:
+        print(f"Latency: p50 {percentile(latencies, 50):.2f}s  p95 {percentile(latencies, 95):.2f}s  "
+              f"p99 {percentile(latencies, 99):.2f}s  mean {statistics.mean(latencies):.2f}s")
+    print(f"Errors: {len(errors)}" + (f" ({errors[:5]})" if errors else ""))
+    if app_module is not None:
+        stats = app_module.get_exchange().stats()
+        if 'requests' in stats:
+            print(f"Replay exchange: {stats['requests']} requests, {stats['throttled_seconds']:.2f}s spent waiting on rate limit")
+        else:
+            print(f"Exchange stats: {stats}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Nodi della scansione distribuita.
+
+Il broker espone la coda degli shard e le code dei risultati; i worker (anche
+su macchine diverse) prelevano gli shard e li analizzano. Il backend Flask fa
+da coordinatore quando SCAN_MODE=cluster o la richiesta contiene "distributed": true.
+
+Uso:  python scan_cluster.py broker [--address 127.0.0.1:50000]
+      python scan_cluster.py worker [--address 127.0.0.1:50000] [--processes 3]
+"""
+import argparse
+import multiprocessing
+
+import App
+
+
+def start_worker(address):
+    App.run_scan_worker(address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('role', choices=['broker', 'worker'])
+    parser.add_argument('--address', default=App.SCAN_CLUSTER_ADDRESS)
+    parser.add_argument('--processes', type=int, default=1, help='Processi worker su questo nodo')
+    args = parser.parse_args()
+
+    if args.role == 'broker':
+        App.run_scan_broker(args.address)
+        return
+
+    if args.processes == 1:
+        start_worker(args.address)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=start_worker, args=(args.address,)) for _ in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == '__main__':
+    main()
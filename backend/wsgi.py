@@ -0,0 +1,9 @@
+"""
+Entry point WSGI per la modalità produzione.
+
+Ogni worker gunicorn importa questo modulo dopo il fork (preload_app = False),
+esegue il warmup (mercati, modelli, candele) e solo dopo accetta connessioni.
+"""
+from App import create_app
+
+app = create_app(preload=True)
@@ -179,6 +179,7 @@ function MarketScanner() {
   const [sortBy, setSortBy] = useState('forecastChange');
   const [sortDirection, setSortDirection] = useState('desc');
   const [stats, setStats] = useState({ positive: 0, negative: 0, highQuality: 0 });
+  const [progress, setProgress] = useState(null); // Avanzamento della scansione in streaming
   const [forecastThreshold, setForecastThreshold] = useState('balanced'); // default a balanced
   const animationRef = useRef(null);
   const splineLogoRef = useRef(null);
@@ -322,34 +323,75 @@ const handleCrossValidation = async () => {
     setShowSpline(true); // Show sphere during loading
     setResults(null); // Reset results when starting new analysis
     setError(null); // Reset any previous errors
+    setProgress(null);
+    
+    // Abort long-running requests
+    const controller = new AbortController();
+    const timeoutId = setTimeout(() => controller.abort(), 200000); // 200 seconds
     
     try {
       // Set a reasonable max value to avoid timeouts
       const assetsToAnalyze = Math.min(topAssets, 200);
       
-      const response = await axios.post(API_URL, {
-        top_assets: assetsToAnalyze,
-        forecast_threshold: getThresholdValue(forecastThreshold), // valore dinamico
-        include_negative: includeNegative,
-        quality_filter: useQualityFilter // Nuovo parametro per i filtri di qualità
-      }, {
-        // Add timeout to prevent long-running requests
-        timeout: 200000, // 200 seconds
+      // Risposta in streaming (NDJSON): gli asset arrivano appena sono pronti
+      const response = await fetch(API_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          top_assets: assetsToAnalyze,
+          forecast_threshold: getThresholdValue(forecastThreshold), // valore dinamico
+          include_negative: includeNegative,
+          quality_filter: useQualityFilter, // Nuovo parametro per i filtri di qualità
+          stream: 'ndjson'
+        }),
+        signal: controller.signal
       });
       
-      if (response.data && response.data.assets) {
-        setResults(response.data.assets);
-        if (response.data.stats) {
-          setStats(response.data.stats);
+      if (!response.ok) {
+        const httpError = new Error(`HTTP ${response.status}`);
+        httpError.response = { status: response.status };
+        throw httpError;
+      }
+      
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let receivedStats = false;
+      setResults([]);
+      
+      const handleEvent = (event) => {
+        if (event.type === 'asset') {
+          setResults(prev => [...(prev || []), event.asset]);
+        } else if (event.type === 'start') {
+          setProgress({ processed: 0, total: event.total });
+        } else if (event.type === 'progress') {
+          setProgress({ processed: event.processed, total: event.total });
+        } else if (event.type === 'stats') {
+          setStats(event.stats);
+          receivedStats = true;
         }
-      } else {
+      };
+      
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+      }
+      if (buffer.trim()) {
+        handleEvent(JSON.parse(buffer));
+      }
+      
+      if (!receivedStats) {
         throw new Error('Invalid response format');
       }
     } catch (error) {
       console.error('Error analyzing market:', error);
       
       // More specific error messages
-      if (error.code === 'ECONNABORTED') {
+      if (error.name === 'AbortError') {
         setError('La richiesta è scaduta. Prova con meno asset.');
       } else if (error.response && error.response.status === 500) {
         setError('Errore del server. Il backend potrebbe essere sovraccarico. Prova con meno asset.');
@@ -357,8 +399,9 @@ const handleCrossValidation = async () => {
         setError('Errore nell\'analisi del mercato. Riprova con meno asset o controlla la connessione.');
       }
       
-      setResults([]); // Set empty array in case of error
+      setResults(prev => prev || []); // Keep partial results in case of error
     } finally {
+      clearTimeout(timeoutId);
       setLoading(false);
     }
   };
@@ -721,7 +764,7 @@ const handleCrossValidation = async () => {
                 px: 2
               }}
             >
-              Analizzando i Dati di Mercato...
+              Analizzando i Dati di Mercato...{progress ? ` (${progress.processed}/${progress.total})` : ''}
             </Typography>
           )}
         </SplineContainer>
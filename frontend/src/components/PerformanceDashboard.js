@@ -1,5 +1,6 @@
 // Components/PerformanceDashboard.js
-import React from 'react';
+import React, { useEffect, useState } from 'react';
+import axios from 'axios';
 import { 
   Box, Typography, Paper, Grid, Divider,
   LinearProgress, styled
@@ -9,6 +10,8 @@ import {
   Timeline, ShowChart 
 } from '@mui/icons-material';
 
+const API_URL = `${process.env.REACT_APP_API_URL}/performance`;
+
 // Styled components
 const StyledMetricBox = styled(Paper)(({ theme }) => ({
   backgroundColor: '#1A1A1A',
@@ -25,13 +28,28 @@ const StyledMetricBox = styled(Paper)(({ theme }) => ({
 }));
 
 const PerformanceDashboard = ({ 
-  forecastAccuracy = 68.5, 
-  trades = { positive: 12, negative: 5, neutral: 3 },
+  forecastAccuracy: defaultAccuracy = 68.5, 
+  trades: defaultTrades = { positive: 12, negative: 5, neutral: 3 },
   riskRatio = 2.1,
   patterns = { doji: 3, hammer: 2, engulfing: 4 }
 }) => {
+  // Dati reali dai rollup dell'archivio dei risultati (se disponibili)
+  const [performance, setPerformance] = useState(null);
+
+  useEffect(() => {
+    axios.get(API_URL)
+      .then((response) => {
+        if (response.data && response.data.available && response.data.summary.resolved > 0) {
+          setPerformance(response.data.dashboard);
+        }
+      })
+      .catch((error) => console.error("Errore nel caricamento delle performance:", error));
+  }, []);
+
+  const forecastAccuracy = performance?.forecastAccuracy ?? defaultAccuracy;
+  const trades = performance?.trades ?? defaultTrades;
   const totalTrades = trades.positive + trades.negative + trades.neutral;
-  const successRate = (trades.positive / totalTrades) * 100;
+  const successRate = totalTrades > 0 ? (trades.positive / totalTrades) * 100 : 0;
   
   return (
     <Box sx={{ mb: 4 }}>
@@ -591,6 +591,7 @@ const fetchHistoricalData = async (symbol) => {
         total_budget: budgetToUse,
         forecast_days: daysToUse,
         news_articles_limit: newsToUse,
+        risk_profile: riskSettings || null,
       }, {
         // Add timeout to prevent long-running requests
         timeout: 60000, // 60 seconds